@@ -1,63 +1,148 @@
-from matplotlib.dates import DateFormatter
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
-import MetaTrader5 as mt5
+import bar_cache
 import constants
 import keys
+import position_book
+import rates
+import resampler
+import results
+import signals
+import tick_store
 import strategy
 import numpy as np
+import heapq
+import itertools
+import os
 import random
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 class MT5Connection:
-    def __init__(self, account, password, server):
+    def __init__(self, account, password, server, base_time_frame=None):
         self.account = account
         self.password = password
         self.server = server
+        # with a base timeframe every other one is resampled from its cached bars instead of downloaded
+        self.base_time_frame = base_time_frame
+        # the MetaTrader5 package is only loaded by code that talks to the terminal, not by backtest workers
+        import MetaTrader5
+        self.mt5 = MetaTrader5
+        self.bar_store = bar_cache.BarStore(constants.bar_cache_dir, self.mt5.copy_rates_range)
 
     def connect(self):
-        if not mt5.initialize(login=self.account, password=self.password, server=self.server):
-            print("initialize() failed, error code =", mt5.last_error())
+        if not self.mt5.initialize(login=self.account, password=self.password, server=self.server):
+            print("initialize() failed, error code =", self.mt5.last_error())
             sys.exit()
 
-        authorized = mt5.login(self.account, password=self.password, server=self.server)
+        authorized = self.mt5.login(self.account, password=self.password, server=self.server)
 
         if authorized:
             print("connected: connecting to mt5 client")
         else:
-            print(f'failed to connect to account {self.account}, error code: {mt5.last_error()}')
+            print(f'failed to connect to account {self.account}, error code: {self.mt5.last_error()}')
 
     def disconnect(self):
-        mt5.shutdown()
+        self.mt5.shutdown()
         print("Disconnecting from MT5 Client")
 
     def get_historical_data(self, pair, time_frame, start_date, end_date):
         utc_from = start_date
         utc_to = end_date
-        rates = mt5.copy_rates_range(pair, time_frame, utc_from, utc_to)
+        if self.base_time_frame and time_frame != self.base_time_frame:
+            base_rates = self.bar_store.copy_rates_range(pair, self.base_time_frame, utc_from, utc_to)
+            rates = resampler.resample(base_rates, time_frame, self.base_time_frame)
+        else:
+            rates = self.bar_store.copy_rates_range(pair, time_frame, utc_from, utc_to)
         rates_frame = pd.DataFrame(rates)
         rates_frame['time'] = pd.to_datetime(rates_frame['time'], unit='s')
         return rates_frame
 
 
+class IntrabarFills:
+    # finds the first bar whose range reaches a long position's stop loss or take profit and the price it fills at
+    def __init__(self, open, high, low, times_msc, bar_msc, priority='stop', ticks=None, symbol=None):
+        self.open = open
+        self.high = high
+        self.low = low
+        self.times_msc = times_msc
+        self.bar_msc = bar_msc
+        self.priority = priority
+        self.ticks = ticks
+        self.symbol = symbol
+
+    def first_exit(self, start, end, stop_level, target_level):
+        stop_hit = self.low[start:end + 1] <= stop_level
+        target_hit = self.high[start:end + 1] >= target_level
+        hit = stop_hit | target_hit
+        if not hit.any():
+            return None
+        k = int(np.argmax(hit))
+        bar = start + k
+
+        if self.ticks is not None:
+            fill = self.tick_fill(bar, stop_level, target_level)
+            if fill is not None:
+                return bar, fill
+
+        # both levels inside one bar - which came first is unknown, so the configured side wins
+        if stop_hit[k] and target_hit[k]:
+            stopped = self.priority == 'stop'
+        else:
+            stopped = bool(stop_hit[k])
+
+        # a bar that opens beyond the level fills at the open
+        if stopped:
+            return bar, min(stop_level, self.open[bar])
+        return bar, max(target_level, self.open[bar])
+
+    def tick_fill(self, bar, stop_level, target_level):
+        # first tick inside the bar that crossed either level
+        _, bids = self.ticks.ticks_between(self.symbol, self.times_msc[bar], self.times_msc[bar] + self.bar_msc)
+        crossed = (bids <= stop_level) | (bids >= target_level)
+        if not crossed.any():
+            return None
+        return float(bids[np.argmax(crossed)])
+
+
 class Backtester:
     @staticmethod
-    def calc_position_size(symbol, strategy):
-        account = mt5.account_info()
-        balance = float(account.balance)
-        pip_value = constants.get_pip_value(symbol, strategy['account_currency'])
+    def calc_position_size(symbol, strategy, balance=None, timestamp=None, rate_provider=None):
+        # backtests pass in the simulated balance, otherwise the account balance is used
+        if balance is None:
+            import MetaTrader5 as mt5
+            account = mt5.account_info()
+            balance = float(account.balance)
+        pip_value = constants.get_pip_value(symbol, strategy['account_currency'], timestamp, rate_provider)
+        return Backtester.calc_lot_size(balance, pip_value, strategy)
+
+    @staticmethod
+    def calc_lot_size(balance, pip_value, strategy):
         lot_size = (float(balance) * (float(strategy["risk"]) / 100)) / (pip_value * strategy["stopLoss"])
         lot_size = round(lot_size, 2)
         return lot_size
 
     @staticmethod
-    def simulate_trades(pair, data, strategy):
-        positions = []
+    def max_drawdown(equity_curve):
+        # largest fall from a previous peak, as a fraction of that peak
+        if len(equity_curve) == 0:
+            return 0.0
+        peaks = np.maximum.accumulate(equity_curve)
+        return float(np.max((peaks - equity_curve) / peaks))
+
+    @staticmethod
+    def simulate_trades(pair, data, strategy, rate_provider=None, return_trades=False):
+        book = position_book.PositionBook()
+        compiled = signals.compile_strategy(strategy)
         balance = strategy['initialBalance']
-        equity_curve = []
-        equity_curve_timestamps = []
-        actual_price = []
+        equity_curve = np.empty(len(data))
+        equity_curve_timestamps = np.empty(len(data), dtype='datetime64[ns]')
+        actual_price = np.empty(len(data))
+        count = 0
+        # fillMode "ohlc" fills stop loss and take profit inside each bar's range, as the vectorized engine does -
+        # this loop has no stored ticks, so "tick" fills from the range too
+        intrabar = strategy.get('fillMode', 'close') != 'close'
+        intrabar_priority = strategy.get('intrabarPriority', 'stop')
 
         for i, row in data.iterrows():
             close_price = row['close']
@@ -68,20 +153,31 @@ class Backtester:
 
             if open_time.time() < trading_start_time or open_time.time() > trading_end_time:
                 continue  # Skip if outside trading hours
+
+            # positions opened on earlier bars that reached a level inside this one, before anything at its close.
+            # An entry on this bar is still sized from the balance before it
+            sizing_balance = balance
+            if intrabar and len(book):
+                hit, fill_prices = book.intrabar_fills(row['open'], row['high'], row['low'], intrabar_priority)
+                if hit.any():
+                    sizes = book.size[hit]
+                    fills = fill_prices[hit]
+                    profits = book.close(hit, fill_prices, open_time)
+                    for size, fill_price, equity_change in zip(sizes, fills, profits):
+                        print(f"{open_time} - SELL - {size} lots at {fill_price}. P/L: {equity_change}")
+                    balance += float(profits.sum())
             
-            # calculate the averages for ema and sma
-            moving_averages = strategy['movingAverages']
-            
-            ema_func = constants.movingAveragesFunctions['EMA']
-            ema_val = ema_func(data[:i+1]['close'], moving_averages['EMA']['val']).iloc[-1]
-            
-            sma_func = constants.movingAveragesFunctions['SMA']
-            sma_val = sma_func(data[:i+1]['close'], moving_averages['SMA']['val']).iloc[-1]
+            # calculate the strategy's averages over the bars so far
+            ma_values = {
+                key: constants.movingAveragesFunctions[spec['function']](data[:i+1]['close'], spec['val']).iloc[-1]
+                for key, spec in compiled.indicators.items()
+            }
+            entry_signal, exit_signal = compiled.latest(row, ma_values)
             
             # If condition met, simulate opening a position
             
-            if (close_price > ema_val) and (close_price < sma_val):
-                lot_size = Backtester.calc_position_size(pair, strategy)
+            if entry_signal:
+                lot_size = Backtester.calc_position_size(pair, strategy, sizing_balance, open_time, rate_provider)
                 order_type = "BUY"
                 price = close_price
                 take_profit_distance = float(strategy['takeProfit'])
@@ -97,109 +193,362 @@ class Backtester:
                     continue
 
                 # Simulate opening position
-                positions.append({
-                    'open_time': open_time,
-                    'symbol': pair,
-                    'order_type': order_type,
-                    'size': lot_size,
-                    'entry_price': price,
-                    'take_profit_distance': take_profit_distance,
-                    'stop_loss_distance': stop_loss_distance,
-                })
+                book.open(price, lot_size, price - stop_loss_distance, price + take_profit_distance, open_time, position_book.BUY)
 
                 print(f"{open_time} - BUY - {lot_size} lots at {price}")
 
             # Simulate closing positions and update equity
-            new_positions = []
-            for position in positions:
-                
-                slippage_enabled = strategy.get('slippage_enabled', False)
-                slippage_probability = strategy.get('slippage_probability', 0.1)
-                slippage_ticks = random.randint(1, 3)
-
-                if slippage_enabled and random.random() < slippage_probability:
+            slippage_enabled = strategy.get('slippage_enabled', False)
+            slippage_probability = strategy.get('slippage_probability', 0.1)
+            if slippage_enabled and len(book):
+                # a position that slips is dropped without a fill, one draw per open position in order
+                draws = [(random.randint(1, 3), random.random()) for _ in range(len(book))]
+                slipped = np.array([chance < slippage_probability for _, chance in draws])
+                for slippage_ticks, _ in (draws[k] for k in np.flatnonzero(slipped)):
                     print(f"{open_time} - Slippage occurred on closing. Skipping {slippage_ticks} ticks.")
-                    continue
-                
-                if (close_price < ema_val and close_price > sma_val) or (close_price <= position['entry_price'] - position['stop_loss_distance']) or (close_price >= position['entry_price'] + position['take_profit_distance']):
-                    equity_change = (close_price - position['entry_price']) * position['size']
-                    balance += equity_change
-                    print(f"{open_time} - SELL - {position['size']} lots at {close_price}. P/L: {equity_change}")
-                else:
-                    new_positions.append(position)
-            positions = new_positions
+                book.discard(slipped)
+
+            closing = book.hits(close_price) | exit_signal
+            sizes = book.size[closing]
+            profits = book.close(closing, close_price, open_time)
+            for size, equity_change in zip(sizes, profits):
+                print(f"{open_time} - SELL - {size} lots at {close_price}. P/L: {equity_change}")
+            balance += float(profits.sum())
 
             # Update equity for open positions
-            for position in positions:
-                equity_change = (close_price - position['entry_price']) * position['size']
-                balance += equity_change
+            balance += book.mark(close_price)
 
             # Append the updated equity to the equity curve
-            equity_curve.append(balance)
-            equity_curve_timestamps.append(open_time)
-            actual_price.append(close_price)
+            equity_curve[count] = balance
+            equity_curve_timestamps[count] = open_time
+            actual_price[count] = close_price
+            count += 1
+
+        equity_curve = equity_curve[:count]
+        equity_curve_timestamps = equity_curve_timestamps[:count]
+        actual_price = actual_price[:count]
+
+        if return_trades:
+            if count:
+                book.record_open(actual_price[-1], equity_curve_timestamps[-1])
+            return equity_curve_timestamps, equity_curve, actual_price, book.ledger.to_frame()
+        return equity_curve_timestamps, equity_curve, actual_price
 
-        # Convert lists to NumPy arrays
-        equity_curve = np.array(equity_curve)
-        equity_curve_timestamps = np.array(equity_curve_timestamps)
-        actual_price = np.array(actual_price)
+    @staticmethod
+    def calc_indicators(close, strategy):
+        # calculate every distinct moving average in the strategy once over the whole close array
+        return signals.compile_strategy(strategy).calc_indicators(close)
 
-        return equity_curve_timestamps, equity_curve, actual_price
+    @staticmethod
+    def trading_hours_mask(times):
+        # same trading window as simulate_trades - 00:01:00 till 23:59:00 inclusive
+        times = np.asarray(times, dtype='datetime64[ns]')
+        time_of_day = (times - times.astype('datetime64[D]')).astype(np.int64)
+        minute = 60 * 10**9
+        return (time_of_day >= minute) & (time_of_day <= (23 * 60 + 59) * minute)
 
     @staticmethod
-    def plot_backtest_equity_curves(pairs, equity_data):
-        fig, ax1 = plt.subplots(figsize=(10, 6))
+    def generate_signals(columns, indicators, strategy):
+        # the strategy's compiled entry and exit rules over the whole history, the same ones the trader
+        # evaluates on the latest bar
+        return signals.compile_strategy(strategy).signals(columns, indicators)
+
+    @staticmethod
+    def find_exits(close, entry_idx, exits, take_profit_distance, stop_loss_distance, intrabar=None):
+        # index of the bar each position is closed on and the price it is closed at,
+        # positions never closed are held till the last bar
+        last = len(close) - 1
+        exit_idx = np.full(len(entry_idx), last)
+        closed = np.zeros(len(entry_idx), dtype=bool)
+        exit_signals = np.flatnonzero(exits)
+        next_signal = np.searchsorted(exit_signals, entry_idx)
+        exit_price = close[exit_idx].copy()
+
+        for n, i in enumerate(entry_idx):
+            if next_signal[n] < len(exit_signals):
+                exit_idx[n] = exit_signals[next_signal[n]]
+                exit_price[n] = close[exit_idx[n]]
+                closed[n] = True
+            # only the bars up to the next exit signal need to be checked for stop loss or take profit
+            entry_price = close[i]
+            stop_level = entry_price - stop_loss_distance
+            target_level = entry_price + take_profit_distance
+            if intrabar is None:
+                window = close[i:exit_idx[n] + 1]
+                hit = (window <= stop_level) | (window >= target_level)
+                if hit.any():
+                    exit_idx[n] = i + np.argmax(hit)
+                    exit_price[n] = close[exit_idx[n]]
+                    closed[n] = True
+            else:
+                # the entry bar's range happened before the position opened at its close
+                hit = intrabar.first_exit(i + 1, exit_idx[n], stop_level, target_level)
+                if hit is not None:
+                    exit_idx[n], exit_price[n] = hit
+                    closed[n] = True
+
+        return exit_idx, closed, exit_price
+
+    @staticmethod
+    def calc_sizes(close, entry_idx, exit_idx, exit_price, pip_values, strategy):
+        # each position is sized from the simulated balance before its entry bar, which only depends on
+        # earlier positions - walk the entries in order, adding up the bars in between in one step each
+        running_close = np.concatenate(([0.0], np.cumsum(close)))
+        pip_values = np.broadcast_to(np.asarray(pip_values, dtype=float), close.shape)
+        sizes = np.zeros(len(entry_idx))
+        balance = float(strategy['initialBalance'])
+        open_size = 0.0
+        open_cost = 0.0
+        leaving = []
+        t = 0
+
+        for n, i in enumerate(entry_idx):
+            while True:
+                while leaving and leaving[0][0] <= t:
+                    _, size, cost, fill_adjustment = heapq.heappop(leaving)
+                    open_size -= size
+                    open_cost -= cost
+                    balance += fill_adjustment
+                if t >= i:
+                    break
+                next_t = min(i, leaving[0][0]) if leaving else i
+                balance += open_size * (running_close[next_t] - running_close[t]) - open_cost * (next_t - t)
+                t = next_t
+
+            sizes[n] = Backtester.calc_lot_size(balance, pip_values[i], strategy)
+            open_size += sizes[n]
+            open_cost += sizes[n] * close[i]
+            fill_adjustment = sizes[n] * (exit_price[n] - close[exit_idx[n]])
+            heapq.heappush(leaving, (exit_idx[n] + 1, sizes[n], sizes[n] * close[i], fill_adjustment))
+
+        return sizes
+
+    @staticmethod
+    def simulate_positions(close, entries, exits, strategy, pip_values, intrabar=None):
+        # position-state pass over precomputed signal arrays
+        n = len(close)
+        entry_idx = np.flatnonzero(entries)
+        exit_idx, closed, exit_price = Backtester.find_exits(close, entry_idx, exits, float(strategy['takeProfit']), float(strategy['stopLoss']), intrabar)
+        sizes = Backtester.calc_sizes(close, entry_idx, exit_idx, exit_price, pip_values, strategy)
+        entry_price = close[entry_idx]
+
+        # a position adds (close - entry) * size to the balance on every bar from its entry till its exit,
+        # so the equity curve is the running sum of close * open size - open cost, with the exit bar
+        # corrected when the position was filled inside the bar rather than at its close
+        open_size = np.zeros(n + 1)
+        open_cost = np.zeros(n + 1)
+        fill_adjustment = np.zeros(n)
+        np.add.at(open_size, entry_idx, sizes)
+        np.add.at(open_size, exit_idx + 1, -sizes)
+        np.add.at(open_cost, entry_idx, sizes * entry_price)
+        np.add.at(open_cost, exit_idx + 1, -sizes * entry_price)
+        np.add.at(fill_adjustment, exit_idx, sizes * (exit_price - close[exit_idx]))
+        equity = strategy['initialBalance'] + np.cumsum(close * np.cumsum(open_size[:n]) - np.cumsum(open_cost[:n]) + fill_adjustment)
+
+        trades = {
+            'entry_idx': entry_idx,
+            'exit_idx': exit_idx,
+            'closed': closed,
+            'size': sizes,
+            'entry_price': entry_price,
+            'exit_price': exit_price,
+        }
+        return equity, trades
+
+    @staticmethod
+    def calc_pip_values(pair, times, entries, strategy, rate_provider=None):
+        # pip values are only looked up for bars that open a position
+        pip_values = np.ones(len(times))
+        if entries.any():
+            if rate_provider is None:
+                pip_values[entries] = constants.get_pip_value(pair, strategy['account_currency'])
+            else:
+                pip_values[entries] = rate_provider.pip_values(pair, strategy['account_currency'], times[entries])
+        return pip_values
+
+    @staticmethod
+    def intrabar_fills(pair, data, mask, strategy, tick_store=None):
+        # fillMode "close" checks stop loss and take profit on closes only, "ohlc" inside each bar's range
+        # and "tick" goes down to stored ticks for the bars whose range touched a level
+        fill_mode = strategy.get('fillMode', 'close')
+        if fill_mode == 'close':
+            return None
+        ticks = tick_store if fill_mode == 'tick' and tick_store is not None and tick_store.has(pair) else None
+        bar_seconds = np.diff(data['time'].to_numpy(dtype='datetime64[s]').astype(np.int64))
+        return IntrabarFills(
+            data['open'].to_numpy(dtype=float)[mask],
+            data['high'].to_numpy(dtype=float)[mask],
+            data['low'].to_numpy(dtype=float)[mask],
+            data['time'].to_numpy(dtype='datetime64[ms]').astype(np.int64)[mask],
+            int(np.min(bar_seconds)) * 1000 if len(bar_seconds) else 0,
+            strategy.get('intrabarPriority', 'stop'),
+            ticks,
+            pair,
+        )
+
+    @staticmethod
+    def simulate_trades_vectorized(pair, data, strategy, rate_provider=None, tick_store=None, return_trades=False):
+        # slippage is drawn randomly per bar and position, so only the loop can reproduce it
+        if strategy.get('slippage_enabled', False):
+            return Backtester.simulate_trades(pair, data, strategy, rate_provider, return_trades)
+
+        close = data['close'].to_numpy(dtype=float)
+        times = data['time'].to_numpy(dtype='datetime64[ns]')
+
+        # indicators use every bar, bars outside trading hours are then dropped
+        indicators = Backtester.calc_indicators(close, strategy)
+        entries, exits = Backtester.generate_signals(signals.price_columns(data), indicators, strategy)
+        mask = Backtester.trading_hours_mask(times)
+        intrabar = Backtester.intrabar_fills(pair, data, mask, strategy, tick_store)
+        close, times, entries, exits = close[mask], times[mask], entries[mask], exits[mask]
+
+        pip_values = Backtester.calc_pip_values(pair, times, entries, strategy, rate_provider)
+        equity_curve, trades = Backtester.simulate_positions(close, entries, exits, strategy, pip_values, intrabar)
+        print(f"{pair} - {len(trades['entry_idx'])} positions opened, {int(trades['closed'].sum())} closed")
 
-        for pair, equity_curve_data in zip(pairs, equity_data):
-            timestamps = equity_curve_data['timestamps']
-            equity_curve = equity_curve_data['equity']
-            actual_price = equity_curve_data['actual_price']
+        if return_trades:
+            return times, equity_curve, close, results.trade_ledger(times, trades)
+        return times, equity_curve, close
 
-            # Ensure lengths are consistent
-            if len(timestamps) != len(equity_curve):
-                print(f"Error: Length mismatch for {pair}. Skipping...")
+    @staticmethod
+    def pair_signals(data, strategy, tick_store=None):
+        # per pair work for the portfolio backtest - signals and the exit bar of every candidate entry
+        close = data['close'].to_numpy(dtype=float)
+        times = data['time'].to_numpy(dtype='datetime64[ns]')
+        indicators = Backtester.calc_indicators(close, strategy)
+        entries, exits = Backtester.generate_signals(signals.price_columns(data), indicators, strategy)
+        mask = Backtester.trading_hours_mask(times)
+        intrabar = Backtester.intrabar_fills(data.attrs.get('pair'), data, mask, strategy, tick_store)
+        close, times, entries, exits = close[mask], times[mask], entries[mask], exits[mask]
+
+        entry_idx = np.flatnonzero(entries)
+        exit_idx, closed, exit_price = Backtester.find_exits(close, entry_idx, exits, float(strategy['takeProfit']), float(strategy['stopLoss']), intrabar)
+        return {'times': times, 'close': close, 'entry_idx': entry_idx, 'exit_idx': exit_idx, 'closed': closed, 'exit_price': exit_price}
+
+    @staticmethod
+    def pair_equity(close, entry_idx, exit_idx, closed, exit_price, values):
+        # profit and loss of a pair over its own bars - floating while open, realized from the exit bar on.
+        # values are each position's account currency per unit of price move
+        n = len(close)
+        entry_price = close[entry_idx]
+        open_end = np.where(closed, exit_idx, n)
+        open_size = np.zeros(n + 1)
+        open_cost = np.zeros(n + 1)
+        realized = np.zeros(n + 1)
+        np.add.at(open_size, entry_idx, values)
+        np.add.at(open_size, open_end, -values)
+        np.add.at(open_cost, entry_idx, values * entry_price)
+        np.add.at(open_cost, open_end, -values * entry_price)
+        np.add.at(realized, open_end, np.where(closed, values * (exit_price - entry_price), 0.0))
+        return close * np.cumsum(open_size[:n]) - np.cumsum(open_cost[:n]) + np.cumsum(realized[:n])
+
+    @staticmethod
+    def simulate_portfolio(pairs, signals, strategy, rate_provider=None):
+        # single pass over every pair's entries in time order against one balance and margin pool. Profit and
+        # margin are both taken to the account currency with the pip value the position was sized with, so
+        # a stop loss costs the risk share of the balance and the margin compares with the balance
+        leverage = float(strategy.get('leverage', 30))
+        balance = float(strategy['initialBalance'])
+        used_margin = 0.0
+        sizes = {pair: np.zeros(len(signals[pair]['entry_idx'])) for pair in pairs}
+        # account currency per unit of price move of each position
+        values = {pair: np.zeros(len(signals[pair]['entry_idx'])) for pair in pairs}
+
+        candidates = []
+        for pair_order, pair in enumerate(pairs):
+            pair_signal = signals[pair]
+            for n, i in enumerate(pair_signal['entry_idx']):
+                candidates.append((pair_signal['times'][i], pair_order, n))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+
+        open_positions = []
+        for entry_time, pair_order, n in candidates:
+            pair = pairs[pair_order]
+            pair_signal = signals[pair]
+
+            # release the margin and realize the profit of anything that closed before this entry
+            while open_positions and open_positions[0][:2] < (entry_time, pair_order):
+                _, _, profit, margin = heapq.heappop(open_positions)
+                balance += profit
+                used_margin -= margin
+
+            i, j = pair_signal['entry_idx'][n], pair_signal['exit_idx'][n]
+            entry_price = pair_signal['close'][i]
+            pip_value = constants.get_pip_value(pair, strategy['account_currency'], entry_time, rate_provider)
+            lot_size = Backtester.calc_lot_size(balance, pip_value, strategy)
+            # a lot here is the amount whose profit is its price move times the pip value, so the pip value
+            # is also what one lot is worth in the account currency
+            margin = lot_size * pip_value / leverage
+            if lot_size <= 0 or used_margin + margin > balance:
                 continue
-            
-            # Plot equity curve on the primary y-axis (left)
-            ax1.plot(timestamps, equity_curve, label=f'Equity Curve - {pair}', color='blue')
 
-        ax1.set_xlabel('Time')
-        ax1.set_ylabel('Equity (in Account Currency)', color='blue')  # Primary y-axis label
-        ax1.tick_params('y', colors='blue')  # Color of tick labels on primary y-axis
+            sizes[pair][n] = lot_size
+            values[pair][n] = lot_size * pip_value
+            used_margin += margin
+            if pair_signal['closed'][n]:
+                profit = (pair_signal['exit_price'][n] - entry_price) * values[pair][n]
+                heapq.heappush(open_positions, (pair_signal['times'][j], pair_order, profit, margin))
+
+        # equity of each pair on its own bars, then forward filled onto the merged timeline
+        all_times = np.unique(np.concatenate([signals[pair]['times'] for pair in pairs]))
+        equity_curve = np.full(len(all_times), float(strategy['initialBalance']))
+        pair_equity = dict()
+        for pair in pairs:
+            pair_signal = signals[pair]
+            pair_profit = Backtester.pair_equity(pair_signal['close'], pair_signal['entry_idx'], pair_signal['exit_idx'], pair_signal['closed'], pair_signal['exit_price'], values[pair])
+            pair_equity[pair] = float(strategy['initialBalance']) + pair_profit
+            last_bar = np.searchsorted(pair_signal['times'], all_times, side='right') - 1
+            equity_curve += np.where(last_bar >= 0, pair_profit[np.maximum(last_bar, 0)], 0.0)
+
+        trades = {pair: int(np.count_nonzero(sizes[pair])) for pair in pairs}
+        return all_times, equity_curve, pair_equity, trades
 
-        # Formatting timestamp labels
-        date_format = DateFormatter('%d %b %H:%M')
-        ax1.xaxis.set_major_formatter(date_format)
+    @staticmethod
+    def backtest_portfolio(strategy, time_frame, start_date, end_date, pairs, mt5_connection, rate_provider=None, tick_store=None, processes=None):
+        pair_data = [mt5_connection.get_historical_data(pair, time_frame, start_date, end_date) for pair in pairs]
+        for pair, data in zip(pairs, pair_data):
+            data.attrs['pair'] = pair
 
-        # Create a secondary y-axis (right) for actual price
-        ax2 = ax1.twinx()
-        ax2.plot(timestamps, actual_price, label=f'Actual Price - {pair}', color='green')
-        ax2.set_ylabel('Actual Price', color='green')  # Secondary y-axis label
-        ax2.tick_params('y', colors='green')  # Color of tick labels on secondary y-axis
+        # signal generation is independent per pair so it runs on every core
+        with ProcessPoolExecutor(processes) as pool:
+            signals = dict(zip(pairs, pool.map(Backtester.pair_signals, pair_data, itertools.repeat(strategy), itertools.repeat(tick_store))))
 
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
+        times, equity_curve, pair_equity, trades = Backtester.simulate_portfolio(pairs, signals, strategy, rate_provider)
+        print(f"Portfolio - {sum(trades.values())} positions opened, final equity {equity_curve[-1]:.2f}")
 
-        # Customize grid for more detail
-        ax1.grid(True, linestyle='--', alpha=0.5)
-        ax1.minorticks_on()
-        ax1.grid(which='minor', linestyle=':', linewidth='0.5', alpha=0.5)
+        equity_data = [{'pair': 'Portfolio', 'timestamps': times, 'equity': equity_curve, 'actual_price': np.full(len(times), np.nan)}]
+        for pair in pairs:
+            equity_data.append({'pair': pair, 'timestamps': signals[pair]['times'], 'equity': pair_equity[pair], 'actual_price': signals[pair]['close']})
+        run_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        results.save_run(os.path.join(results.results_dir, f"portfolio_{strategy['strategy_name']}_{run_time}"), equity_data)
+        Backtester.plot_backtest_equity_curves(['Portfolio'] + list(pairs), equity_data)
+        return times, equity_curve, pair_equity
 
-        plt.title('Backtest Equity Curves')
-        plt.tight_layout()
+    @staticmethod
+    def plot_backtest_equity_curves(pairs, equity_data):
+        # drawn off screen and saved, so long runs and sweeps never wait on a window
         plot_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        plt.savefig(f'graphs\\backtest_equity_curve_{plot_time}.png')
-        plt.show()
+        path = os.path.join(results.graphs_dir, f'backtest_equity_curve_{plot_time}.png')
+        results.render_equity_curves(path, [dict(curve, pair=pair) for pair, curve in zip(pairs, equity_data)])
+        print("Equity curves saved to", path)
+        return path
 
     @staticmethod
-    def backtest(strategy, time_frame, start_date, end_date, pairs, mt5_connection):
+    def backtest(strategy, time_frame, start_date, end_date, pairs, mt5_connection, rate_provider=None, tick_store=None, vectorized=True):
         equity_data = []
+        ledgers = dict()
 
         for pair in pairs:
             historical_data = mt5_connection.get_historical_data(pair, time_frame, start_date, end_date)
-            equity_curve_timestamps, equity_curve, actual_price = Backtester.simulate_trades(pair, historical_data, strategy)
+            if vectorized:
+                equity_curve_timestamps, equity_curve, actual_price, ledgers[pair] = Backtester.simulate_trades_vectorized(pair, historical_data, strategy, rate_provider, tick_store, return_trades=True)
+            else:
+                equity_curve_timestamps, equity_curve, actual_price, ledgers[pair] = Backtester.simulate_trades(pair, historical_data, strategy, rate_provider, return_trades=True)
             equity_data.append({'pair': pair, 'timestamps': equity_curve_timestamps, 'equity': equity_curve, 'actual_price':actual_price})
 
+        # curves and trades are kept as parquet next to the chart
+        run_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        results.save_run(os.path.join(results.results_dir, f"backtest_{strategy['strategy_name']}_{run_time}"), equity_data, ledgers)
         Backtester.plot_backtest_equity_curves(pairs, equity_data)
 
 def main():
@@ -207,12 +556,19 @@ def main():
     mt5_connection.connect()
 
     current_strategy = strategy.load_strategy("strategy1")
-    time_frame = mt5.TIMEFRAME_M15
+    time_frame = constants.default_time_frame
     start_date = datetime(2023, 1, 2)
     end_date = datetime(2023, 12, 29)
     pairs = ["GBPUSD"]
 
-    Backtester.backtest(current_strategy, time_frame, start_date, end_date, pairs, mt5_connection)
+    # conversion rates come from cached bars so the backtest does not need the network
+    symbols = rates.conversion_symbols(pairs, current_strategy['account_currency'])
+    rate_provider = rates.HistoricalRateProvider.from_bar_store(mt5_connection.bar_store, symbols, time_frame, start_date, end_date)
+
+    # tick level fills read whatever ticks have been stored for the pairs
+    ticks = tick_store.TickStore(constants.tick_dir)
+
+    Backtester.backtest(current_strategy, time_frame, start_date, end_date, pairs, mt5_connection, rate_provider, ticks)
 
 if __name__ == '__main__':
     main()
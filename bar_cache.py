@@ -0,0 +1,265 @@
+import calendar
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# same layout as the structured arrays returned by mt5.copy_rates_range
+rates_dtype = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('tick_volume', '<u8'),
+    ('spread', '<i4'),
+    ('real_volume', '<u8'),
+])
+
+
+def timeframe_seconds(time_frame):
+    # mt5 encodes minute timeframes as minutes, hour timeframes as 0x4000 + hours and weeks as 0x8000 + weeks
+    if time_frame < 0x4000:
+        return time_frame * 60
+    if time_frame < 0x8000:
+        return (time_frame - 0x4000) * 3600
+    if time_frame < 0xC000:
+        return (time_frame - 0x8000) * 7 * 86400
+    return None # months are not a fixed length
+
+
+def to_epoch(dt):
+    # naive datetimes are treated as UTC, as mt5 does
+    if isinstance(dt, (int, np.integer)):
+        return int(dt)
+    if dt.tzinfo is None:
+        return calendar.timegm(dt.timetuple())
+    return int(dt.timestamp())
+
+
+def to_rates(bars):
+    # convert anything array or frame like into the rates layout
+    if bars is None:
+        return np.empty(0, dtype=rates_dtype)
+    if isinstance(bars, pd.DataFrame):
+        columns = {name: bars[name].to_numpy() for name in bars.columns}
+    else:
+        bars = np.asarray(bars)
+        columns = {name: bars[name] for name in bars.dtype.names}
+
+    rates = np.zeros(len(next(iter(columns.values()), [])), dtype=rates_dtype)
+    for name in rates_dtype.names:
+        if name in columns:
+            values = columns[name]
+            if name == 'time' and np.issubdtype(np.asarray(values).dtype, np.datetime64):
+                values = np.asarray(values, dtype='datetime64[s]').astype(np.int64)
+            rates[name] = values
+    return rates
+
+
+class BarStore:
+    row_group_size = 100000
+
+    def __init__(self, root, source, clock=time.time, save_interval=0):
+        # source has the signature of mt5.copy_rates_range(symbol, time_frame, date_from, date_to). New bars
+        # are written out at most every save_interval seconds per file, the rest by flush()
+        self.root = root
+        self.source = source
+        self.clock = clock
+        self.save_interval = save_interval
+        self.bars = dict()
+        self.coverage = dict()
+        self.saved = dict()
+        self.unsaved = set()
+
+    def file_path(self, symbol, time_frame, ext):
+        return os.path.join(self.root, f'{symbol}_{time_frame}.{ext}')
+
+    def load(self, symbol, time_frame):
+        key = (symbol, time_frame)
+        if key not in self.bars:
+            bars_path = self.file_path(symbol, time_frame, 'parquet')
+            coverage_path = self.file_path(symbol, time_frame, 'json')
+            if os.path.exists(bars_path) and os.path.exists(coverage_path):
+                self.bars[key] = to_rates(pd.read_parquet(bars_path))
+                with open(coverage_path) as json_file:
+                    self.coverage[key] = json.load(json_file)
+            else:
+                self.bars[key] = np.empty(0, dtype=rates_dtype)
+                self.coverage[key] = []
+        return self.bars[key], self.coverage[key]
+
+    def save(self, symbol, time_frame):
+        key = (symbol, time_frame)
+        os.makedirs(self.root, exist_ok=True)
+        bars_path = self.file_path(symbol, time_frame, 'parquet')
+        coverage_path = self.file_path(symbol, time_frame, 'json')
+
+        # write to a temporary file first so a crash never leaves a half written cache behind
+        # in row groups, so the chunked backtest can read the file back a piece at a time
+        pd.DataFrame(self.bars[key]).to_parquet(bars_path + '.tmp', index=False, row_group_size=self.row_group_size)
+        os.replace(bars_path + '.tmp', bars_path)
+        with open(coverage_path + '.tmp', 'w') as json_file:
+            json.dump(self.coverage[key], json_file)
+        os.replace(coverage_path + '.tmp', coverage_path)
+        self.saved[key] = self.clock()
+        self.unsaved.discard(key)
+
+    def flush(self):
+        for symbol, time_frame in list(self.unsaved):
+            self.save(symbol, time_frame)
+
+    @staticmethod
+    def missing_ranges(coverage, start, end):
+        # parts of [start, end] not covered by the sorted, merged coverage intervals
+        missing = []
+        for covered_start, covered_end in coverage:
+            if covered_end < start:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > start:
+                missing.append((start, covered_start - 1))
+            start = max(start, covered_end + 1)
+        if start <= end:
+            missing.append((start, end))
+        return missing
+
+    @staticmethod
+    def add_coverage(coverage, start, end):
+        intervals = sorted(coverage + [[start, end]])
+        merged = [intervals[0]]
+        for interval_start, interval_end in intervals[1:]:
+            if interval_start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], interval_end)
+            else:
+                merged.append([interval_start, interval_end])
+        return merged
+
+    @staticmethod
+    def fetched_end(missing_start, missing_end, last_time, covered_starts, last_closed, tf_seconds):
+        # how far a fetched gap is covered - a gap that ends where cached bars start had nothing more to give,
+        # anywhere else the source may not have caught up yet, so only up to the last bar it returned
+        covered_end = min(missing_end, last_closed)
+        if missing_end + 1 not in covered_starts:
+            covered_end = min(covered_end, last_time + tf_seconds - 1 if last_time is not None else missing_start - 1)
+        return covered_end
+
+    def copy_rates_range(self, symbol, time_frame, date_from, date_to):
+        tf_seconds = timeframe_seconds(time_frame)
+        if tf_seconds is None:
+            return self.source(symbol, time_frame, date_from, date_to)
+
+        key = (symbol, time_frame)
+        start, end = to_epoch(date_from), to_epoch(date_to)
+        bars, coverage = self.load(symbol, time_frame)
+
+        # bars that opened after this have not closed yet and must not be cached
+        last_closed = int(self.clock()) - tf_seconds
+        covered_starts = {covered_start for covered_start, covered_end in coverage}
+        fetched = []
+        forming = []
+        for missing_start, missing_end in self.missing_ranges(coverage, start, end):
+            rates = self.source(symbol, time_frame,
+                                datetime.fromtimestamp(missing_start, timezone.utc),
+                                datetime.fromtimestamp(missing_end, timezone.utc))
+            if rates is None:
+                continue
+            rates = to_rates(rates)
+            fetched.append(rates[rates['time'] <= last_closed])
+            forming.append(rates[rates['time'] > last_closed])
+            covered_end = self.fetched_end(missing_start, missing_end, int(rates['time'][-1]) if len(rates) else None, covered_starts, last_closed, tf_seconds)
+            if missing_start <= covered_end:
+                coverage = self.add_coverage(coverage, missing_start, covered_end)
+
+        if fetched:
+            bars = np.concatenate([bars] + fetched)
+            bars = bars[np.argsort(bars['time'], kind='stable')]
+            keep = np.ones(len(bars), dtype=bool)
+            keep[:-1] = bars['time'][1:] != bars['time'][:-1]
+            self.bars[key] = bars = bars[keep]
+            self.coverage[key] = coverage
+            self.unsaved.add(key)
+            if self.clock() - self.saved.get(key, float('-inf')) >= self.save_interval:
+                self.save(symbol, time_frame)
+
+        lo = np.searchsorted(bars['time'], start, side='left')
+        hi = np.searchsorted(bars['time'], end, side='right')
+        return np.concatenate([bars[lo:hi]] + forming)
+
+    def prefetch(self, symbol, time_frame, date_from, date_to, window):
+        # fills what the cache is missing of a range, window bars at a time, without holding the symbol's bars
+        # in memory - the file is streamed through once, row group by row group, with each downloaded window
+        # written in between as its own row groups
+        tf_seconds = timeframe_seconds(time_frame)
+        key = (symbol, time_frame)
+        if key in self.unsaved:
+            self.save(symbol, time_frame)
+        self.bars.pop(key, None)
+        self.coverage.pop(key, None)
+
+        bars_path = self.file_path(symbol, time_frame, 'parquet')
+        coverage_path = self.file_path(symbol, time_frame, 'json')
+        cached = os.path.exists(bars_path) and os.path.exists(coverage_path)
+        coverage = []
+        if cached:
+            with open(coverage_path) as json_file:
+                coverage = json.load(json_file)
+        last_closed = int(self.clock()) - tf_seconds
+        covered_starts = {covered_start for covered_start, covered_end in coverage}
+        missing = self.missing_ranges(coverage, to_epoch(date_from), min(to_epoch(date_to), last_closed))
+        if not missing:
+            return
+
+        def downloads():
+            # windows in time order, coverage extended as each gap is done
+            nonlocal coverage
+            for missing_start, missing_end in missing:
+                last_time = None
+                for window_start in range(missing_start, missing_end + 1, window * tf_seconds):
+                    window_end = min(window_start + window * tf_seconds - 1, missing_end)
+                    rates = to_rates(self.source(symbol, time_frame,
+                                                 datetime.fromtimestamp(window_start, timezone.utc),
+                                                 datetime.fromtimestamp(window_end, timezone.utc)))
+                    rates = rates[(rates['time'] >= window_start) & (rates['time'] <= window_end)]
+                    if len(rates):
+                        last_time = int(rates['time'][-1])
+                        yield rates
+                covered_end = self.fetched_end(missing_start, missing_end, last_time, covered_starts, last_closed, tf_seconds)
+                if missing_start <= covered_end:
+                    coverage = self.add_coverage(coverage, missing_start, covered_end)
+
+        os.makedirs(self.root, exist_ok=True)
+        schema = pa.Table.from_pandas(pd.DataFrame(np.empty(0, dtype=rates_dtype)), preserve_index=False).schema
+        pending = downloads()
+        fetched = next(pending, None)
+        with pq.ParquetWriter(bars_path + '.tmp', schema) as writer:
+            def write(rates):
+                if len(rates):
+                    writer.write_table(pa.Table.from_pandas(pd.DataFrame(rates), schema=schema, preserve_index=False), row_group_size=self.row_group_size)
+
+            # the gaps lie between cached bars, so a window goes in where the cached bars pass its start
+            if cached:
+                with pq.ParquetFile(bars_path) as parquet_file:
+                    for batch in parquet_file.iter_batches(batch_size=self.row_group_size):
+                        existing = to_rates(batch.to_pandas())
+                        while fetched is not None and len(existing) and fetched['time'][0] < existing['time'][-1]:
+                            split = np.searchsorted(existing['time'], fetched['time'][0])
+                            write(existing[:split])
+                            existing = existing[split:]
+                            write(fetched)
+                            fetched = next(pending, None)
+                        write(existing)
+            while fetched is not None:
+                write(fetched)
+                fetched = next(pending, None)
+        os.replace(bars_path + '.tmp', bars_path)
+        with open(coverage_path + '.tmp', 'w') as json_file:
+            json.dump(coverage, json_file)
+        os.replace(coverage_path + '.tmp', coverage_path)
+        self.saved[key] = self.clock()
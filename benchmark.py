@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import bar_cache
+import constants
+import rates
+import strategy
+import synthetic
+
+# timings of the hot paths on synthetic data, compared against a stored baseline so a change that
+# slows them down or grows their memory fails instead of going unnoticed
+
+baseline_path = 'benchmark_baseline.json'
+default_threshold = 0.25
+symbols = ['EURUSD', 'GBPUSD', 'USDCAD']
+time_frames = [15, 0x4000 + 1]
+static_rates = {'EURUSD': 1.10, 'GBPUSD': 1.27, 'USDCAD': 1.35}
+
+
+def bench_simulate_trades(current_strategy, bars=2000):
+    # the per bar loop recalculates its averages from the start on every bar, so it gets a short history
+    from backtester import Backtester
+    data = synthetic.generate_frame('GBPUSD', 15, datetime(2023, 1, 2), datetime(2023, 12, 29)).head(bars)
+    rate_provider = rates.StaticRateProvider(static_rates)
+    return len(data), lambda: Backtester.simulate_trades('GBPUSD', data, current_strategy, rate_provider)
+
+
+def bench_simulate_trades_vectorized(current_strategy):
+    from backtester import Backtester
+    frames = {(symbol, time_frame): synthetic.generate_frame(symbol, time_frame, datetime(2021, 1, 1), datetime(2023, 12, 29))
+              for symbol in symbols for time_frame in time_frames}
+    rate_provider = rates.StaticRateProvider(static_rates)
+
+    def run():
+        for (symbol, _), data in frames.items():
+            Backtester.simulate_trades_vectorized(symbol, data, current_strategy, rate_provider)
+    return sum(len(data) for data in frames.values()), run
+
+
+def bench_moving_average(name, period=40):
+    close = pd.Series(synthetic.generate_rates('EURUSD', 1, datetime(2023, 1, 2), datetime(2023, 12, 29))['close'])
+    function = constants.movingAveragesFunctions[name]
+    return len(close), lambda: function(close, period)
+
+
+def bench_get_data(bars=500):
+    # the frame get_data builds from downloaded rates every cycle, for every pair
+    end = datetime(2023, 12, 29)
+    market = {symbol: synthetic.generate_rates(symbol, 15, end - timedelta(minutes=15 * bars * 2), end) for symbol in symbols}
+
+    def run():
+        for symbol_rates in market.values():
+            rates_frame = pd.DataFrame(symbol_rates)
+            rates_frame['time'] = pd.to_datetime(rates_frame['time'], unit='s')
+            rates_frame.drop(rates_frame.tail(1).index, inplace=True)
+    return sum(len(symbol_rates) for symbol_rates in market.values()), run
+
+
+def bench_check_trades(current_strategy, cycles=20):
+    # whole trading cycles against the fake broker - download through the bar cache, indicators, snapshot
+    # and orders. The trader reads the wall clock, so every cycle sees the same closed bars and this is
+    # the steady state cost of a cycle with nothing new to download.
+    import fake_broker
+    import trader
+
+    period = bar_cache.timeframe_seconds(15)
+    now = int(time.time())
+    client = fake_broker.FakeBroker(balance=current_strategy['initialBalance'])
+    for symbol in current_strategy['pairs']:
+        client.add_bars(symbol, 15, synthetic.generate_rates(symbol, 15, now - period * 2000, now, weekends=True))
+
+    constants.live_rates = rates.StaticRateProvider(static_rates)
+    trader.bar_store = bar_cache.BarStore(tempfile.mkdtemp(), lambda *args: trader.broker.copy_rates_range(*args))
+    trader.connect(client)
+    # in memory, so the benchmark never touches the live bot's saved risk state
+    trader.start_risk_engine(current_strategy)
+    max_data_points = trader.strategy_data_points(current_strategy)
+
+    def run():
+        for _ in range(cycles):
+            pair_data = trader.get_data(15, current_strategy, max_data_points)
+            trader.check_trades(15, pair_data, current_strategy)
+    return cycles * len(current_strategy['pairs']) * max_data_points, run
+
+
+def cases(current_strategy):
+    yield 'simulate_trades', lambda: bench_simulate_trades(current_strategy)
+    yield 'simulate_trades_vectorized', lambda: bench_simulate_trades_vectorized(current_strategy)
+    for name in constants.movingAveragesFunctions:
+        yield f'moving_average.{name}', lambda name=name: bench_moving_average(name)
+    yield 'get_data_frame', bench_get_data
+    yield 'check_trades', lambda: bench_check_trades(current_strategy)
+
+
+def measure(setup, repeat=3):
+    # best of repeat timed runs, then one more under tracemalloc for the peak memory of a run
+    bars, run = setup()
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    best = min(timings)
+    return {'bars': bars, 'seconds': best, 'bars_per_second': bars / best if best > 0 else float('inf'), 'peak_mb': peak / 2 ** 20}
+
+
+def compare(results, baseline, threshold, only=None):
+    # slower by more than threshold or using more than threshold extra memory counts as a regression, and so
+    # does a benchmark that now fails or no longer runs. only is the prefixes that were run, if not all
+    regressions = []
+    for name, before in baseline.items():
+        if name not in results and 'error' not in before and not (only and not any(name.startswith(prefix) for prefix in only)):
+            regressions.append(f"{name}: in the baseline but not run")
+    for name, result in results.items():
+        if 'error' in result:
+            if 'error' not in baseline.get(name, {}):
+                regressions.append(f"{name}: failed - {result['error']}")
+            continue
+        if name not in baseline or 'error' in baseline[name]:
+            continue
+        before = baseline[name]
+        if result['bars_per_second'] < before['bars_per_second'] * (1 - threshold):
+            regressions.append(f"{name}: {result['bars_per_second']:,.0f} bars/s, baseline {before['bars_per_second']:,.0f}")
+        if result['peak_mb'] > before['peak_mb'] * (1 + threshold) and result['peak_mb'] - before['peak_mb'] > 1:
+            regressions.append(f"{name}: {result['peak_mb']:.1f} MB peak, baseline {before['peak_mb']:.1f}")
+    return regressions
+
+
+def run_benchmarks(strategy_name='strategy1', only=None, repeat=3):
+    current_strategy = strategy.load_strategy(strategy_name)
+    results = dict()
+    for name, setup in cases(current_strategy):
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        try:
+            results[name] = measure(setup, repeat)
+        except Exception as e:
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+        result = results[name]
+        if 'error' in result:
+            print(f"{name:<40} failed - {result['error']}")
+        else:
+            print(f"{name:<40} {result['bars_per_second']:>14,.0f} bars/s {result['peak_mb']:>9.1f} MB peak")
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the backtester and trader on synthetic data')
+    parser.add_argument('--strategy', default='strategy1')
+    parser.add_argument('--only', nargs='*', help='benchmark name prefixes to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=baseline_path)
+    parser.add_argument('--threshold', type=float, default=default_threshold)
+    parser.add_argument('--save', action='store_true', help='store these results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.strategy, args.only, args.repeat)
+
+    if args.save:
+        with open(args.baseline, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save to create one")
+        return 0
+    with open(args.baseline) as json_file:
+        baseline = json.load(json_file)
+    regressions = compare(results, baseline, args.threshold, args.only)
+    for regression in regressions:
+        print("Regression -", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
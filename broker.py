@@ -0,0 +1,140 @@
+import threading
+import time
+
+
+class BrokerSession:
+    # long lived connection to the terminal - connects once, checks itself with a heartbeat and reconnects with backoff
+    # the client is the MetaTrader5 module, or anything with the same functions such as fake_broker.FakeBroker
+    def __init__(self, account, password, server, client=None, heartbeat_interval=30, initial_backoff=1, max_backoff=60, max_attempts=None, sleep=time.sleep):
+        if client is None:
+            import MetaTrader5 as client
+        self.client = client
+        self.account = account
+        self.password = password
+        self.server = server
+        self.heartbeat_interval = heartbeat_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.connected = False
+        self.reconnects = 0
+        self.lock = threading.Lock()
+        self.stop_heartbeat = threading.Event()
+        self.heartbeat_thread = None
+
+    def __getattr__(self, name):
+        # constants such as ORDER_TYPE_BUY come straight from the client
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def login(self):
+        if not self.client.initialize(login=self.account, password=self.password, server=self.server):
+            print("initialize() failed, error code =", self.client.last_error())
+            return False
+
+        if not self.client.login(self.account, password=self.password, server=self.server):
+            print(f'failed to connect to account {self.account}, error code: {self.client.last_error()}')
+            self.client.shutdown()
+            return False
+        return True
+
+    def connect(self):
+        with self.lock:
+            if not self.connected:
+                self.reconnect()
+
+    def reconnect(self):
+        # keep trying with an exponential backoff, caller must hold the lock
+        delay = self.initial_backoff
+        attempt = 1
+        while not self.login():
+            if self.max_attempts is not None and attempt >= self.max_attempts:
+                raise ConnectionError(f'could not connect to account {self.account} after {attempt} attempts')
+            print(f"retrying connection in {delay} seconds")
+            self.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+            attempt += 1
+        self.connected = True
+        print("connected: connecting to mt5 client")
+
+    def disconnect(self):
+        self.stop_heartbeat.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+            self.heartbeat_thread = None
+        with self.lock:
+            self.client.shutdown()
+            self.connected = False
+        print("Disconnecting from MT5 Client")
+
+    def is_alive(self):
+        info = self.client.terminal_info()
+        return info is not None and getattr(info, 'connected', True)
+
+    def heartbeat(self):
+        with self.lock:
+            if self.connected and self.is_alive():
+                return
+            print("Lost connection to MT5 client, reconnecting")
+            self.client.shutdown()
+            self.connected = False
+            self.reconnects += 1
+            self.reconnect()
+
+    def start_heartbeat(self):
+        if self.heartbeat_thread is not None:
+            return
+        self.stop_heartbeat.clear()
+        self.heartbeat_thread = threading.Thread(target=self.run_heartbeat, daemon=True)
+        self.heartbeat_thread.start()
+
+    def run_heartbeat(self):
+        while not self.stop_heartbeat.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print("heartbeat failed:", e)
+
+    def call(self, name, *args, **kwargs):
+        # calls run outside the lock so independent requests are not serialized behind each other
+        if not self.connected:
+            self.connect()
+        result = getattr(self.client, name)(*args, **kwargs)
+
+        # None means the call failed - if the session dropped, reconnect and try once more
+        if result is None and not self.is_alive():
+            self.heartbeat()
+            result = getattr(self.client, name)(*args, **kwargs)
+        return result
+
+    def account_info(self):
+        return self.call('account_info')
+
+    def terminal_info(self):
+        return self.call('terminal_info')
+
+    def positions_get(self, **kwargs):
+        return self.call('positions_get', **kwargs)
+
+    def history_deals_get(self, *args, **kwargs):
+        return self.call('history_deals_get', *args, **kwargs)
+
+    def copy_rates_range(self, symbol, time_frame, date_from, date_to):
+        return self.call('copy_rates_range', symbol, time_frame, date_from, date_to)
+
+    def symbol_info(self, symbol):
+        return self.call('symbol_info', symbol)
+
+    def symbol_info_tick(self, symbol):
+        return self.call('symbol_info_tick', symbol)
+
+    def symbol_select(self, symbol, enable=True):
+        return self.call('symbol_select', symbol, enable)
+
+    def order_send(self, request):
+        return self.call('order_send', request)
+
+    def last_error(self):
+        return self.client.last_error()
@@ -0,0 +1,306 @@
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import backtester
+import bar_cache
+import constants
+import indicators
+import keys
+import position_book
+import rates
+import results
+import signals
+import strategy
+from backtester import Backtester, IntrabarFills
+
+# backtests over more bars than fit in memory - bars are read from parquet a chunk at a time, and the
+# streaming indicators, open positions and running equity are carried from one chunk to the next while
+# equity and closed trades are appended to parquet as they are produced. Memory follows the chunk size
+# and the number of open positions, not the length of the history.
+#
+# Every running sum is carried across chunk boundaries and added in the same order either way, so the
+# results do not depend on the chunk size - one chunk holding all the bars is the in-memory run.
+# Positions follow the same rules as Backtester.simulate_trades_vectorized.
+
+
+def read_chunks(path, start=None, end=None, chunk_size=constants.backtest_chunk_size):
+    # bars of a rates parquet file in time order, such as the bar cache's, at most chunk_size at a time
+    start = None if start is None else bar_cache.to_epoch(start)
+    end = None if end is None else bar_cache.to_epoch(end)
+    parquet_file = pq.ParquetFile(path)
+    columns = [name for name in bar_cache.rates_dtype.names if name in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        bars = bar_cache.to_rates(batch.to_pandas())
+        if start is not None:
+            bars = bars[bars['time'] >= start]
+        if end is not None:
+            past_end = len(bars) and bars['time'][-1] > end
+            bars = bars[bars['time'] <= end]
+            if past_end:
+                if len(bars):
+                    yield bars
+                return
+        if len(bars):
+            yield bars
+
+
+def chunk_rates(bar_store, symbols, time_frame, start, end, margin=7 * 86400):
+    # conversion rates for the bars start till end, read from the cached bars of those symbols - margin
+    # reaches back over weekends and holidays to the last rate before the first bar
+    symbol_rates = dict()
+    for symbol in symbols:
+        path = bar_store.file_path(symbol, time_frame, 'parquet')
+        if not os.path.exists(path):
+            continue
+        table = pq.read_table(path, columns=['time', 'close'], filters=[('time', '>=', start - margin), ('time', '<=', end)])
+        if table.num_rows:
+            symbol_rates[symbol] = (table['time'].to_numpy(), table['close'].to_numpy())
+    return rates.HistoricalRateProvider(symbol_rates)
+
+
+class ParquetAppender:
+    # one row group per frame written, the file is created on the first write
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def write(self, frame):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        if len(frame):
+            self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ChunkedSimulation:
+    def __init__(self, pair, strategy, time_frame, rate_provider=None, tick_store=None):
+        # slippage is drawn randomly per bar and position, so only the in-memory loop can reproduce it
+        if strategy.get('slippage_enabled', False):
+            raise ValueError("Slippage is only simulated by Backtester.simulate_trades")
+        self.pair = pair
+        self.strategy = strategy
+        self.rate_provider = rate_provider
+        self.compiled = signals.compile_strategy(strategy)
+        self.indicators = dict()
+        for key, spec in self.compiled.indicators.items():
+            if spec['function'] not in indicators.streamingFunctions:
+                raise ValueError(f"{spec['function']} has no streaming version to carry between chunks")
+            self.indicators[key] = indicators.streamingFunctions[spec['function']](spec['val'])
+        self.take_profit = float(strategy['takeProfit'])
+        self.stop_loss = float(strategy['stopLoss'])
+
+        fill_mode = strategy.get('fillMode', 'close')
+        self.intrabar = fill_mode != 'close'
+        self.ticks = tick_store if fill_mode == 'tick' and tick_store is not None and tick_store.has(pair) else None
+        self.bar_msc = bar_cache.timeframe_seconds(time_frame) * 1000
+
+        # running equity, open size and open cost, and what the last chunk added to the bar after it
+        self.equity = float(strategy['initialBalance'])
+        self.open_size = 0.0
+        self.open_cost = 0.0
+        self.size_carry = 0.0
+        self.cost_carry = 0.0
+        # positions still open after the last chunk, and every position not yet written out, both in entry order
+        self.open = []
+        self.pending = []
+        self.positions = 0
+        self.last_time = None
+        self.last_close = None
+
+    def indicator_values(self, close):
+        values = dict()
+        for key, indicator in self.indicators.items():
+            update = indicator.update
+            values[key] = np.fromiter((update(x) for x in close.tolist()), dtype=float, count=len(close))
+        return values
+
+    def resolve(self, position, signal_from, scan_from, close, times, exit_signals, intrabar, diffs):
+        # close a position on the next exit signal, or the first stop loss or take profit before it -
+        # False when neither comes before the end of the chunk
+        size_diff, cost_diff, fill_adjustment = diffs
+        n = len(close)
+        next_signal = np.searchsorted(exit_signals, signal_from)
+        end = exit_signals[next_signal] if next_signal < len(exit_signals) else n - 1
+        if intrabar is None:
+            window = close[scan_from:end + 1]
+            hit = (window <= position['stop_level']) | (window >= position['target_level'])
+            hit = (scan_from + int(np.argmax(hit)), None) if hit.any() else None
+        else:
+            hit = intrabar.first_exit(scan_from, end, position['stop_level'], position['target_level'])
+        if hit is None:
+            if next_signal == len(exit_signals):
+                return False
+            hit = (end, None)
+
+        exit_idx, exit_price = hit
+        exit_price = close[exit_idx] if exit_price is None else exit_price
+        size = position['size']
+        size_diff[exit_idx + 1] -= size
+        cost_diff[exit_idx + 1] -= size * position['entry_price']
+        fill_adjustment[exit_idx] += size * (exit_price - close[exit_idx])
+        position.update(exit_time=times[exit_idx], exit_price=exit_price, closed=True)
+        return True
+
+    def advance(self, start, end, close, diffs, equity):
+        # equity of bars start till end, carrying on from the running sums
+        size_diff, cost_diff, fill_adjustment = diffs
+        open_size = np.cumsum(np.concatenate(([self.open_size], size_diff[start:end])))
+        open_cost = np.cumsum(np.concatenate(([self.open_cost], cost_diff[start:end])))
+        change = close[start:end] * open_size[1:] - open_cost[1:] + fill_adjustment[start:end]
+        running = np.cumsum(np.concatenate(([self.equity], change)))
+        equity[start:end] = running[1:]
+        self.open_size, self.open_cost, self.equity = open_size[-1], open_cost[-1], running[-1]
+
+    def update(self, bars):
+        # bars in the rates layout - returns the chunk's times, equity and closes within trading hours,
+        # and the trades that can be written out
+        close = bars['close'].astype(float)
+        values = self.indicator_values(close)
+        entries, exits = self.compiled.signals({field: bars[field].astype(float) for field in signals.price_fields}, values)
+        times = bars['time'].astype('datetime64[s]').astype('datetime64[ns]')
+        mask = Backtester.trading_hours_mask(times)
+        close, times, entries, exits = close[mask], times[mask], entries[mask], exits[mask]
+        n = len(close)
+        equity = np.empty(n)
+        if n == 0:
+            return times, equity, close, self.flush()
+
+        intrabar = None
+        if self.intrabar:
+            intrabar = IntrabarFills(
+                bars['open'].astype(float)[mask],
+                bars['high'].astype(float)[mask],
+                bars['low'].astype(float)[mask],
+                times.astype('datetime64[ms]').astype(np.int64),
+                self.bar_msc,
+                self.strategy.get('intrabarPriority', 'stop'),
+                self.ticks,
+                self.pair,
+            )
+        exit_signals = np.flatnonzero(exits)
+        diffs = (np.zeros(n + 1), np.zeros(n + 1), np.zeros(n))
+        diffs[0][0], diffs[1][0] = self.size_carry, self.cost_carry
+
+        # positions from earlier chunks go first, they opened before anything in this one
+        self.open = [
+            position for position in self.open
+            if not self.resolve(position, 0, 0, close, times, exit_signals, intrabar, diffs)
+        ]
+
+        # each position is sized from the equity of the bar before it opens
+        entry_idx = np.flatnonzero(entries)
+        pip_values = Backtester.calc_pip_values(self.pair, times, entries, self.strategy, self.rate_provider)
+        t = 0
+        for i in entry_idx:
+            self.advance(t, i, close, diffs, equity)
+            t = i
+            size = Backtester.calc_lot_size(self.equity, pip_values[i], self.strategy)
+            diffs[0][i] += size
+            diffs[1][i] += size * close[i]
+            position = {
+                'entry_time': times[i],
+                'size': size,
+                'entry_price': close[i],
+                'stop_level': close[i] - self.stop_loss,
+                'target_level': close[i] + self.take_profit,
+            }
+            self.pending.append(position)
+            self.positions += 1
+            # the entry bar's range happened before the position opened at its close
+            if not self.resolve(position, i, i + 1 if intrabar is not None else i, close, times, exit_signals, intrabar, diffs):
+                self.open.append(position)
+        self.advance(t, n, close, diffs, equity)
+        self.size_carry, self.cost_carry = diffs[0][n], diffs[1][n]
+
+        self.last_time, self.last_close = times[-1], close[-1]
+        return times, equity, close, self.flush()
+
+    def flush(self, final=False):
+        # closed positions at the front of the entry order, the rest wait so the ledger stays in entry order
+        count = 0
+        while count < len(self.pending) and (final or 'closed' in self.pending[count]):
+            count += 1
+        done, self.pending = self.pending[:count], self.pending[count:]
+        return results.ledger_frame(
+            entry_time=[position['entry_time'] for position in done],
+            exit_time=[position.get('exit_time', self.last_time) for position in done],
+            side=[position_book.BUY] * len(done),
+            size=[position['size'] for position in done],
+            entry_price=[position['entry_price'] for position in done],
+            exit_price=[position.get('exit_price', self.last_close) for position in done],
+            profit=[position['size'] * (position.get('exit_price', self.last_close) - position['entry_price']) for position in done],
+            closed=[position.get('closed', False) for position in done],
+        )
+
+    def finish(self):
+        # positions never closed are held till the last bar
+        self.open = []
+        return self.flush(final=True)
+
+
+def run(current_strategy, time_frame, start_date, end_date, pairs, bar_store, rate_provider=None, tick_store=None,
+        chunk_size=constants.backtest_chunk_size, rate_symbols=None):
+    # reads the bars bar_store has cached, results go to results/chunked_{name}_{time}/ in the layout of
+    # results.save_run. With rate_symbols the conversion rates are read from their cached bars for each
+    # chunk instead of coming from rate_provider
+    run_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    run_dir = os.path.join(results.results_dir, f"chunked_{current_strategy['strategy_name']}_{run_time}")
+    final_equity = dict()
+
+    for pair in pairs:
+        simulation = ChunkedSimulation(pair, current_strategy, time_frame, rate_provider, tick_store)
+        with ParquetAppender(os.path.join(run_dir, f'{pair}.equity.parquet')) as equity_file, \
+                ParquetAppender(os.path.join(run_dir, f'{pair}.trades.parquet')) as trades_file:
+            for bars in read_chunks(bar_store.file_path(pair, time_frame, 'parquet'), start_date, end_date, chunk_size):
+                if rate_symbols:
+                    simulation.rate_provider = chunk_rates(bar_store, rate_symbols, time_frame, int(bars['time'][0]), int(bars['time'][-1]))
+                times, equity, close, trades = simulation.update(bars)
+                equity_file.write(results.equity_frame(times, equity, close))
+                trades_file.write(trades)
+            trades_file.write(simulation.finish())
+        final_equity[pair] = simulation.equity
+        print(f"{pair} - {simulation.positions} positions opened, final equity {simulation.equity:.2f}")
+
+    print(f"Results written to {run_dir}")
+    return run_dir, final_equity
+
+
+def main(strategy_name, chunk_size=constants.backtest_chunk_size):
+    mt5_connection = backtester.MT5Connection(keys.demoAccountNum, keys.demoPassword, keys.demoServer)
+    mt5_connection.connect()
+
+    current_strategy = strategy.load_strategy(strategy_name)
+    time_frame = constants.default_time_frame
+    start_date = datetime(2023, 1, 2)
+    end_date = datetime(2023, 12, 29)
+    pairs = current_strategy['pairs']
+
+    # make sure the range of every pair and conversion symbol is in the bar cache, downloaded and written a
+    # chunk's worth of bars at a time. The backtest itself then reads it back a chunk at a time
+    symbols = rates.conversion_symbols(pairs, current_strategy['account_currency'])
+    for symbol in symbols:
+        mt5_connection.bar_store.prefetch(symbol, time_frame, start_date, end_date, chunk_size)
+    mt5_connection.disconnect()
+
+    run(current_strategy, time_frame, start_date, end_date, pairs, mt5_connection.bar_store, chunk_size=chunk_size, rate_symbols=symbols)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *(int(arg) for arg in sys.argv[2:3]))
@@ -1,20 +1,67 @@
-import talib as ta
-from forex_python.converter import CurrencyRates
+import rates
 
-def get_pip_value(symbol, account_currency):
-	symbol_1 = symbol[0:3]
-	symbol_2 = symbol[3:6]
-	c = CurrencyRates()
-	return c.convert(symbol_2, account_currency, c.convert(symbol_1, symbol_2, 1))
+# directory for the local bar cache, and how often the live trader writes new bars to it in seconds
+bar_cache_dir = 'bar_cache'
+bar_cache_save_interval = 3600
+
+# directory for stored ticks used by tick level backtest fills
+tick_dir = 'ticks'
+
+# timeframe strategies trade on unless they set timeFrame, same value as mt5.TIMEFRAME_M15
+default_time_frame = 15
+
+# live bars of every timeframe are derived from this base series, same value as mt5.TIMEFRAME_M1 - None
+# downloads each timeframe separately
+base_time_frame = 1
+
+# order dispatch - concurrent sends, orders per second (None for no limit) and retries on a requote
+order_workers = 8
+orders_per_second = 20
+order_retries = 3
+
+# bars read at a time by the chunked backtest
+backtest_chunk_size = 100000
+
+# per phase cycle latencies written to metrics_path, with the sampled stacks of the slowest cycles kept next to it
+metrics_enabled = False
+metrics_path = 'results/metrics.json'
+metrics_profile_slowest = 5
+# seconds between stack samples of a cycle
+metrics_sample_interval = 0.005
+
+# daily losses, realized profit and the equity high water mark of each strategy, kept between restarts
+risk_state_dir = 'risk_state'
+
+# live rates are cached for a few minutes instead of being downloaded for every position
+live_rates = None
+
+def get_pip_value(symbol, account_currency, timestamp=None, rate_provider=None):
+	global live_rates
+	if rate_provider is None:
+		if live_rates is None:
+			live_rates = rates.LiveRateProvider()
+		rate_provider = live_rates
+	return rate_provider.pip_value(symbol, account_currency, timestamp)
+
+# using talib to get functions to calculate various trade algos, imported on first use as it is slow to load
+def talib_average(name):
+	def average(close, timeP):
+		import talib as ta
+		return getattr(ta, name)(close, timeP)
+	return average
+
+def talib_trendline(close, timeP):
+	# the Hilbert transform trendline has no period
+	import talib as ta
+	return ta.HT_TRENDLINE(close)
 
-# using talib to get functions to calculate various trade algos
 movingAveragesFunctions = {
-	'SMA' : lambda close, timeP: ta.SMA(close, timeP),
-	'EMA' : lambda close, timeP: ta.EMA(close, timeP),
-	'WMA' : lambda close, timeP: ta.WMA(close, timeP),
-	'linearReg' : lambda close, timeP: ta.LINEARREG(close, timeP),
-	'TRIMA' : lambda close, timeP: ta.TRIMA(close, timeP),
-	'DEMA' : lambda close, timeP: ta.DEMA(close, timeP),
-	'HT_TRENDLINE' : lambda close, timeP: ta.HT_TRENDLINE(close, timeP),
-	'TSF' : lambda close, timeP: ta.TSF(close, timeP)
+	'SMA' : talib_average('SMA'),
+	'EMA' : talib_average('EMA'),
+	'WMA' : talib_average('WMA'),
+	'linearReg' : talib_average('LINEARREG'),
+	'TRIMA' : talib_average('TRIMA'),
+	'DEMA' : talib_average('DEMA'),
+	'HT_TRENDLINE' : talib_trendline,
+	'TSF' : talib_average('TSF')
 }
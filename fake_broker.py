@@ -0,0 +1,229 @@
+import itertools
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import bar_cache
+
+# in-process stand in for the MetaTrader5 module - serves bars and ticks from memory and fills every order
+
+TerminalInfo = namedtuple('TerminalInfo', ['connected'])
+AccountInfo = namedtuple('AccountInfo', ['login', 'balance', 'equity', 'profit', 'margin', 'margin_free', 'currency'])
+SymbolInfo = namedtuple('SymbolInfo', ['name', 'visible', 'point', 'digits', 'trade_contract_size'])
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last'])
+TradePosition = namedtuple('TradePosition', ['ticket', 'time', 'type', 'magic', 'volume', 'price_open', 'sl', 'tp', 'price_current', 'profit', 'symbol', 'comment'])
+TradeDeal = namedtuple('TradeDeal', ['ticket', 'order', 'time', 'type', 'entry', 'magic', 'position_id', 'volume', 'price', 'profit', 'symbol', 'comment'])
+OrderSendResult = namedtuple('OrderSendResult', ['retcode', 'deal', 'order', 'volume', 'price', 'bid', 'ask', 'comment', 'request'])
+
+
+class FakeBroker:
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_M5 = 5
+    TIMEFRAME_M15 = 15
+    TIMEFRAME_M30 = 30
+    TIMEFRAME_H1 = 0x4000 + 1
+    TIMEFRAME_H4 = 0x4000 + 4
+    TIMEFRAME_D1 = 0x4000 + 24
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    TRADE_ACTION_DEAL = 1
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_IOC = 1
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    TRADE_RETCODE_REQUOTE = 10004
+    TRADE_RETCODE_REJECT = 10006
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_INVALID_VOLUME = 10014
+    TRADE_RETCODE_PRICE_CHANGED = 10020
+    TRADE_RETCODE_PRICE_OFF = 10021
+
+    def __init__(self, balance=10000.0, clock=time.time, spread_points=10, point=0.00001, contract_size=100000, currency='GBP'):
+        self.balance = balance
+        self.clock = clock
+        self.spread_points = spread_points
+        self.point = point
+        self.contract_size = contract_size
+        self.currency = currency
+        self.bars = dict()
+        self.ticks = dict()
+        self.tick_series = dict()
+        self.positions = dict()
+        self.deals = []
+        self.tickets = itertools.count(1)
+        self.connected = False
+        self.error = (1, 'Success')
+        self.calls = dict()
+        self.requotes = 0
+
+    def count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add_bars(self, symbol, time_frame, rates):
+        rates = bar_cache.to_rates(rates)
+        self.bars[(symbol, time_frame)] = rates[np.argsort(rates['time'], kind='stable')]
+
+    def set_tick(self, symbol, bid, ask=None):
+        self.ticks[symbol] = (bid, bid + self.spread_points * self.point if ask is None else ask)
+
+    def add_ticks(self, symbol, times_msc, bids, asks=None):
+        # recorded or synthetic ticks, the one at or before the clock is the price
+        order = np.argsort(times_msc, kind='stable')
+        bids = np.asarray(bids, dtype=float)[order]
+        asks = bids + self.spread_points * self.point if asks is None else np.asarray(asks, dtype=float)[order]
+        self.tick_series[symbol] = (np.asarray(times_msc, dtype=np.int64)[order], bids, asks)
+
+    def drop_connection(self):
+        self.connected = False
+        self.error = (-10004, 'No IPC connection')
+
+    def initialize(self, **kwargs):
+        self.count('initialize')
+        self.connected = True
+        self.error = (1, 'Success')
+        return True
+
+    def login(self, account, **kwargs):
+        self.count('login')
+        return self.connected
+
+    def shutdown(self):
+        self.count('shutdown')
+        self.connected = False
+
+    def last_error(self):
+        return self.error
+
+    def terminal_info(self):
+        self.count('terminal_info')
+        return TerminalInfo(True) if self.connected else None
+
+    def now(self):
+        return int(self.clock())
+
+    def price(self, symbol):
+        # explicit ticks win, then the latest of a tick series, otherwise the close of the newest bar of the
+        # finest timeframe that has started
+        if symbol in self.ticks:
+            return self.ticks[symbol]
+        if symbol in self.tick_series:
+            times_msc, bids, asks = self.tick_series[symbol]
+            idx = np.searchsorted(times_msc, int(self.clock() * 1000), side='right') - 1
+            if idx >= 0:
+                return float(bids[idx]), float(asks[idx])
+        now = self.now()
+        for (bar_symbol, time_frame), rates in sorted(self.bars.items(), key=lambda item: item[0][1]):
+            if bar_symbol == symbol and len(rates):
+                idx = np.searchsorted(rates['time'], now, side='right') - 1
+                if idx >= 0:
+                    bid = float(rates['close'][idx])
+                    return bid, bid + self.spread_points * self.point
+        return None
+
+    def copy_rates_range(self, symbol, time_frame, date_from, date_to):
+        self.count('copy_rates_range')
+        if not self.connected:
+            return None
+        rates = self.bars.get((symbol, time_frame))
+        if rates is None:
+            return np.empty(0, dtype=bar_cache.rates_dtype)
+        start = bar_cache.to_epoch(date_from)
+        end = min(bar_cache.to_epoch(date_to), self.now())
+        lo = np.searchsorted(rates['time'], start, side='left')
+        hi = np.searchsorted(rates['time'], end, side='right')
+        return rates[lo:hi].copy()
+
+    def symbol_info(self, symbol):
+        self.count('symbol_info')
+        if not self.connected or self.price(symbol) is None:
+            return None
+        return SymbolInfo(symbol, True, self.point, 5, self.contract_size)
+
+    def symbol_select(self, symbol, enable=True):
+        self.count('symbol_select')
+        return self.connected
+
+    def symbol_info_tick(self, symbol):
+        self.count('symbol_info_tick')
+        price = self.price(symbol) if self.connected else None
+        if price is None:
+            return None
+        bid, ask = price
+        return Tick(self.now(), bid, ask, bid)
+
+    def position_profit(self, position):
+        bid, ask = self.price(position['symbol'])
+        if position['type'] == self.ORDER_TYPE_BUY:
+            return (bid - position['price_open']) * position['volume'] * self.contract_size, bid
+        return (position['price_open'] - ask) * position['volume'] * self.contract_size, ask
+
+    def positions_get(self, symbol=None, ticket=None):
+        self.count('positions_get')
+        if not self.connected:
+            return None
+        positions = []
+        for position in self.positions.values():
+            if (symbol is None or position['symbol'] == symbol) and (ticket is None or position['ticket'] == ticket):
+                profit, price_current = self.position_profit(position)
+                positions.append(TradePosition(price_current=price_current, profit=profit, **position))
+        return tuple(positions)
+
+    def history_deals_get(self, date_from, date_to):
+        self.count('history_deals_get')
+        if not self.connected:
+            return None
+        start, end = bar_cache.to_epoch(date_from), bar_cache.to_epoch(date_to)
+        return tuple(deal for deal in self.deals if start <= deal.time <= end)
+
+    def account_info(self):
+        self.count('account_info')
+        if not self.connected:
+            return None
+        profit = sum(self.position_profit(position)[0] for position in self.positions.values())
+        margin = sum(position['volume'] * self.contract_size * position['price_open'] / 30 for position in self.positions.values())
+        equity = self.balance + profit
+        return AccountInfo(1, self.balance, equity, profit, margin, equity - margin, self.currency)
+
+    def order_send(self, request):
+        self.count('order_send')
+        if not self.connected:
+            return None
+        symbol = request['symbol']
+        price = self.price(symbol)
+        if price is None:
+            return OrderSendResult(self.TRADE_RETCODE_REJECT, 0, 0, 0.0, 0.0, 0.0, 0.0, 'Unknown symbol', request)
+        bid, ask = price
+
+        # a pending requote answers the next order with a requote instead of a fill
+        if self.requotes > 0:
+            self.requotes -= 1
+            return OrderSendResult(self.TRADE_RETCODE_REQUOTE, 0, 0, 0.0, 0.0, bid, ask, 'Requote', request)
+
+        fill_price = ask if request['type'] == self.ORDER_TYPE_BUY else bid
+        ticket = next(self.tickets)
+        now = self.now()
+
+        if request.get('position'):
+            position = self.positions.pop(request['position'], None)
+            if position is None or request['volume'] > position['volume']:
+                return OrderSendResult(self.TRADE_RETCODE_INVALID_VOLUME, 0, 0, 0.0, 0.0, bid, ask, 'Invalid volume', request)
+            profit, _ = self.position_profit(position)
+            self.balance += profit
+            self.deals.append(TradeDeal(ticket, ticket, now, request['type'], self.DEAL_ENTRY_OUT, request.get('magic', 0), position['ticket'], request['volume'], fill_price, profit, symbol, request.get('comment', '')))
+        else:
+            self.positions[ticket] = {
+                'ticket': ticket,
+                'time': now,
+                'type': request['type'],
+                'magic': request.get('magic', 0),
+                'volume': float(request['volume']),
+                'price_open': fill_price,
+                'sl': request.get('sl', 0.0),
+                'tp': request.get('tp', 0.0),
+                'symbol': symbol,
+                'comment': request.get('comment', ''),
+            }
+            self.deals.append(TradeDeal(ticket, ticket, now, request['type'], self.DEAL_ENTRY_IN, request.get('magic', 0), ticket, float(request['volume']), fill_price, 0.0, symbol, request.get('comment', '')))
+
+        return OrderSendResult(self.TRADE_RETCODE_DONE, ticket, ticket, float(request['volume']), fill_price, bid, ask, 'Request executed', request)
@@ -0,0 +1,204 @@
+import math
+from collections import deque
+
+import constants
+
+# streaming versions of the talib moving averages - each update takes the newest closed value and is O(1)
+# the update order follows talib so that results match the batch functions
+
+
+class SMA:
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()
+        self.total = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        if len(self.window) == self.period:
+            self.value = self.total / self.period
+            self.total -= self.window.popleft()
+        return self.value
+
+
+class EMA:
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.period:
+            self.total += x
+        elif self.count == self.period:
+            # talib seeds the ema with the simple average of the first period values
+            self.total += x
+            self.value = self.total / self.period
+        else:
+            self.value = ((x - self.value) * self.k) + self.value
+        return self.value
+
+
+class WMA:
+    def __init__(self, period):
+        self.period = period
+        self.divider = (period * (period + 1)) >> 1
+        self.window = deque()
+        self.period_sum = 0.0
+        self.period_sub = 0.0
+        self.trailing_value = 0.0
+        self.value = math.nan
+
+    def update(self, x):
+        self.window.append(x)
+        if len(self.window) < self.period:
+            self.period_sub += x
+            self.period_sum += x * len(self.window)
+            return self.value
+
+        self.period_sub += x
+        self.period_sub -= self.trailing_value
+        self.period_sum += x * self.period
+        self.trailing_value = self.window.popleft()
+        self.value = self.period_sum / self.divider
+        self.period_sum -= self.period_sub
+        return self.value
+
+
+class DEMA:
+    def __init__(self, period):
+        self.ema = EMA(period)
+        self.ema_of_ema = EMA(period)
+        self.value = math.nan
+
+    def update(self, x):
+        ema = self.ema.update(x)
+        if not math.isnan(ema):
+            ema_of_ema = self.ema_of_ema.update(ema)
+            if not math.isnan(ema_of_ema):
+                self.value = (2.0 * ema) - ema_of_ema
+        return self.value
+
+
+class TRIMA:
+    def __init__(self, period):
+        # a triangular average is an average of an average
+        half = period >> 1
+        if period % 2 == 1:
+            self.first, self.second = SMA(half + 1), SMA(half + 1)
+        else:
+            self.first, self.second = SMA(half), SMA(half + 1)
+        self.value = math.nan
+
+    def update(self, x):
+        first = self.first.update(x)
+        if not math.isnan(first):
+            self.value = self.second.update(first)
+        return self.value
+
+
+class LinearReg:
+    # least squares line over the last period values, read off at the newest bar
+    projection = 0
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()
+        self.sum_x = period * (period - 1) * 0.5
+        sum_x_sqr = period * (period - 1) * (2 * period - 1) / 6
+        self.divisor = self.sum_x * self.sum_x - period * sum_x_sqr
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.updates = 0
+        self.value = math.nan
+
+    def update(self, x):
+        # x is how many bars ago each value closed - every value gets one bar older, then the oldest drops out
+        self.sum_xy += self.sum_y
+        self.sum_y += x
+        self.window.append(x)
+        if len(self.window) > self.period:
+            oldest = self.window.popleft()
+            self.sum_xy -= self.period * oldest
+            self.sum_y -= oldest
+
+        # resum once per period to stop rounding error building up
+        self.updates += 1
+        if self.updates % self.period == 0:
+            self.sum_y = math.fsum(self.window)
+            self.sum_xy = math.fsum(i * y for i, y in enumerate(reversed(self.window)))
+
+        if len(self.window) == self.period:
+            m = (self.period * self.sum_xy - self.sum_x * self.sum_y) / self.divisor
+            b = (self.sum_y - m * self.sum_x) / self.period
+            self.value = b + m * (self.period - 1 + self.projection)
+        return self.value
+
+
+class TSF(LinearReg):
+    # time series forecast is the regression line projected one bar ahead
+    projection = 1
+
+
+streamingFunctions = {
+    'SMA': SMA,
+    'EMA': EMA,
+    'WMA': WMA,
+    'linearReg': LinearReg,
+    'TRIMA': TRIMA,
+    'DEMA': DEMA,
+    'TSF': TSF,
+}
+
+
+def ma_function(name, spec):
+    # an average is named after its function unless it says otherwise, e.g. {"function": "SMA", "val": 50}
+    return spec.get('function', name)
+
+
+class IndicatorEngine:
+    def __init__(self, moving_averages):
+        self.moving_averages = moving_averages
+        self.indicators = dict()
+        self.last_time = dict()
+
+    def seed(self, pair, data):
+        # run the whole history through fresh indicators once
+        self.indicators[pair] = {
+            m: streamingFunctions[ma_function(m, ma)](ma['val'])
+            for m, ma in self.moving_averages.items() if ma_function(m, ma) in streamingFunctions
+        }
+        self.last_time.pop(pair, None)
+        self.feed(pair, data)
+
+    def feed(self, pair, data):
+        indicators = self.indicators[pair]
+        for close in data['close'].to_numpy(dtype=float):
+            for indicator in indicators.values():
+                indicator.update(close)
+        if not data.empty:
+            self.last_time[pair] = data['time'].iloc[-1]
+
+    def update(self, pair, data):
+        # feed only the bars that closed since the last update, reseeding if there is a gap in the data
+        last_time = self.last_time.get(pair)
+        if pair not in self.indicators or last_time is None or data.empty or data['time'].iloc[0] > last_time:
+            self.seed(pair, data)
+        else:
+            self.feed(pair, data[data['time'] > last_time])
+
+        values = {m: indicator.value for m, indicator in self.indicators[pair].items()}
+
+        # anything without a streaming version is calculated over the whole window
+        for m, ma in self.moving_averages.items():
+            if m not in values and data.empty:
+                values[m] = math.nan
+            elif m not in values:
+                ma_func = constants.movingAveragesFunctions[ma_function(m, ma)]
+                values[m] = ma_func(data['close'], ma['val']).iloc[-1]
+        return values
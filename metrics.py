@@ -0,0 +1,227 @@
+import bisect
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# per phase latency spans for the trading cycles. Nothing is recorded until enable() is called - span()
+# then hands back one shared do-nothing context, so instrumented code costs a function call when disabled.
+
+recorder = None
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_span = NullSpan()
+
+
+class Span:
+    def __init__(self, recorder, key):
+        self.recorder = recorder
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    # the last history latencies of one span, summarised on export
+    def __init__(self, history):
+        self.latencies = deque(maxlen=history)
+        self.count = 0
+
+    def add(self, seconds):
+        self.latencies.append(seconds)
+        self.count += 1
+
+    def summary(self, buckets):
+        ordered = sorted(self.latencies)
+        n = len(ordered)
+        counts = [0] * (len(buckets) + 1)
+        for seconds in ordered:
+            counts[bisect.bisect_left(buckets, seconds)] += 1
+        labels = [f'<={1000 * bound:g}' for bound in buckets] + [f'>{1000 * buckets[-1]:g}']
+        return {
+            'count': self.count,
+            'window': n,
+            'mean_ms': 1000 * sum(ordered) / n,
+            'p50_ms': 1000 * ordered[n // 2],
+            'p90_ms': 1000 * ordered[min(n - 1, int(n * 0.9))],
+            'p99_ms': 1000 * ordered[min(n - 1, int(n * 0.99))],
+            'max_ms': 1000 * ordered[-1],
+            'buckets_ms': dict(zip(labels, counts)),
+        }
+
+
+class StackSampler:
+    # a background thread that takes the stack of the thread running the cycle every interval seconds and
+    # counts each distinct one - cheap enough to run on every cycle, unlike a profiler tracing every call
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread_id = None
+        self.samples = dict()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                frame = sys._current_frames().get(self.thread_id) if self.thread_id is not None else None
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        with self.lock:
+            self.thread_id = threading.get_ident()
+            self.samples = dict()
+
+    def stop(self):
+        # the stacks sampled since start, as {folded stack: samples}
+        with self.lock:
+            self.thread_id = None
+            return self.samples
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class Recorder:
+    # histograms are keyed by (name, strategy, pair). Spans ending while a cycle runs are also listed against
+    # that cycle, including order sends on the dispatcher's threads. With profile_slowest every cycle's stack
+    # is sampled and the samples of the slowest are kept.
+    def __init__(self, path, history=1000, profile_slowest=0, sample_interval=0.005, buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)):
+        self.path = path
+        self.history = history
+        self.profile_slowest = profile_slowest
+        self.sampler = StackSampler(sample_interval) if profile_slowest else None
+        self.buckets = list(buckets)
+        self.histograms = dict()
+        self.lock = threading.Lock()
+        self.cycle_ids = itertools.count(1)
+        self.cycle_id = None
+        self.cycle_label = None
+        self.cycle_spans = []
+        self.slowest = []
+
+    def record(self, key, seconds):
+        name, strategy, pair = key
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.history)
+            histogram.add(seconds)
+            if self.cycle_id is not None:
+                self.cycle_spans.append({'name': name, 'strategy': strategy, 'pair': pair, 'ms': 1000 * seconds})
+
+    def start_cycle(self, label):
+        self.cycle_id = next(self.cycle_ids)
+        self.cycle_label = label
+        self.cycle_spans = []
+        if self.sampler:
+            self.sampler.start()
+
+    def end_cycle(self, seconds):
+        # the slowest cycles keep their spans and their sampled stacks, in a folded stacks file next to the
+        # metrics that flame graph tools read
+        samples = self.sampler.stop() if self.sampler else None
+        cycle = {'cycle': self.cycle_id, 'label': self.cycle_label, 'ms': 1000 * seconds, 'spans': self.cycle_spans}
+        if self.profile_slowest:
+            if len(self.slowest) < self.profile_slowest or seconds > self.slowest[0][0]:
+                if samples:
+                    cycle['profile'] = os.path.join(os.path.dirname(self.path) or '.', f'cycle_{self.cycle_id}.folded')
+                    os.makedirs(os.path.dirname(cycle['profile']) or '.', exist_ok=True)
+                    with open(cycle['profile'], 'w') as profile_file:
+                        for stack, count in sorted(samples.items()):
+                            profile_file.write(f'{stack} {count}\n')
+                heapq.heappush(self.slowest, (seconds, self.cycle_id, cycle))
+                if len(self.slowest) > self.profile_slowest:
+                    _, _, dropped = heapq.heappop(self.slowest)
+                    if dropped.get('profile') and os.path.exists(dropped['profile']):
+                        os.remove(dropped['profile'])
+        self.record(('cycle', self.cycle_label, None), seconds)
+        self.cycle_id = None
+        self.export()
+
+    def export(self):
+        with self.lock:
+            spans = [
+                dict(name=name, strategy=strategy, pair=pair, **histogram.summary(self.buckets))
+                for (name, strategy, pair), histogram in sorted(self.histograms.items(), key=lambda item: tuple(str(label) for label in item[0]))
+            ]
+        metrics = {
+            'generated': time.time(),
+            'spans': spans,
+            'slowest_cycles': [cycle for _, _, cycle in sorted(self.slowest, reverse=True)],
+        }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as json_file:
+            json.dump(metrics, json_file, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Cycle:
+    def __init__(self, recorder, label):
+        self.recorder = recorder
+        self.label = label
+
+    def __enter__(self):
+        self.recorder.start_cycle(self.label)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.end_cycle(time.perf_counter() - self.start)
+        return False
+
+
+def enable(path, history=1000, profile_slowest=0, sample_interval=0.005):
+    global recorder
+    disable()
+    recorder = Recorder(path, history, profile_slowest, sample_interval)
+    return recorder
+
+
+def disable():
+    global recorder
+    if recorder is not None and recorder.sampler:
+        recorder.sampler.close()
+    recorder = None
+
+
+def span(name, strategy=None, pair=None):
+    if recorder is None:
+        return null_span
+    return Span(recorder, (name, strategy, pair))
+
+
+def cycle(label):
+    # wraps one whole trading cycle, spans ending inside it are listed against it
+    if recorder is None:
+        return null_span
+    return Cycle(recorder, label)
@@ -0,0 +1,205 @@
+import csv
+import heapq
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+import backtester
+import constants
+import keys
+import rates
+import signals
+import strategy
+from backtester import Backtester
+
+results_dir = 'results'
+default_percentiles = (5, 25, 50, 75, 95)
+
+
+def symbol_point(pair):
+    # smallest price increment - 3 digit quotes for yen pairs, 5 digits otherwise
+    return 0.001 if 'JPY' in pair else 0.00001
+
+
+def draw_costs(rng, paths, entry_idx, spreads, bar_std, bar_msc, strategy, point, latency_ms, spread_jitter):
+    # every random variate for every path is drawn here in one go, as (paths, positions) arrays of
+    # adverse price moves on the entry and exit fills
+    shape = (paths, len(entry_idx))
+    probability = strategy.get('slippage_probability', 0.1)
+    low_ticks, high_ticks = strategy.get('slippageTicks', (1, 3))
+
+    # slippage - with the strategy's probability an order fills a few ticks worse
+    entry_slip = rng.integers(low_ticks, high_ticks + 1, shape) * (rng.random(shape) < probability) * point
+    exit_slip = rng.integers(low_ticks, high_ticks + 1, shape) * (rng.random(shape) < probability) * point
+
+    # spread - paid on entry, the bar's recorded spread scaled by a lognormal factor with mean 1
+    spread = spreads[entry_idx] * point * np.exp(rng.normal(0.0, spread_jitter, shape) - spread_jitter ** 2 / 2)
+
+    # latency - the price drifts by a random walk over the delay between the signal and the fill
+    entry_drift = np.zeros(shape)
+    exit_drift = np.zeros(shape)
+    if latency_ms > 0 and bar_msc > 0:
+        entry_drift = bar_std * np.sqrt(rng.exponential(latency_ms, shape) / bar_msc) * rng.standard_normal(shape)
+        exit_drift = bar_std * np.sqrt(rng.exponential(latency_ms, shape) / bar_msc) * rng.standard_normal(shape)
+
+    return entry_slip + spread + entry_drift, exit_slip - exit_drift
+
+
+def realized_sizes(entry_idx, exit_idx, closed, entry_price, exit_price, pip_values, strategy):
+    # each position is sized from the balance before its entry bar as path_equity books it - the initial
+    # balance plus the profit of the positions that exited on earlier bars. The backtest engines size from
+    # their own equity curve instead, so the noise free path is not their curve.
+    pip_values = np.asarray(pip_values, dtype=float)
+    sizes = np.zeros(len(entry_idx))
+    balance = float(strategy['initialBalance'])
+    leaving = []
+    for n, i in enumerate(entry_idx):
+        while leaving and leaving[0][0] < i:
+            balance += heapq.heappop(leaving)[1]
+        sizes[n] = Backtester.calc_lot_size(balance, pip_values[i], strategy)
+        if closed[n]:
+            heapq.heappush(leaving, (exit_idx[n], sizes[n] * (exit_price[n] - entry_price[n])))
+    return sizes
+
+
+def path_equity(close, entry_idx, exit_idx, closed, sizes, entry_fill, exit_fill, initial_balance, block=4096):
+    # equity of every path, marked to market like the portfolio pass - floating while open, realized from
+    # the exit bar on. Sums over positions are running sums in entry and exit order, so the equity at a bar
+    # only needs the number of positions entered and exited by then. Bars are yielded in blocks so
+    # (paths, bars) never has to be held at once.
+    n = len(close)
+    exit_key = np.where(closed, exit_idx, n)
+    exit_order = np.argsort(exit_key, kind='stable')
+    exit_sorted = exit_key[exit_order]
+
+    entered_size = np.concatenate(([0.0], np.cumsum(sizes)))
+    exited_size = np.concatenate(([0.0], np.cumsum(sizes[exit_order])))
+    paths = entry_fill.shape[0]
+    entered_cost = np.concatenate((np.zeros((paths, 1)), np.cumsum(sizes * entry_fill, axis=1)), axis=1)
+    exited_value = np.concatenate((np.zeros((paths, 1)), np.cumsum((sizes * exit_fill)[:, exit_order], axis=1)), axis=1)
+
+    for start in range(0, n, block):
+        bars = np.arange(start, min(start + block, n))
+        entered = np.searchsorted(entry_idx, bars, side='right')
+        exited = np.searchsorted(exit_sorted, bars, side='right')
+        open_size = entered_size[entered] - exited_size[exited]
+        yield bars, initial_balance + close[bars] * open_size - entered_cost[:, entered] + exited_value[:, exited]
+
+
+def simulate_paths(pair, data, strategy, paths=1000, seed=0, rate_provider=None, latency_ms=None, spread_jitter=0.25,
+                   percentiles=default_percentiles, band_points=2000, tick_store=None):
+    # runs paths seeded slippage, spread and latency scenarios over one set of signals and exits.
+    # Position sizes come from the noise free run, so the paths differ only in their fill prices, and that run
+    # is returned as the baseline.
+    # Percentile bands are taken at up to band_points evenly spaced bars, drawdowns use every bar.
+    close = data['close'].to_numpy(dtype=float)
+    times = data['time'].to_numpy(dtype='datetime64[ns]')
+    spreads = data['spread'].to_numpy(dtype=float) if 'spread' in data else np.zeros(len(close))
+
+    indicators = Backtester.calc_indicators(close, strategy)
+    entries, exits = Backtester.generate_signals(signals.price_columns(data), indicators, strategy)
+    mask = Backtester.trading_hours_mask(times)
+    intrabar = Backtester.intrabar_fills(pair, data, mask, strategy, tick_store)
+    close, times, entries, exits, spreads = close[mask], times[mask], entries[mask], exits[mask], spreads[mask]
+
+    entry_idx = np.flatnonzero(entries)
+    exit_idx, closed, exit_price = Backtester.find_exits(close, entry_idx, exits, float(strategy['takeProfit']), float(strategy['stopLoss']), intrabar)
+    pip_values = Backtester.calc_pip_values(pair, times, entries, strategy, rate_provider)
+    sizes = realized_sizes(entry_idx, exit_idx, closed, close[entry_idx], exit_price, pip_values, strategy)
+
+    bar_seconds = np.diff(times.astype('datetime64[s]').astype(np.int64))
+    bar_msc = int(np.min(bar_seconds)) * 1000 if len(bar_seconds) else 0
+    bar_std = float(np.std(np.diff(close))) if len(close) > 1 else 0.0
+    if latency_ms is None:
+        latency_ms = strategy.get('latencyMs', 0)
+
+    rng = np.random.default_rng(seed)
+    entry_cost, exit_cost = draw_costs(rng, paths, entry_idx, spreads, bar_std, bar_msc, strategy, symbol_point(pair), latency_ms, spread_jitter)
+    entry_fill = close[entry_idx] + entry_cost
+    exit_fill = exit_price - exit_cost
+
+    band_idx = np.unique(np.linspace(0, len(close) - 1, min(band_points, len(close))).astype(np.int64))
+    bands = np.empty((len(percentiles), len(band_idx)))
+    peaks = np.full(paths, -np.inf)
+    max_drawdowns = np.zeros(paths)
+    final_equity = np.full(paths, float(strategy['initialBalance']))
+    for bars, equity in path_equity(close, entry_idx, exit_idx, closed, sizes, entry_fill, exit_fill, strategy['initialBalance']):
+        in_block = (band_idx >= bars[0]) & (band_idx <= bars[-1])
+        bands[:, in_block] = np.percentile(equity[:, band_idx[in_block] - bars[0]], percentiles, axis=0)
+        block_peaks = np.maximum(peaks[:, None], np.maximum.accumulate(equity, axis=1))
+        max_drawdowns = np.maximum(max_drawdowns, np.max((block_peaks - equity) / block_peaks, axis=1))
+        peaks = block_peaks[:, -1]
+        final_equity = equity[:, -1]
+
+    # the same positions filled at the signal prices, for comparison with the bands
+    baseline = np.empty(len(close))
+    for bars, equity in path_equity(close, entry_idx, exit_idx, closed, sizes, close[entry_idx][None, :], exit_price[None, :], strategy['initialBalance']):
+        baseline[bars] = equity[0]
+
+    return {
+        'times': times,
+        'percentiles': percentiles,
+        'band_idx': band_idx,
+        'bands': bands,
+        'baseline': baseline,
+        'final_equity': final_equity,
+        'max_drawdowns': max_drawdowns,
+        'positions': len(entry_idx),
+    }
+
+
+def summarize(pair, result, initial_balance):
+    # one row per pair with the spread of outcomes across paths
+    returns = 100 * (result['final_equity'] - initial_balance) / initial_balance
+    drawdowns = 100 * result['max_drawdowns']
+    row = {'pair': pair, 'paths': len(returns), 'positions': result['positions'],
+           'baseline_return_pct': float(100 * (result['baseline'][-1] - initial_balance) / initial_balance) if len(result['baseline']) else 0.0}
+    for p in result['percentiles']:
+        row[f'return_pct_p{p}'] = float(np.percentile(returns, p))
+    for p in result['percentiles']:
+        row[f'max_drawdown_pct_p{p}'] = float(np.percentile(drawdowns, p))
+    return row
+
+
+def run(current_strategy, pair_data, paths=1000, seed=0, rate_provider=None):
+    os.makedirs(results_dir, exist_ok=True)
+    run_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    results_path = os.path.join(results_dir, f"montecarlo_{current_strategy['strategy_name']}_{run_time}.csv")
+
+    rows = []
+    for pair, data in pair_data.items():
+        result = simulate_paths(pair, data, current_strategy, paths, seed, rate_provider)
+        rows.append(summarize(pair, result, current_strategy['initialBalance']))
+        print(f"{pair} - {paths} paths, median return {rows[-1]['return_pct_p50']:.2f}%, "
+              f"95th percentile drawdown {rows[-1]['max_drawdown_pct_p95']:.2f}%")
+
+    with open(results_path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Results written to {results_path}")
+    return rows
+
+
+def main(strategy_name, paths=1000, seed=0):
+    mt5_connection = backtester.MT5Connection(keys.demoAccountNum, keys.demoPassword, keys.demoServer)
+    mt5_connection.connect()
+
+    current_strategy = strategy.load_strategy(strategy_name)
+    time_frame = constants.default_time_frame
+    start_date = datetime(2023, 1, 2)
+    end_date = datetime(2023, 12, 29)
+    pairs = current_strategy['pairs']
+
+    pair_data = {pair: mt5_connection.get_historical_data(pair, time_frame, start_date, end_date) for pair in pairs}
+    symbols = rates.conversion_symbols(pairs, current_strategy['account_currency'])
+    rate_provider = rates.HistoricalRateProvider.from_bar_store(mt5_connection.bar_store, symbols, time_frame, start_date, end_date)
+    mt5_connection.disconnect()
+
+    run(current_strategy, pair_data, paths, seed, rate_provider)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], *(int(arg) for arg in sys.argv[2:4]))
@@ -0,0 +1,190 @@
+import csv
+import itertools
+import json
+import os
+import sys
+from datetime import datetime
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import backtester
+import constants
+import keys
+import rates
+import signals
+import strategy
+from backtester import Backtester, IntrabarFills
+
+results_dir = 'results'
+result_columns = ['return_pct', 'max_drawdown_pct', 'trades']
+
+# per worker process state - price arrays attached from shared memory and indicators already calculated
+shared_arrays = dict()
+shared_blocks = []
+indicator_cache = dict()
+
+
+def load_sweep(sweep_name):
+    # a sweep maps dotted strategy keys to a list of values or a start/stop/step range, e.g.
+    # {"movingAverages.SMA.val": [10, 15, 20], "takeProfit": {"start": 200, "stop": 1000, "step": 100}}
+    with open(os.path.join(strategy.strategy_dir, sweep_name + '.json')) as json_file:
+        sweep = json.load(json_file)
+
+    ranges = dict()
+    for key, values in sweep.items():
+        if isinstance(values, dict):
+            values = np.arange(values['start'], values['stop'] + values['step'] / 2, values['step']).tolist()
+        ranges[key] = values
+    return ranges
+
+
+def apply_params(base_strategy, params):
+    current_strategy = strategy.thaw(base_strategy)
+    for key, value in params.items():
+        *parents, leaf = key.split('.')
+        target = current_strategy
+        for parent in parents:
+            target = target[parent]
+        target[leaf] = value
+    return current_strategy
+
+
+def share_array(array):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_arrays(shared):
+    # worker initializer - map the parent's price arrays instead of receiving a copy per job
+    for pair, specs in shared.items():
+        arrays = []
+        for name, shape, dtype in specs:
+            block = shared_memory.SharedMemory(name=name)
+            shared_blocks.append(block)
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        shared_arrays[pair] = arrays
+
+
+def get_indicator(pair, close, function, period):
+    key = (pair, function, period)
+    if key not in indicator_cache:
+        indicator_cache[key] = np.asarray(constants.movingAveragesFunctions[function](close, period), dtype=float)
+    return indicator_cache[key]
+
+
+def run_combo(args):
+    base_strategy, keys_order, values = args
+    params = dict(zip(keys_order, values))
+    current_strategy = apply_params(base_strategy, params)
+
+    profit = 0.0
+    worst_drawdown = 0.0
+    trade_count = 0
+    compiled = signals.compile_strategy(current_strategy)
+    for pair, (*prices, mask, pip_values, times_msc) in shared_arrays.items():
+        columns = dict(zip(signals.price_fields, prices))
+        close = columns['close']
+        indicators = {key: get_indicator(pair, close, spec['function'], spec['val']) for key, spec in compiled.indicators.items()}
+        entries, exits = compiled.signals(columns, indicators)
+        # fills inside the bars as the backtest does for fillMode ohlc
+        intrabar = None
+        if current_strategy.get('fillMode', 'close') != 'close':
+            bar_msc = int(np.min(np.diff(times_msc))) if len(times_msc) > 1 else 0
+            intrabar = IntrabarFills(columns['open'][mask], columns['high'][mask], columns['low'][mask], times_msc[mask], bar_msc,
+                                     current_strategy.get('intrabarPriority', 'stop'), None, pair)
+        equity_curve, trades = Backtester.simulate_positions(close[mask], entries[mask], exits[mask], current_strategy, pip_values[mask], intrabar)
+
+        if len(equity_curve):
+            profit += equity_curve[-1] - current_strategy['initialBalance']
+        worst_drawdown = max(worst_drawdown, Backtester.max_drawdown(equity_curve))
+        trade_count += int(trades['closed'].sum())
+
+    result = {
+        'return_pct': 100 * profit / current_strategy['initialBalance'],
+        'max_drawdown_pct': 100 * worst_drawdown,
+        'trades': trade_count,
+    }
+    return params, result
+
+
+def sweep(base_strategy, ranges, pair_data, rate_provider=None, processes=None, chunksize=64):
+    os.makedirs(results_dir, exist_ok=True)
+    run_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    results_path = os.path.join(results_dir, f"sweep_{base_strategy['strategy_name']}_{run_time}.csv")
+    keys_order = list(ranges)
+
+    # the workers have no tick store, so a sweep could only fill from the bars what the backtest fills from ticks
+    fill_modes = set(ranges.get('fillMode', ())) | {base_strategy.get('fillMode', 'close')}
+    if 'tick' in fill_modes:
+        raise ValueError("Sweeps fill stop loss and take profit from bars, fillMode tick needs the backtest")
+
+    # put each pair's prices, trading hours mask, pip value per bar and bar times in shared memory once
+    blocks = []
+    shared = dict()
+    for pair, data in pair_data.items():
+        prices = [data[field].to_numpy(dtype=float) for field in signals.price_fields]
+        times = data['time'].to_numpy(dtype='datetime64[ns]')
+        mask = Backtester.trading_hours_mask(times)
+        pip_values = Backtester.calc_pip_values(pair, times, np.ones(len(times), dtype=bool), base_strategy, rate_provider)
+        times_msc = times.astype('datetime64[ms]').astype(np.int64)
+        specs = []
+        for array in (*prices, mask, pip_values, times_msc):
+            block, spec = share_array(array)
+            blocks.append(block)
+            specs.append(spec)
+        shared[pair] = specs
+
+    rows = []
+    try:
+        jobs = ((base_strategy, keys_order, values) for values in itertools.product(*ranges.values()))
+        with Pool(processes, initializer=attach_arrays, initargs=(shared,)) as pool, open(results_path, 'w', newline='') as csv_file:
+            # results are written as they arrive so a long sweep can be inspected or resumed from the file
+            writer = csv.writer(csv_file)
+            writer.writerow(keys_order + result_columns)
+            for params, result in pool.imap_unordered(run_combo, jobs, chunksize):
+                row = [params[k] for k in keys_order] + [result[c] for c in result_columns]
+                writer.writerow(row)
+                csv_file.flush()
+                rows.append(row)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    # rank by return, then by the smaller drawdown
+    rows.sort(key=lambda row: (-row[len(keys_order)], row[len(keys_order) + 1]))
+    ranked_path = results_path.replace('.csv', '_ranked.csv')
+    with open(ranked_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['rank'] + keys_order + result_columns)
+        for rank, row in enumerate(rows, start=1):
+            writer.writerow([rank] + row)
+
+    print(f"Sweep of {len(rows)} combinations written to {ranked_path}")
+    return ranked_path
+
+
+def main(strategy_name, sweep_name):
+    mt5_connection = backtester.MT5Connection(keys.demoAccountNum, keys.demoPassword, keys.demoServer)
+    mt5_connection.connect()
+
+    current_strategy = strategy.load_strategy(strategy_name)
+    ranges = load_sweep(sweep_name)
+    time_frame = constants.default_time_frame
+    start_date = datetime(2023, 1, 2)
+    end_date = datetime(2023, 12, 29)
+    pairs = current_strategy['pairs']
+
+    # everything that needs the terminal is loaded once, conversion rates come from the cached bars
+    pair_data = {pair: mt5_connection.get_historical_data(pair, time_frame, start_date, end_date) for pair in pairs}
+    symbols = rates.conversion_symbols(pairs, current_strategy['account_currency'])
+    rate_provider = rates.HistoricalRateProvider.from_bar_store(mt5_connection.bar_store, symbols, time_frame, start_date, end_date)
+    mt5_connection.disconnect()
+
+    sweep(current_strategy, ranges, pair_data, rate_provider)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# retcodes that mean the price moved - the order is re-priced from a fresh tick and sent again
+retry_retcodes = ('TRADE_RETCODE_REQUOTE', 'TRADE_RETCODE_PRICE_CHANGED', 'TRADE_RETCODE_PRICE_OFF')
+
+
+class RateLimiter:
+    # token bucket allowing rate orders per second with bursts of up to burst orders
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class OrderDispatcher:
+    def __init__(self, broker, max_workers=8, orders_per_second=None, max_retries=3, retry_delay=0.05, history=1000):
+        self.broker = broker
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='orders')
+        self.rate_limiter = RateLimiter(orders_per_second) if orders_per_second else None
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retry_codes = {getattr(broker, name) for name in retry_retcodes}
+        self.symbols = dict()
+        self.symbols_lock = threading.Lock()
+        self.order_latencies = deque(maxlen=history)
+        self.batch_latencies = deque(maxlen=history)
+
+    def symbol_info(self, symbol):
+        # symbol metadata hardly ever changes, so it is looked up and switched on once per symbol
+        with self.symbols_lock:
+            if symbol not in self.symbols:
+                info = self.broker.symbol_info(symbol)
+                if info is None:
+                    print(symbol, "not found")
+                    return None
+                if not info.visible:
+                    print(symbol, "is not visible, trying to switch on")
+                    if not self.broker.symbol_select(symbol, True):
+                        print(f"symbol_select({symbol}) failed")
+                        return None
+                self.symbols[symbol] = info
+            return self.symbols[symbol]
+
+    def reprice(self, request):
+        # move the price to the current tick, keeping stop loss and take profit the same distance away
+        tick = self.broker.symbol_info_tick(request['symbol'])
+        if tick is None:
+            return request
+        price = tick.ask if request['type'] == self.broker.ORDER_TYPE_BUY else tick.bid
+        shift = price - request['price']
+        request = dict(request, price=price)
+        for level in ('sl', 'tp'):
+            if request.get(level):
+                request[level] += shift
+        return request
+
+    def send(self, request, strategy=None):
+        # strategy only labels the latency span
+        start = time.perf_counter()
+        result = None
+        with metrics.span('order_send', strategy, request['symbol']):
+            for attempt in range(self.max_retries + 1):
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                result = self.broker.order_send(request)
+                if result is None or result.retcode not in self.retry_codes or attempt == self.max_retries:
+                    break
+                print(f"Order on {request['symbol']} requoted ({result.retcode}), retrying")
+                time.sleep(self.retry_delay)
+                request = self.reprice(request)
+        self.order_latencies.append(time.perf_counter() - start)
+        return request, result
+
+    def send_batch(self, requests, strategy=None):
+        # independent orders go out together, results come back in the same order as the requests
+        start = time.perf_counter()
+        results = list(self.pool.map(self.send, requests, [strategy] * len(requests)))
+        self.batch_latencies.append(time.perf_counter() - start)
+        return results
+
+    def latency_stats(self):
+        stats = dict()
+        for name, latencies in (('order', self.order_latencies), ('batch', self.batch_latencies)):
+            if latencies:
+                ordered = sorted(latencies)
+                stats[name] = {
+                    'count': len(ordered),
+                    'mean': sum(ordered) / len(ordered),
+                    'p50': ordered[len(ordered) // 2],
+                    'max': ordered[-1],
+                }
+        return stats
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+import results
+
+# simulated positions kept as one preallocated array per field, so checking stops and marking to market
+# is a few array operations per bar however many positions are open
+
+BUY = 1
+SELL = -1
+
+
+class TradeLedger:
+    # append only record of positions in the layout of results.ledger_fields, grown by doubling
+    fields = results.ledger_fields
+
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.fields.items()}
+
+    def append(self, **columns):
+        added = len(columns['size'])
+        if self.count + added > len(self.arrays['size']):
+            capacity = max(2 * len(self.arrays['size']), self.count + added)
+            for name, array in self.arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self.count] = array[:self.count]
+                self.arrays[name] = grown
+        for name, values in columns.items():
+            self.arrays[name][self.count:self.count + added] = values
+        self.count += added
+
+    def __len__(self):
+        return self.count
+
+    def to_frame(self):
+        # positions are appended as they close, the frame is in entry order like the other engines' ledgers
+        frame = pd.DataFrame({name: array[:self.count] for name, array in self.arrays.items()})
+        return frame.sort_values('entry_time', kind='stable', ignore_index=True)
+
+
+class PositionBook:
+    # open positions live in the first count slots of every array, closing one moves the rest down
+    fields = {
+        'side': np.int8,
+        'size': float,
+        'entry_price': float,
+        'stop_loss': float,
+        'take_profit': float,
+        'open_time': 'datetime64[ns]',
+    }
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.fields.items()}
+        self.ledger = TradeLedger()
+
+    def __len__(self):
+        return self.count
+
+    def __getattr__(self, name):
+        # the open part of a field, e.g. book.entry_price
+        arrays = self.__dict__.get('arrays')
+        if arrays is not None and name in arrays:
+            return arrays[name][:self.count]
+        raise AttributeError(name)
+
+    def open(self, entry_price, size, stop_loss, take_profit, open_time, side=BUY):
+        # stop_loss and take_profit are price levels
+        if self.count == len(self.arrays['size']):
+            for name, array in self.arrays.items():
+                grown = np.empty(2 * len(array), dtype=array.dtype)
+                grown[:self.count] = array
+                self.arrays[name] = grown
+        i = self.count
+        self.arrays['side'][i] = side
+        self.arrays['size'][i] = size
+        self.arrays['entry_price'][i] = entry_price
+        self.arrays['stop_loss'][i] = stop_loss
+        self.arrays['take_profit'][i] = take_profit
+        self.arrays['open_time'][i] = open_time
+        self.count += 1
+
+    def hits(self, price):
+        # positions whose stop loss or take profit the price has reached
+        side = self.side
+        return (side * (price - self.stop_loss) <= 0) | (side * (price - self.take_profit) >= 0)
+
+    def intrabar_fills(self, open, high, low, priority='stop'):
+        # positions whose stop loss or take profit was reached inside a bar and the price each fills at - with
+        # both inside the bar which came first is unknown, so priority decides. A bar that opens beyond a
+        # level fills at the open
+        side = self.side
+        long = side == BUY
+        stop_hit = np.where(long, low <= self.stop_loss, high >= self.stop_loss)
+        target_hit = np.where(long, high >= self.take_profit, low <= self.take_profit)
+        stopped = stop_hit & (~target_hit | (priority == 'stop'))
+        stop_fill = np.where(long, np.minimum(self.stop_loss, open), np.maximum(self.stop_loss, open))
+        target_fill = np.where(long, np.maximum(self.take_profit, open), np.minimum(self.take_profit, open))
+        return stop_hit | target_hit, np.where(stopped, stop_fill, target_fill)
+
+    def profits(self, price):
+        return self.side * (price - self.entry_price) * self.size
+
+    def mark(self, price):
+        # floating profit of every open position at price
+        return float(self.profits(price).sum()) if self.count else 0.0
+
+    def remove(self, mask):
+        keep = ~mask
+        remaining = int(keep.sum())
+        for name, array in self.arrays.items():
+            array[:remaining] = array[:self.count][keep]
+        self.count = remaining
+
+    def close(self, mask, price, close_time):
+        # closes the masked positions at price, or a price per open position, into the ledger - returns their
+        # profit per position
+        price = np.broadcast_to(np.asarray(price, dtype=float), (self.count,))
+        profits = self.profits(price)[mask]
+        if len(profits):
+            self.ledger.append(
+                entry_time=self.open_time[mask],
+                exit_time=close_time,
+                side=self.side[mask],
+                size=self.size[mask],
+                entry_price=self.entry_price[mask],
+                exit_price=price[mask],
+                profit=profits,
+                closed=True,
+            )
+            self.remove(mask)
+        return profits
+
+    def record_open(self, price, time):
+        # positions still open at the end of a backtest go into the ledger marked at price, unclosed
+        if self.count:
+            self.ledger.append(
+                entry_time=self.open_time,
+                exit_time=time,
+                side=self.side,
+                size=self.size,
+                entry_price=self.entry_price,
+                exit_price=price,
+                profit=self.profits(price),
+                closed=False,
+            )
+
+    def discard(self, mask):
+        # drops positions without a fill or ledger entry
+        if mask.any():
+            self.remove(mask)
@@ -0,0 +1,145 @@
+import csv
+import time
+
+import numpy as np
+
+import bar_cache
+
+# currencies quoted against the dollar as XXXUSD, everything else is USDXXX
+usd_base_currencies = ('EUR', 'GBP', 'AUD', 'NZD', 'XAU', 'XAG')
+
+
+def usd_symbol(currency):
+    if currency in usd_base_currencies:
+        return currency + 'USD'
+    return 'USD' + currency
+
+
+def conversion_symbols(pairs, account_currency):
+    # the symbols needed to convert every pair and the account currency through the dollar
+    currencies = {account_currency}
+    for pair in pairs:
+        currencies.update((pair[0:3], pair[3:6]))
+    return sorted(set(pairs) | {usd_symbol(c) for c in currencies if c != 'USD'})
+
+
+def epoch_seconds(timestamps):
+    values = np.asarray(timestamps)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[s]').astype(np.int64)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.int64)
+    return np.vectorize(bar_cache.to_epoch, otypes=[np.int64])(values)
+
+
+class RateProvider:
+    def rate(self, base, quote, timestamp=None):
+        raise NotImplementedError
+
+    def rates(self, base, quote, timestamps):
+        return np.array([self.rate(base, quote, t) for t in timestamps], dtype=float)
+
+    def pip_value(self, symbol, account_currency, timestamp=None):
+        symbol_1 = symbol[0:3]
+        symbol_2 = symbol[3:6]
+        return self.rate(symbol_2, account_currency, timestamp) * self.rate(symbol_1, symbol_2, timestamp)
+
+    def pip_values(self, symbol, account_currency, timestamps):
+        symbol_1 = symbol[0:3]
+        symbol_2 = symbol[3:6]
+        return self.rates(symbol_2, account_currency, timestamps) * self.rates(symbol_1, symbol_2, timestamps)
+
+
+class LiveRateProvider(RateProvider):
+    # live rates from forex_python, kept in memory for ttl seconds
+    def __init__(self, ttl=300, clock=time.monotonic):
+        from forex_python.converter import CurrencyRates
+        self.currency_rates = CurrencyRates()
+        self.ttl = ttl
+        self.clock = clock
+        self.cache = dict()
+
+    def rate(self, base, quote, timestamp=None):
+        if base == quote:
+            return 1.0
+        cached = self.cache.get((base, quote))
+        now = self.clock()
+        if cached is None or now - cached[1] > self.ttl:
+            cached = (float(self.currency_rates.convert(base, quote, 1)), now)
+            self.cache[(base, quote)] = cached
+        return cached[0]
+
+    def rates(self, base, quote, timestamps):
+        return np.full(len(timestamps), self.rate(base, quote))
+
+
+class StaticRateProvider(RateProvider):
+    # fixed rates keyed by symbol, e.g. {'GBPUSD': 1.27} - fully offline
+    def __init__(self, symbol_rates):
+        self.symbol_rates = symbol_rates
+
+    def rate(self, base, quote, timestamp=None):
+        if base == quote:
+            return 1.0
+        if base + quote in self.symbol_rates:
+            return float(self.symbol_rates[base + quote])
+        if quote + base in self.symbol_rates:
+            return 1.0 / float(self.symbol_rates[quote + base])
+        if 'USD' in (base, quote):
+            raise KeyError(f'no rate for {base}{quote}')
+        return self.rate(base, 'USD') * self.rate('USD', quote)
+
+    def rates(self, base, quote, timestamps):
+        return np.full(len(timestamps), self.rate(base, quote))
+
+
+class HistoricalRateProvider(RateProvider):
+    # preloaded rate history per symbol, looked up by the last rate at or before a timestamp
+    def __init__(self, symbol_rates):
+        self.table = dict()
+        for symbol, (times, values) in symbol_rates.items():
+            times = epoch_seconds(times)
+            order = np.argsort(times, kind='stable')
+            self.table[symbol] = (times[order], np.asarray(values, dtype=float)[order])
+
+    @classmethod
+    def from_bar_store(cls, bar_store, symbols, time_frame, start_date, end_date):
+        symbol_rates = dict()
+        for symbol in symbols:
+            bars = bar_store.copy_rates_range(symbol, time_frame, start_date, end_date)
+            if bars is not None and len(bars):
+                symbol_rates[symbol] = (bars['time'], bars['close'])
+        return cls(symbol_rates)
+
+    @classmethod
+    def from_csv(cls, path):
+        # csv with a header of time,symbol,rate where time is epoch seconds
+        columns = dict()
+        with open(path, newline='') as csv_file:
+            for row in csv.DictReader(csv_file):
+                times, values = columns.setdefault(row['symbol'], ([], []))
+                times.append(int(float(row['time'])))
+                values.append(float(row['rate']))
+        return cls({symbol: (np.array(times), np.array(values)) for symbol, (times, values) in columns.items()})
+
+    def lookup(self, symbol, seconds):
+        times, values = self.table[symbol]
+        idx = np.searchsorted(times, seconds, side='right') - 1
+        return values[np.maximum(idx, 0)]
+
+    def rates(self, base, quote, timestamps):
+        seconds = epoch_seconds(timestamps)
+        if base == quote:
+            return np.ones(len(seconds))
+        if base + quote in self.table:
+            return self.lookup(base + quote, seconds)
+        if quote + base in self.table:
+            return 1.0 / self.lookup(quote + base, seconds)
+        if 'USD' in (base, quote):
+            raise KeyError(f'no rate history for {base}{quote}')
+        return self.rates(base, 'USD', seconds) * self.rates('USD', quote, seconds)
+
+    def rate(self, base, quote, timestamp=None):
+        if timestamp is None:
+            raise ValueError('historical rates need a timestamp')
+        return float(self.rates(base, quote, [timestamp])[0])
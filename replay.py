@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import bar_cache
+import broker as broker_session
+import constants
+import fake_broker
+import orders
+import rates
+import resampler
+import results
+import strategy
+import synthetic
+import trader
+
+# replays the live trading loop - trader.Runtime as it is - against fake_broker.FakeBroker on a virtual clock,
+# so months of cycles run in minutes without a terminal. Each cycle's latency and the orders it sent are
+# kept, and the orders of two replays can be diffed to see what a change to the live path did.
+# BrokerRecorder sits between the trader and a real terminal and writes down what it answered, so a replay
+# can serve the bars and ticks that were seen live.
+
+
+def utc(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+
+class VirtualClock:
+    def __init__(self, start, end=None):
+        self.now = float(bar_cache.to_epoch(start))
+        self.end = None if end is None else bar_cache.to_epoch(end)
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, seconds):
+        # the scheduler's wait - time jumps straight to the next deadline, and stops once past the end
+        self.now += seconds
+        return self.end is not None and self.now > self.end
+
+
+def encode(value):
+    # broker responses as json - named tuples become dicts and rates arrays dicts of columns
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.ndarray) and value.dtype.names:
+        return {'rates': {name: value[name].tolist() for name in value.dtype.names}}
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, '_asdict'):
+        return encode(value._asdict())
+    if isinstance(value, dict):
+        return {str(key): encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if isinstance(value, datetime):
+        return bar_cache.to_epoch(value)
+    return str(value)
+
+
+class BrokerRecorder:
+    # stands in for the client of a BrokerSession, passing every call on and keeping it with its response -
+    # appended to a json lines file when given a path, otherwise in entries
+    recorded = ('account_info', 'positions_get', 'history_deals_get', 'copy_rates_range', 'symbol_info', 'symbol_info_tick', 'order_send')
+
+    def __init__(self, client, path=None, clock=time.time, calls=recorded):
+        self.client = client
+        self.path = path
+        self.clock = clock
+        self.calls = calls
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == 'client':
+            raise AttributeError(name)
+        attribute = getattr(self.client, name)
+        if name not in self.calls:
+            return attribute
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            self.write({'time': self.clock(), 'call': name, 'args': encode(args), 'kwargs': encode(kwargs), 'result': encode(result)})
+            return result
+        return call
+
+    def write(self, entry):
+        with self.lock:
+            if self.path is None:
+                self.entries.append(entry)
+                return
+            with open(self.path, 'a') as recording:
+                recording.write(json.dumps(entry) + '\n')
+
+
+def load_recording(path, client):
+    # the bars and ticks a recording saw, served by a fake broker - returns the time span it covers
+    bars = dict()
+    ticks = dict()
+    first = last = balance = None
+    with open(path) as recording:
+        for line in recording:
+            entry = json.loads(line)
+            first = entry['time'] if first is None else first
+            last = entry['time']
+            result = entry['result']
+            if not result:
+                continue
+            if entry['call'] == 'copy_rates_range':
+                symbol, time_frame = entry['args'][:2]
+                bars.setdefault((symbol, time_frame), []).append(bar_cache.to_rates(pd.DataFrame(result['rates'])))
+            elif entry['call'] == 'symbol_info_tick':
+                ticks.setdefault(entry['args'][0], []).append((result.get('time_msc', result['time'] * 1000), result['bid'], result['ask']))
+            elif entry['call'] == 'account_info' and balance is None:
+                balance = client.balance = result['balance']
+
+    for (symbol, time_frame), parts in bars.items():
+        # a bar downloaded while it was still forming is replaced by its later, final version
+        merged = np.concatenate(parts)
+        merged = merged[np.argsort(merged['time'], kind='stable')]
+        keep = np.ones(len(merged), dtype=bool)
+        keep[:-1] = merged['time'][1:] != merged['time'][:-1]
+        client.add_bars(symbol, time_frame, merged[keep])
+    for symbol, rows in ticks.items():
+        rows = np.array(rows)
+        client.add_ticks(symbol, rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2])
+    return first, last
+
+
+class ClockRateProvider(rates.HistoricalRateProvider):
+    # the trader asks for the current rate, which in a replay is the one at the virtual clock
+    def __init__(self, symbol_rates, clock):
+        super().__init__(symbol_rates)
+        self.clock = clock
+
+    def rate(self, base, quote, timestamp=None):
+        return super().rate(base, quote, self.clock() if timestamp is None else timestamp)
+
+    @classmethod
+    def from_broker(cls, client, clock):
+        # closes of the finest bars the fake broker has for every symbol
+        symbol_rates = dict()
+        for (symbol, time_frame), symbol_bars in sorted(client.bars.items(), key=lambda item: -item[0][1]):
+            symbol_rates[symbol] = (symbol_bars['time'], symbol_bars['close'])
+        return cls(symbol_rates, clock)
+
+
+def synthetic_broker(strategies, start, end, seed=0, warmup_days=14, ticks_per_bar=0):
+    # M1 bars for every pair and conversion symbol, each traded timeframe resampled from them so they agree
+    pairs = sorted({pair for current_strategy in strategies for pair in current_strategy['pairs']})
+    currencies = {current_strategy['account_currency'] for current_strategy in strategies}
+    symbols = sorted({symbol for currency in currencies for symbol in rates.conversion_symbols(pairs, currency)})
+    time_frames = {current_strategy.get('timeFrame', constants.default_time_frame) for current_strategy in strategies}
+
+    client = fake_broker.FakeBroker(balance=max(current_strategy['initialBalance'] for current_strategy in strategies))
+    for symbol in symbols:
+        base = synthetic.generate_rates(symbol, 1, start - timedelta(days=warmup_days), end, seed)
+        client.add_bars(symbol, 1, base)
+        for time_frame in time_frames - {1}:
+            client.add_bars(symbol, time_frame, resampler.resample(base, time_frame, 1))
+        if ticks_per_bar:
+            client.add_ticks(symbol, *synthetic.generate_ticks(base, 1, ticks_per_bar, seed))
+    return client
+
+
+def replay(strategies, client, start, end, rate_provider=None, settle=1, quiet=True):
+    # runs trader.Runtime from start till end with the trader's broker, clock, bar cache, risk state and
+    # rates swapped for simulated ones, then puts them back. Returns one row per cycle and every order sent.
+    clock = VirtualClock(start, end)
+    client.clock = clock
+    log = BrokerRecorder(client, clock=clock, calls=('order_send',))
+    saved = (trader.clock, trader.broker, trader.dispatcher, trader.bar_store, trader.risk_engines, constants.live_rates)
+
+    trader.clock = clock
+    trader.broker = broker_session.BrokerSession(0, '', '', log)
+    # one worker, so orders fill in the order they were decided and tickets are the same every replay
+    trader.dispatcher = orders.OrderDispatcher(trader.broker, max_workers=1)
+    trader.bar_store = bar_cache.BarStore(tempfile.mkdtemp(), lambda *args: trader.broker.copy_rates_range(*args), trader.current_seconds, constants.bar_cache_save_interval)
+    trader.risk_engines = dict()
+    constants.live_rates = rate_provider or ClockRateProvider.from_broker(client, clock)
+
+    # risk state is kept in memory, the live bot's saved state is left alone
+    runtime = trader.Runtime(strategies, clock, clock.wait, settle, risk_state_dir=None)
+    cycles = []
+    run_cycle = runtime.run_cycle
+
+    def timed_cycle(time_frame):
+        sent = len(log.entries)
+        cycle_start = time.perf_counter()
+        run_cycle(time_frame)
+        cycles.append({
+            'time': utc(clock.now).isoformat(),
+            'time_frame': time_frame,
+            'ms': 1000 * (time.perf_counter() - cycle_start),
+            'orders': len(log.entries) - sent,
+        })
+    runtime.run_cycle = timed_cycle
+
+    output = open(os.devnull, 'w') if quiet else None
+    try:
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            runtime.run()
+            trader.disconnect()
+            trader.dispatcher.shutdown()
+    finally:
+        if output:
+            output.close()
+        trader.clock, trader.broker, trader.dispatcher, trader.bar_store, trader.risk_engines, constants.live_rates = saved
+
+    decisions = [decision(entry) for entry in log.entries]
+    return {'cycles': cycles, 'decisions': decisions, 'halted': bool(runtime.halted), 'balance': client.balance}
+
+
+def decision(entry):
+    request, result = entry['args'][0], entry['result'] or dict()
+    return {
+        'time': utc(entry['time']).isoformat(),
+        'symbol': request['symbol'],
+        'action': 'close' if request.get('position') else 'open',
+        'type': request['type'],
+        'volume': request['volume'],
+        'price': result.get('price'),
+        'retcode': result.get('retcode'),
+    }
+
+
+def decision_key(decision):
+    # what was decided, not the fill or the tickets it got
+    return decision['symbol'], decision['action'], decision['type'], decision['volume']
+
+
+def diff_decisions(decisions, other):
+    # the times at which two replays sent different orders
+    by_time = dict()
+    for side, side_decisions in enumerate((decisions, other)):
+        for current in side_decisions:
+            by_time.setdefault(current['time'], ([], []))[side].append(decision_key(current))
+    diffs = []
+    for decision_time, (keys_a, keys_b) in sorted(by_time.items()):
+        if sorted(keys_a) != sorted(keys_b):
+            diffs.append({'time': decision_time, 'only_in_a': sorted(set(keys_a) - set(keys_b)), 'only_in_b': sorted(set(keys_b) - set(keys_a))})
+    return diffs
+
+
+def summarize(report, wall_seconds):
+    latencies = sorted(cycle['ms'] for cycle in report['cycles'])
+    n = len(latencies)
+    summary = {'cycles': n, 'orders': len(report['decisions']), 'halted': report['halted'], 'balance': report['balance'], 'wall_s': wall_seconds}
+    if n:
+        summary.update({
+            'p50_ms': latencies[n // 2],
+            'p90_ms': latencies[min(n - 1, int(n * 0.9))],
+            'p99_ms': latencies[min(n - 1, int(n * 0.99))],
+            'max_ms': latencies[-1],
+        })
+    return summary
+
+
+def save(report, run_dir):
+    # cycles.csv with the latency of every cycle and decisions.jsonl with every order sent
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, 'cycles.csv'), 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=['time', 'time_frame', 'ms', 'orders'])
+        writer.writeheader()
+        writer.writerows(report['cycles'])
+    with open(os.path.join(run_dir, 'decisions.jsonl'), 'w') as decisions_file:
+        for current in report['decisions']:
+            decisions_file.write(json.dumps(current) + '\n')
+
+
+def load_decisions(path):
+    with open(path) as decisions_file:
+        return [json.loads(line) for line in decisions_file]
+
+
+def record_live(strategies, path):
+    # trade live as usual, with every broker response appended to path for a later replay
+    import MetaTrader5 as mt5
+    trader.connect(BrokerRecorder(mt5, path))
+    trader.Runtime(strategies).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the live trading loop against a simulated broker")
+    parser.add_argument('strategies', nargs='+')
+    parser.add_argument('--start', default='2023-01-02', help="first day of a synthetic replay")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--recording', help="replay the bars and ticks of a BrokerRecorder file instead")
+    parser.add_argument('--record', help="trade live, recording broker responses to this file")
+    parser.add_argument('--compare', help="decisions.jsonl of an earlier replay to diff against")
+    args = parser.parse_args()
+
+    strategies = [strategy.load_strategy(name) for name in args.strategies]
+    if args.record:
+        record_live(strategies, args.record)
+        return
+
+    if args.recording:
+        client = fake_broker.FakeBroker()
+        first, last = load_recording(args.recording, client)
+        start, end = utc(first), utc(last)
+    else:
+        start = datetime.fromisoformat(args.start)
+        end = start + timedelta(days=args.days)
+        client = synthetic_broker(strategies, start, end, args.seed)
+
+    wall_start = time.perf_counter()
+    report = replay(strategies, client, start, end)
+    summary = summarize(report, time.perf_counter() - wall_start)
+    run_dir = os.path.join(results.results_dir, f"replay_{'+'.join(args.strategies)}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+    save(report, run_dir)
+
+    print(f"{summary['cycles']} cycles from {start} to {end} in {summary['wall_s']:.1f}s, {summary['orders']} orders, "
+          f"final balance {summary['balance']:.2f}{' (halted by drawdown)' if summary['halted'] else ''}")
+    if summary['cycles']:
+        print(f"cycle latency p50 {summary['p50_ms']:.2f}ms p90 {summary['p90_ms']:.2f}ms p99 {summary['p99_ms']:.2f}ms max {summary['max_ms']:.2f}ms")
+    if args.compare:
+        diffs = diff_decisions(load_decisions(args.compare), report['decisions'])
+        print(f"{len(diffs)} cycles decided differently from {args.compare}")
+        for diff in diffs[:20]:
+            print(f"  {diff['time']}: only before {diff['only_in_a']}, only now {diff['only_in_b']}")
+    print(f"Results written to {run_dir}")
+
+
+if __name__ == '__main__':
+    main()
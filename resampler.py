@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+import bar_cache
+
+# higher timeframe bars derived from one base series per symbol (e.g. M1) - incrementally as base bars
+# arrive for live trading, or in one pass over cached base bars for backtests
+
+week_offset = 3 * 86400 # weeks start on Sunday, epoch day 0 was a Thursday
+
+
+def bucket_starts(times, time_frame):
+    # start of the bar of time_frame each epoch second falls in
+    period = bar_cache.timeframe_seconds(time_frame)
+    if period is None:
+        raise ValueError(f"Timeframe {time_frame} has no fixed length to resample to")
+    offset = week_offset if time_frame >= 0x8000 else 0
+    return (times - offset) // period * period + offset
+
+
+def aggregate(rates, time_frame):
+    # one bar per bucket of time_frame, rates in time order
+    if len(rates) == 0:
+        return np.empty(0, dtype=bar_cache.rates_dtype)
+    starts = bucket_starts(rates['time'], time_frame)
+    first = np.flatnonzero(np.concatenate(([True], starts[1:] != starts[:-1])))
+    last = np.concatenate((first[1:], [len(rates)])) - 1
+
+    bars = np.empty(len(first), dtype=bar_cache.rates_dtype)
+    bars['time'] = starts[first]
+    bars['open'] = rates['open'][first]
+    bars['high'] = np.maximum.reduceat(rates['high'], first)
+    bars['low'] = np.minimum.reduceat(rates['low'], first)
+    bars['close'] = rates['close'][last]
+    bars['tick_volume'] = np.add.reduceat(rates['tick_volume'], first)
+    bars['spread'] = np.minimum.reduceat(rates['spread'], first)
+    bars['real_volume'] = np.add.reduceat(rates['real_volume'], first)
+    return bars
+
+
+def merge(bar, later):
+    # a bar continued by a later part of the same bucket
+    merged = bar.copy()
+    merged['high'] = max(bar['high'], later['high'])
+    merged['low'] = min(bar['low'], later['low'])
+    merged['close'] = later['close']
+    merged['tick_volume'] = bar['tick_volume'] + later['tick_volume']
+    merged['spread'] = min(bar['spread'], later['spread'])
+    merged['real_volume'] = bar['real_volume'] + later['real_volume']
+    return merged
+
+
+def is_complete(bar_time, time_frame, last_base_time, base_time_frame, now=None):
+    # a bar is complete once the base bar covering its last moment has closed, or the clock has passed its end
+    end = bar_time + bar_cache.timeframe_seconds(time_frame)
+    return end <= last_base_time + bar_cache.timeframe_seconds(base_time_frame) or (now is not None and end <= now)
+
+
+def resample(rates, time_frame, base_time_frame, now=None):
+    # batch mode - every complete bar of time_frame in a base series
+    rates = bar_cache.to_rates(rates)
+    bars = aggregate(rates, time_frame)
+    if len(bars) and not is_complete(bars['time'][-1], time_frame, rates['time'][-1], base_time_frame, now):
+        bars = bars[:-1]
+    return bars
+
+
+class RingBuffer:
+    # the last capacity bars, each written twice so the newest capacity are always one contiguous view
+    def __init__(self, capacity, dtype=bar_cache.rates_dtype):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=dtype)
+        self.head = 0
+        self.count = 0
+
+    def append(self, rows):
+        for row in rows[-self.capacity:]:
+            self.data[self.head] = row
+            self.data[self.head + self.capacity] = row
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def view(self, count=None):
+        count = self.count if count is None else min(count, self.count)
+        end = self.head + self.capacity
+        return self.data[end - count:end]
+
+    def __len__(self):
+        return self.count
+
+
+class Resampler:
+    def __init__(self, base_time_frame, capacities):
+        # capacities maps each derived timeframe to the number of complete bars kept for it
+        self.base_time_frame = base_time_frame
+        self.capacities = capacities
+        self.buffers = dict()
+        self.forming = dict()
+        self.last_base_time = dict()
+
+    def add_time_frame(self, time_frame, capacity):
+        # a new timeframe or a longer one needs more history than the buffers hold, so every symbol starts
+        # again from lookback_seconds() of base bars at its next update
+        if capacity > self.capacities.get(time_frame, 0):
+            self.capacities[time_frame] = capacity
+            self.last_base_time.clear()
+
+    def lookback_seconds(self):
+        # base history needed to fill every buffer, plus the bar still forming
+        return max(bar_cache.timeframe_seconds(time_frame) * (capacity + 1) for time_frame, capacity in self.capacities.items())
+
+    def last_time(self, symbol):
+        return self.last_base_time.get(symbol)
+
+    def update(self, symbol, rates, now=None):
+        # rates are closed base bars, anything already seen is skipped
+        rates = bar_cache.to_rates(rates)
+        last_time = self.last_base_time.get(symbol)
+        if last_time is not None:
+            rates = rates[rates['time'] > last_time]
+        else:
+            # a fresh start rebuilds every buffer of the symbol from the rates given
+            for key in [key for key in self.buffers if key[0] == symbol]:
+                del self.buffers[key]
+                self.forming.pop(key, None)
+        if len(rates):
+            last_time = self.last_base_time[symbol] = int(rates['time'][-1])
+        if last_time is None:
+            return
+
+        for time_frame, capacity in self.capacities.items():
+            key = (symbol, time_frame)
+            buffer = self.buffers.get(key)
+            if buffer is None or buffer.capacity != capacity:
+                resized = RingBuffer(capacity)
+                if buffer is not None:
+                    resized.append(buffer.view())
+                buffer = self.buffers[key] = resized
+            bars = aggregate(rates, time_frame)
+            forming = self.forming.pop(key, None)
+
+            if forming is not None:
+                if len(bars) and bars['time'][0] == forming['time']:
+                    bars[0] = merge(forming, bars[0])
+                elif len(bars):
+                    # a later bucket has started, so the forming bar is done
+                    buffer.append([forming])
+                else:
+                    # nothing new, the clock alone may have completed it
+                    bars = np.array([forming])
+            buffer.append(bars[:-1])
+            if len(bars):
+                last = bars[-1]
+                if is_complete(last['time'], time_frame, last_time, self.base_time_frame, now):
+                    buffer.append([last])
+                else:
+                    self.forming[key] = last.copy()
+
+    def bars(self, symbol, time_frame, count=None):
+        # the newest complete bars, oldest first - a view into the ring buffer
+        buffer = self.buffers.get((symbol, time_frame))
+        if buffer is None:
+            return np.empty(0, dtype=bar_cache.rates_dtype)
+        return buffer.view(count)
+
+    def frame(self, symbol, time_frame, count=None):
+        # the same frame get_data builds from a broker download
+        rates_frame = pd.DataFrame(self.bars(symbol, time_frame, count))
+        rates_frame['time'] = pd.to_datetime(rates_frame['time'], unit='s')
+        return rates_frame
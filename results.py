@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# backtest outputs - equity curves as float32 equity against int64 nanosecond timestamps and trade ledgers,
+# stored as parquet, and charts drawn off screen from curves cut down to about one point per pixel
+
+results_dir = 'results'
+graphs_dir = 'graphs'
+
+# the trade ledger every engine writes - one row per position in entry order, positions still open at the
+# end marked at the last close with closed False
+ledger_fields = {
+    'entry_time': 'datetime64[ns]',
+    'exit_time': 'datetime64[ns]',
+    'side': np.int8,
+    'size': float,
+    'entry_price': float,
+    'exit_price': float,
+    'profit': float,
+    'closed': bool,
+}
+
+
+def lttb(x, y, points):
+    # largest triangle three buckets - indices of the points that keep the shape of the line, always
+    # including the first and last
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    idx = np.empty(points, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # twice the triangle area between the last chosen point, each candidate and the next bucket's average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def time_values(times):
+    return np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+
+
+def downsample(times, values, points):
+    # times and values cut down to about points points, gaps (nan) are left out first
+    times = np.asarray(times, dtype='datetime64[ns]')
+    values = np.asarray(values, dtype=float)
+    keep = ~np.isnan(values)
+    times, values = times[keep], values[keep]
+    idx = lttb(time_values(times), values, points)
+    return times[idx], values[idx]
+
+
+def ledger_frame(**columns):
+    # columns of ledger_fields, the frame always has all of them in that order
+    return pd.DataFrame({name: np.asarray(columns[name], dtype=dtype) for name, dtype in ledger_fields.items()})
+
+
+def trade_ledger(times, trades):
+    # one row per position from the trades of Backtester.simulate_positions, which are all long
+    entry_idx, exit_idx = trades['entry_idx'], trades['exit_idx']
+    return ledger_frame(
+        entry_time=np.asarray(times, dtype='datetime64[ns]')[entry_idx],
+        exit_time=np.asarray(times, dtype='datetime64[ns]')[exit_idx],
+        side=np.ones(len(entry_idx)),
+        size=trades['size'],
+        entry_price=trades['entry_price'],
+        exit_price=trades['exit_price'],
+        profit=trades['size'] * (trades['exit_price'] - trades['entry_price']),
+        closed=trades['closed'],
+    )
+
+
+def equity_frame(times, equity, price=None):
+    columns = {'time': time_values(times), 'equity': np.asarray(equity, dtype=np.float32)}
+    if price is not None:
+        columns['price'] = np.asarray(price, dtype=np.float32)
+    return pd.DataFrame(columns)
+
+
+def save_equity(path, times, equity, price=None):
+    equity_frame(times, equity, price).to_parquet(path, index=False)
+
+
+def load_equity(path):
+    frame = pd.read_parquet(path)
+    frame['time'] = pd.to_datetime(frame['time'], unit='ns')
+    return frame
+
+
+def save_run(run_dir, equity_data, ledgers=None):
+    # {pair}.equity.parquet for every curve and {pair}.trades.parquet for every ledger given
+    os.makedirs(run_dir, exist_ok=True)
+    for curve in equity_data:
+        save_equity(os.path.join(run_dir, f"{curve['pair']}.equity.parquet"), curve['timestamps'], curve['equity'], curve.get('actual_price'))
+    for pair, ledger in (ledgers or dict()).items():
+        ledger.to_parquet(os.path.join(run_dir, f'{pair}.trades.parquet'), index=False)
+
+
+def render_equity_curves(path, equity_data, width=1600, height=900, dpi=100):
+    # drawn on an Agg canvas that belongs to the figure alone - no window and no pyplot state, so a sweep
+    # can draw any number of charts. Each line is downsampled to the chart's width in pixels first.
+    # matplotlib is imported here as it takes longer to load than everything else a backtest needs
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import DateFormatter
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax1 = fig.add_subplot()
+    ax2 = ax1.twinx()
+
+    for curve in equity_data:
+        pair = curve['pair']
+        if len(curve['timestamps']) != len(curve['equity']):
+            print(f"Error: Length mismatch for {pair}. Skipping...")
+            continue
+        times, equity = downsample(curve['timestamps'], curve['equity'], width)
+        ax1.plot(times, equity, label=f'Equity Curve - {pair}')
+        if curve.get('actual_price') is not None and not np.isnan(curve['actual_price']).all():
+            times, price = downsample(curve['timestamps'], curve['actual_price'], width)
+            ax2.plot(times, price, label=f'Actual Price - {pair}', color='green', alpha=0.6)
+
+    ax1.set_xlabel('Time')
+    ax1.set_ylabel('Equity (in Account Currency)', color='blue')
+    ax1.tick_params('y', colors='blue')
+    ax1.xaxis.set_major_formatter(DateFormatter('%d %b %H:%M'))
+    ax2.set_ylabel('Actual Price', color='green')
+    ax2.tick_params('y', colors='green')
+
+    ax1.legend(loc='upper left')
+    if ax2.lines:
+        ax2.legend(loc='upper right')
+    ax1.grid(True, linestyle='--', alpha=0.5)
+    ax1.minorticks_on()
+    ax1.grid(which='minor', linestyle=':', linewidth='0.5', alpha=0.5)
+
+    ax1.set_title('Backtest Equity Curves')
+    fig.tight_layout()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.savefig(path)
+    return path
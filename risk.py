@@ -0,0 +1,135 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+# running risk state of one strategy in the live trader - today's losing deals and realized profit, and the
+# equity high water mark and drawdown. Deals are taken in from the broker's history since the last one seen,
+# and only those with the strategy's magic number count, so the guards are
+# plain lookups that can be checked before every order. Losses and realized profit reset at the GMT day
+# boundary, and the state is saved so a restart carries on where it left off.
+
+
+def gmt_day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+def day_start(timestamp):
+    return int(timestamp) // 86400 * 86400
+
+
+class RiskEngine:
+    def __init__(self, path=None, clock=time.time, magic=None):
+        # magic None counts every deal on the account
+        self.path = path
+        self.clock = clock
+        self.magic = magic
+        self.day = None
+        self.lost_trades = 0
+        self.realized = 0.0
+        # realized profit since the state was started, which the strategy's equity is built on
+        self.total_realized = 0.0
+        # time of the newest deal taken in, and the tickets already counted today
+        self.cursor = None
+        self.seen = set()
+        self.equity = None
+        self.high_water = None
+        self.drawdown = 0.0
+        self.changed = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as state_file:
+            state = json.load(state_file)
+        self.day = state['day']
+        self.lost_trades = state['lost_trades']
+        self.realized = state['realized']
+        self.total_realized = state['total_realized']
+        self.cursor = state['cursor']
+        self.seen = set(state['seen'])
+        self.equity = state['equity']
+        self.high_water = state['high_water']
+        self.drawdown = state['drawdown']
+
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        state = {
+            'day': self.day,
+            'lost_trades': self.lost_trades,
+            'realized': self.realized,
+            'total_realized': self.total_realized,
+            'cursor': self.cursor,
+            'seen': sorted(self.seen),
+            'equity': self.equity,
+            'high_water': self.high_water,
+            'drawdown': self.drawdown,
+        }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump(state, state_file, indent=2)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def roll_day(self, now=None):
+        # a new GMT day starts the loss count and realized profit again
+        now = self.clock() if now is None else now
+        today = gmt_day(now)
+        if self.day != today:
+            self.day = today
+            self.lost_trades = 0
+            self.realized = 0.0
+            self.cursor = day_start(now)
+            self.seen = set()
+            self.changed = True
+
+    def add_deals(self, deals):
+        # deals as dicts - other strategies' deals, deals before today and those already counted are skipped
+        self.roll_day()
+        for deal in deals:
+            if self.magic is not None and deal.get('magic') != self.magic:
+                continue
+            if deal['ticket'] in self.seen or (deal.get('time') is not None and int(deal['time']) < day_start(self.clock())):
+                continue
+            self.seen.add(deal['ticket'])
+            profit = float(deal['profit']) + float(deal.get('commission', 0.0)) + float(deal.get('swap', 0.0))
+            self.realized += profit
+            self.total_realized += profit
+            if float(deal['profit']) < 0:
+                self.lost_trades += 1
+            if deal.get('time') is not None:
+                self.cursor = max(self.cursor, int(deal['time']))
+            self.changed = True
+
+    def deals_range(self):
+        # the deals to ask the broker for - from the second of the newest one seen on, as a deal at that same
+        # time may not have been there last time
+        now = self.clock()
+        self.roll_day(now)
+        date_from = datetime.fromtimestamp(self.cursor, timezone.utc).replace(tzinfo=None)
+        date_to = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        return date_from, date_to
+
+    def refresh(self, broker):
+        # only the deals since the newest one seen
+        self.add_deals([deal._asdict() for deal in broker.history_deals_get(*self.deals_range()) or ()])
+
+    def update_equity(self, initial_balance, positions):
+        # the strategy's equity - its initial balance, what it has realized and the floating profit of its
+        # open positions
+        equity = float(initial_balance) + self.total_realized + sum(float(position['profit']) for position in positions)
+        if equity == self.equity:
+            return
+        self.equity = equity
+        self.high_water = equity if self.high_water is None else max(self.high_water, equity)
+        self.drawdown = 1 - equity / self.high_water if self.high_water > 0 else 0.0
+        self.changed = True
+
+    def losses_exceeded(self, strategy):
+        return self.lost_trades > strategy['maxLosses']
+
+    def drawdown_breached(self, strategy):
+        # maximumDrawdown is the share of the equity high water mark below which trading stops
+        return self.high_water is not None and self.drawdown > 1 - strategy['maximumDrawdown']
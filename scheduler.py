@@ -0,0 +1,47 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Scheduler:
+    # runs jobs at fixed boundaries of the clock (e.g. every bar close), sleeping until the next deadline instead of polling
+    def __init__(self, clock=time.time, wait=None):
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.wait = wait or self.stop_event.wait
+        self.jobs = []
+        self.order = itertools.count()
+
+    def next_deadline(self, period, offset, now):
+        return (now - offset) // period * period + period + offset
+
+    def every(self, period, job, *args, offset=0):
+        # job runs each time the clock passes a multiple of period, plus offset seconds
+        deadline = self.next_deadline(period, offset, self.clock())
+        heapq.heappush(self.jobs, (deadline, next(self.order), period, offset, job, args))
+
+    def run_pending(self):
+        # run every job whose deadline has passed, returns the seconds until the next one
+        while self.jobs:
+            deadline, _, period, offset, job, args = self.jobs[0]
+            now = self.clock()
+            if deadline > now:
+                return deadline - now
+            heapq.heappop(self.jobs)
+            try:
+                job(*args)
+            except Exception as e:
+                print(f"{getattr(job, '__name__', job)} failed:", e)
+            # a job that overran its period skips the deadlines it missed
+            heapq.heappush(self.jobs, (self.next_deadline(period, offset, max(deadline, self.clock())), next(self.order), period, offset, job, args))
+        return None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            delay = self.run_pending()
+            if delay is None or self.wait(delay):
+                break
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,132 @@
+import json
+from collections.abc import Mapping
+
+import numpy as np
+
+import constants
+import indicators
+
+# a strategy's entry and exit rules compiled once into functions over numpy values - whole arrays for a
+# backtest or the latest bar's scalars when trading live, through the same comparisons either way.
+#
+# Without rules, each moving average's aboveBelow is a condition on the close: entry when every condition
+# holds and exit when every opposite one does. Rules can also be given explicitly, e.g.
+#   "entry": [{"left": "close", "op": ">", "right": "EMA"}, {"left": "close", "op": "<", "right": "SMA"}]
+#   "exit": {"any": [{"left": "close", "op": "<", "right": "EMA"}, {"left": "high", "op": ">=", "right": 1.3}]}
+# An operand is a price field, the name of one of the strategy's moving averages or a number. A list means
+# all of its conditions, and exit defaults to the opposite of every entry condition.
+
+price_fields = ('open', 'high', 'low', 'close')
+operators = {'>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal}
+opposites = {'>': '<', '<': '>', '>=': '<=', '<=': '>='}
+compiled_strategies = dict()
+
+
+def indicator_key(name, ma):
+    # averages with the same function and period share one key, and are calculated once
+    return f"{indicators.ma_function(name, ma)}_{ma['val']}"
+
+
+def above_below_rule(moving_averages):
+    return [
+        {'left': 'close', 'op': '>' if ma['aboveBelow'] == 'above' else '<', 'right': m}
+        for m, ma in moving_averages.items() if 'aboveBelow' in ma
+    ]
+
+
+def opposite_rule(rule):
+    if isinstance(rule, (list, tuple)):
+        return [opposite_rule(condition) for condition in rule]
+    if 'all' in rule:
+        return {'all': opposite_rule(rule['all'])}
+    if 'any' in rule:
+        return {'any': opposite_rule(rule['any'])}
+    return dict(rule, op=opposites[rule['op']])
+
+
+class StrategySignals:
+    def __init__(self, strategy):
+        moving_averages = strategy['movingAverages']
+        self.names = {m: indicator_key(m, ma) for m, ma in moving_averages.items()}
+        self.indicators = {
+            indicator_key(m, ma): {'function': indicators.ma_function(m, ma), 'val': ma['val']}
+            for m, ma in moving_averages.items()
+        }
+        self.fields = set()
+
+        entry = strategy.get('entry') or above_below_rule(moving_averages)
+        exit = strategy.get('exit') or opposite_rule(entry)
+        self.entry = self.compile_rule(entry)
+        self.exit = self.compile_rule(exit)
+
+    def operand(self, value):
+        if isinstance(value, (int, float)):
+            return lambda columns, values: value
+        if value in price_fields:
+            self.fields.add(value)
+            return lambda columns, values: columns[value]
+        if value in self.names:
+            key = self.names[value]
+            return lambda columns, values: values[key]
+        raise ValueError(f"Unknown operand in strategy rule: {value}")
+
+    def compile_rule(self, rule):
+        if isinstance(rule, (list, tuple)):
+            rule = {'all': rule}
+        if 'all' in rule or 'any' in rule:
+            combine = np.logical_and if 'all' in rule else np.logical_or
+            conditions = [self.compile_rule(condition) for condition in rule.get('all', rule.get('any'))]
+            if not conditions:
+                return lambda columns, values: False
+
+            def evaluate(columns, values):
+                result = conditions[0](columns, values)
+                for condition in conditions[1:]:
+                    result = combine(result, condition(columns, values))
+                return result
+            return evaluate
+
+        if rule['op'] not in operators:
+            raise ValueError(f"Unknown operator in strategy rule: {rule['op']}")
+        compare = operators[rule['op']]
+        left, right = self.operand(rule['left']), self.operand(rule['right'])
+        return lambda columns, values: compare(left(columns, values), right(columns, values))
+
+    def calc_indicators(self, close):
+        # every distinct indicator over the whole close array
+        return {
+            key: np.asarray(constants.movingAveragesFunctions[spec['function']](close, spec['val']), dtype=float)
+            for key, spec in self.indicators.items()
+        }
+
+    def evaluate(self, columns, values):
+        # columns are price fields and values indicator values by key, as arrays or scalars
+        return self.entry(columns, values), self.exit(columns, values)
+
+    def signals(self, columns, values):
+        # whole history - entry and exit as boolean arrays the length of the close
+        n = len(columns['close'])
+        entries, exits = self.evaluate(columns, values)
+        return np.broadcast_to(entries, n).copy(), np.broadcast_to(exits, n).copy()
+
+    def latest(self, row, values):
+        # one bar - row is anything indexable by price field, values the indicator values at that bar
+        entry, exit = self.evaluate({field: float(row[field]) for field in self.fields | {'close'}}, values)
+        return bool(entry), bool(exit)
+
+
+def price_columns(data):
+    return {field: data[field].to_numpy(dtype=float) for field in price_fields if field in data}
+
+
+def plain(value):
+    # loaded strategies are read only mappings, json only knows dicts
+    return dict(value) if isinstance(value, Mapping) else str(value)
+
+
+def compile_strategy(strategy):
+    # compiled once per distinct set of averages and rules
+    key = json.dumps([strategy['movingAverages'], strategy.get('entry'), strategy.get('exit')], sort_keys=True, default=plain)
+    if key not in compiled_strategies:
+        compiled_strategies[key] = StrategySignals(strategy)
+    return compiled_strategies[key]
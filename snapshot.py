@@ -0,0 +1,74 @@
+class AccountSnapshot:
+    # everything a trading cycle reads from the broker, fetched once at the start of the cycle and
+    # kept up to date locally as orders fill. With risk engines, one per strategy, only the deals since the
+    # oldest of their last refreshes are downloaded - once for all of them. Fills only reach the engines
+    # as the broker's deals in a later snapshot, with their real profit, commission and swap
+    def __init__(self, broker, symbols, deals_from=None, deals_to=None, risks=()):
+        self.broker = broker
+        self.risks = list(risks)
+        self.account = broker.account_info()
+        self.positions = {p.ticket: p._asdict() for p in broker.positions_get() or ()}
+        if self.risks:
+            ranges = [risk.deals_range() for risk in self.risks]
+            deals_from, deals_to = min(start for start, _ in ranges), max(end for _, end in ranges)
+        self.deals = [d._asdict() for d in broker.history_deals_get(deals_from, deals_to) or ()]
+        for risk in self.risks:
+            risk.add_deals(self.deals)
+        self.ticks = {symbol: broker.symbol_info_tick(symbol) for symbol in symbols}
+        self.by_symbol = dict()
+        for ticket, position in self.positions.items():
+            self.by_symbol.setdefault(position['symbol'], set()).add(ticket)
+
+    def position(self, ticket):
+        return self.positions.get(ticket)
+
+    def positions_for(self, symbol=None, magic=None):
+        # magic picks the positions one strategy opened
+        if symbol is None:
+            positions = list(self.positions.values())
+        else:
+            positions = [self.positions[ticket] for ticket in self.by_symbol.get(symbol, ())]
+        if magic is None:
+            return positions
+        return [position for position in positions if position.get('magic') == magic]
+
+    def tick(self, symbol):
+        if symbol not in self.ticks:
+            self.ticks[symbol] = self.broker.symbol_info_tick(symbol)
+        return self.ticks[symbol]
+
+    def balance(self):
+        return float(self.account.balance)
+
+    def apply_fill(self, request, result):
+        # mirror a filled order so later decisions in the same cycle see it without asking the broker again
+        if request.get('position'):
+            position = self.positions.pop(request['position'], None)
+            if position is None:
+                return
+            self.by_symbol.get(position['symbol'], set()).discard(position['ticket'])
+            deal = {
+                'ticket': result.deal,
+                'symbol': position['symbol'],
+                'position_id': position['ticket'],
+                'volume': result.volume,
+                'price': result.price,
+                'profit': position['profit'],
+                'magic': request.get('magic'),
+            }
+            self.deals.append(deal)
+        else:
+            ticket = result.order
+            self.positions[ticket] = {
+                'ticket': ticket,
+                'time': self.ticks[request['symbol']].time if self.ticks.get(request['symbol']) else 0,
+                'type': request['type'],
+                'volume': result.volume,
+                'price_open': result.price,
+                'sl': request.get('sl', 0.0),
+                'tp': request.get('tp', 0.0),
+                'profit': 0.0,
+                'symbol': request['symbol'],
+                'magic': request.get('magic'),
+            }
+            self.by_symbol.setdefault(request['symbol'], set()).add(ticket)
@@ -1,10 +1,185 @@
 import json
 import os
+import zlib
+from collections.abc import Mapping
 import keys
 
 strategy_dir = keys.strategies_dir
 
+# strategies are checked and normalized once when their file is read, and handed out frozen so one loaded
+# copy can be shared by every cycle and worker. A file is read again only when its mtime changes.
+
+# {name: (mtime, strategy)} of every strategy file read so far
+loaded = dict()
+
+fill_modes = ('close', 'ohlc', 'tick')
+# orders carry the strategy's magic number, so each strategy only manages its own positions and deals
+base_magic = 234000
+average_functions = ('SMA', 'EMA', 'WMA', 'linearReg', 'TRIMA', 'DEMA', 'HT_TRENDLINE', 'TSF')
+
+
+class StrategyError(ValueError):
+    pass
+
+
+class FrozenDict(Mapping):
+    # read only mapping - nested dicts are frozen as well and lists become tuples
+    __slots__ = ('_data', 'source')
+
+    def __init__(self, data, source=None):
+        self._data = {key: freeze(value) for key, value in data.items()}
+        self.source = source
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'FrozenDict({self._data!r})'
+
+
+def freeze(value):
+    if isinstance(value, Mapping):
+        return value if isinstance(value, FrozenDict) else FrozenDict(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    # a plain, mutable deep copy, e.g. to change parameters in a sweep
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate(data, name):
+    # every key the trader and backtester read, so a typo fails on load rather than mid cycle. Returns the
+    # normalized strategy: prices and amounts as floats and the name defaulting to the file's.
+    def fail(message):
+        raise StrategyError(f"{name}.json: {message}")
+
+    if not isinstance(data, dict):
+        fail("must be a json object")
+    data = dict(data)
+    data.setdefault('strategy_name', name)
+
+    for key in ('strategy_name', 'account_currency'):
+        if not isinstance(data.get(key), str) or not data[key]:
+            fail(f"{key} must be a non-empty string")
+    pairs = data.get('pairs')
+    if not isinstance(pairs, list) or not pairs or not all(isinstance(pair, str) and len(pair) == 6 for pair in pairs):
+        fail("pairs must be a non-empty list of six letter symbols")
+
+    for key in ('risk', 'takeProfit', 'stopLoss', 'maxTime', 'maximumDrawdown', 'initialBalance'):
+        if not is_number(data.get(key)) or data[key] <= 0:
+            fail(f"{key} must be a positive number")
+        data[key] = float(data[key])
+    if not isinstance(data.get('maxLosses'), int) or isinstance(data['maxLosses'], bool) or data['maxLosses'] < 0:
+        fail("maxLosses must be a whole number")
+    if 'magic' in data and (not isinstance(data['magic'], int) or isinstance(data['magic'], bool) or data['magic'] <= 0):
+        fail("magic must be a positive whole number")
+    if 'timeFrame' in data and (not isinstance(data['timeFrame'], int) or data['timeFrame'] <= 0):
+        fail("timeFrame must be an mt5 timeframe value")
+    if not isinstance(data.get('fillMode', 'close'), str) or data.get('fillMode', 'close') not in fill_modes:
+        fail(f"fillMode must be one of {', '.join(fill_modes)}")
+    if not is_number(data.get('slippage_probability', 0.1)) or not 0 <= data.get('slippage_probability', 0.1) <= 1:
+        fail("slippage_probability must be between 0 and 1")
+
+    moving_averages = data.get('movingAverages')
+    if not isinstance(moving_averages, dict) or not moving_averages:
+        fail("movingAverages must be a non-empty object")
+    for m, ma in moving_averages.items():
+        if not isinstance(ma, dict):
+            fail(f"movingAverages.{m} must be an object")
+        if not isinstance(ma.get('function', m), str) or ma.get('function', m) not in average_functions:
+            fail(f"movingAverages.{m} is not one of {', '.join(average_functions)} - set function to say which it is")
+        if not isinstance(ma.get('val'), int) or isinstance(ma['val'], bool) or ma['val'] < 1:
+            fail(f"movingAverages.{m}.val must be a positive whole number")
+        if not isinstance(ma.get('aboveBelow', 'above'), str) or ma.get('aboveBelow', 'above') not in ('above', 'below'):
+            fail(f"movingAverages.{m}.aboveBelow must be above or below")
+
+    for key in ('entry', 'exit'):
+        if key in data:
+            validate_rule(data[key], moving_averages, f"{key}", fail)
+    return data
+
+
+def validate_rule(rule, moving_averages, path, fail):
+    if isinstance(rule, list):
+        for n, condition in enumerate(rule):
+            validate_rule(condition, moving_averages, f"{path}[{n}]", fail)
+        return
+    if not isinstance(rule, dict):
+        fail(f"{path} must be a condition, a list or an all/any object")
+    for combine in ('all', 'any'):
+        if combine in rule:
+            if not isinstance(rule[combine], list):
+                fail(f"{path}.{combine} must be a list of conditions")
+            validate_rule(rule[combine], moving_averages, f"{path}.{combine}", fail)
+            return
+    if not isinstance(rule.get('op'), str) or rule['op'] not in ('>', '<', '>=', '<='):
+        fail(f"{path}.op must be one of > < >= <=")
+    for side in ('left', 'right'):
+        operand = rule.get(side)
+        if not is_number(operand) and (not isinstance(operand, str) or operand not in ('open', 'high', 'low', 'close') and operand not in moving_averages):
+            fail(f"{path}.{side} must be a price field, a moving average of the strategy or a number")
+
+
+def magic_number(current_strategy, alone=False):
+    # set with "magic", otherwise base_magic for a strategy trading alone - the number every order carried
+    # before several strategies could run, so its open positions stay its own - and the same number for the
+    # same strategy name every time when it trades alongside others
+    if current_strategy.get('magic'):
+        return current_strategy['magic']
+    if alone:
+        return base_magic
+    return base_magic + zlib.crc32(current_strategy['strategy_name'].encode()) % 100000
+
+
+def check_magic_numbers(strategies, alone=False):
+    # strategies trading side by side must not share a magic number, they would manage each other's positions
+    names = dict()
+    for current_strategy in strategies:
+        magic = magic_number(current_strategy, alone)
+        if magic in names:
+            raise StrategyError(f"{names[magic]} and {current_strategy['strategy_name']} have the same magic number {magic} - set magic in one of them")
+        names[magic] = current_strategy['strategy_name']
+
+
 def load_strategy(strategy_name):
-    with open(strategy_dir + strategy_name + '.json') as json_file:
+    path = os.path.join(strategy_dir, strategy_name + '.json')
+    mtime = os.stat(path).st_mtime_ns
+    cached = loaded.get(strategy_name)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path) as json_file:
         data = json.load(json_file)
-        return data
+    current_strategy = FrozenDict(validate(data, strategy_name), strategy_name)
+    loaded[strategy_name] = (mtime, current_strategy)
+    return current_strategy
+
+
+def refresh(current_strategy):
+    # the newest version of a strategy loaded from a file, the same object when the file has not changed.
+    # A file edited into an invalid strategy keeps the last good one running.
+    source = getattr(current_strategy, 'source', None)
+    if source is None:
+        return current_strategy
+    try:
+        return load_strategy(source)
+    except Exception as e:
+        print(f"Could not reload strategy {source}:", e)
+        return current_strategy
@@ -0,0 +1,89 @@
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import bar_cache
+
+# deterministic market data for running the backtester and trader without a terminal - the same
+# symbol, timeframe, range and seed always give the same bars and ticks
+
+base_prices = {
+    'EURUSD': 1.10,
+    'GBPUSD': 1.27,
+    'USDCAD': 1.35,
+    'USDJPY': 145.0,
+    'AUDUSD': 0.66,
+    'EURGBP': 0.86,
+}
+annual_volatility = 0.08
+seconds_per_year = 252 * 86400
+
+
+def symbol_seed(symbol, time_frame, seed):
+    return zlib.crc32(f'{symbol}:{time_frame}:{seed}'.encode())
+
+
+def generate_rates(symbol, time_frame, start, end, seed=0, spread_points=10, weekends=False):
+    # bars on the timeframe's boundaries between start and end, weekends left out as the market is closed
+    # unless asked for (e.g. to trade against the wall clock on a weekend)
+    period = bar_cache.timeframe_seconds(time_frame)
+    first = -(-bar_cache.to_epoch(start) // period) * period
+    times = np.arange(first, bar_cache.to_epoch(end) + 1, period, dtype=np.int64)
+    if not weekends:
+        times = times[pd.to_datetime(times, unit='s').dayofweek < 5]
+    n = len(times)
+
+    # log price random walk, with the high and low reaching past the open and close by a random amount
+    rng = np.random.default_rng(symbol_seed(symbol, time_frame, seed))
+    sigma = annual_volatility * np.sqrt(period / seconds_per_year)
+    log_close = np.log(base_prices.get(symbol, 1.0)) + np.cumsum(rng.normal(0.0, sigma, n))
+    close = np.exp(log_close)
+    open = np.exp(np.concatenate((log_close[:1] - rng.normal(0.0, sigma, min(n, 1)), log_close[:-1])))
+    high = np.maximum(open, close) * np.exp(np.abs(rng.normal(0.0, sigma / 2, n)))
+    low = np.minimum(open, close) * np.exp(-np.abs(rng.normal(0.0, sigma / 2, n)))
+
+    rates = np.zeros(n, dtype=bar_cache.rates_dtype)
+    rates['time'] = times
+    rates['open'] = open
+    rates['high'] = high
+    rates['low'] = low
+    rates['close'] = close
+    rates['tick_volume'] = rng.integers(50, 500, n)
+    rates['spread'] = rng.integers(max(1, spread_points // 2), spread_points * 2, n)
+    return rates
+
+
+def generate_frame(symbol, time_frame, start, end, seed=0):
+    # the same frame MT5Connection.get_historical_data builds from the terminal's bars
+    rates_frame = pd.DataFrame(generate_rates(symbol, time_frame, start, end, seed))
+    rates_frame['time'] = pd.to_datetime(rates_frame['time'], unit='s')
+    return rates_frame
+
+
+def generate_ticks(rates, time_frame, ticks_per_bar=20, seed=0, point=0.00001):
+    # bid ticks inside every bar - a random walk pinned to the bar's open and close and kept inside its range.
+    # Returns (time_msc, bid, ask) in time order.
+    period_msc = bar_cache.timeframe_seconds(time_frame) * 1000
+    n = len(rates)
+    rng = np.random.default_rng(symbol_seed('ticks', time_frame, seed))
+
+    offsets = np.sort(rng.integers(0, period_msc, (n, ticks_per_bar)), axis=1)
+    offsets[:, 0] = 0
+    times_msc = rates['time'][:, None] * 1000 + offsets
+
+    steps = rng.standard_normal((n, ticks_per_bar))
+    walk = np.cumsum(steps, axis=1) - steps[:, :1]
+    position = np.arange(ticks_per_bar) / max(ticks_per_bar - 1, 1)
+    bridge = walk - walk[:, -1:] * position
+    scale = (rates['high'] - rates['low'])[:, None] / (4 * np.sqrt(ticks_per_bar))
+    bids = rates['open'][:, None] + (rates['close'] - rates['open'])[:, None] * position + bridge * scale
+    bids = np.clip(bids, rates['low'][:, None], rates['high'][:, None])
+    asks = bids + rates['spread'][:, None] * point
+    return times_msc.ravel(), bids.ravel(), asks.ravel()
+
+
+def generate_market(symbols, time_frames, start=datetime(2021, 1, 1), end=datetime(2023, 12, 29), seed=0):
+    # {(symbol, timeframe): rates} for every combination
+    return {(symbol, time_frame): generate_rates(symbol, time_frame, start, end, seed) for symbol in symbols for time_frame in time_frames}
@@ -0,0 +1,25 @@
+import json
+import os
+
+import pytest
+
+import rates
+import strategy
+
+strategy_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'strategies', 'strategy1.json')
+
+
+@pytest.fixture
+def rate_provider():
+    return rates.StaticRateProvider({'EURUSD': 1.10, 'GBPUSD': 1.27, 'USDCAD': 1.35})
+
+
+@pytest.fixture
+def make_strategy():
+    # strategy1 with some of its values changed, checked and frozen as load_strategy hands it out
+    def make(**changes):
+        with open(strategy_path) as json_file:
+            data = json.load(json_file)
+        data.update(changes)
+        return strategy.freeze(strategy.validate(data, 'strategy1'))
+    return make
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow.parquet as pq
+
+import bar_cache
+import synthetic
+
+# the bar store against a local rates source that records every range it is asked for
+
+start = datetime(2023, 1, 2)
+end = datetime(2023, 1, 31)
+now = bar_cache.to_epoch(datetime(2023, 6, 1))
+
+
+class FakeSource:
+    def __init__(self, available_to=None):
+        self.rates = synthetic.generate_rates('EURUSD', 15, datetime(2022, 12, 1), datetime(2023, 6, 1))
+        self.available_to = available_to
+        self.calls = []
+
+    def __call__(self, symbol, time_frame, date_from, date_to):
+        date_from, date_to = bar_cache.to_epoch(date_from), bar_cache.to_epoch(date_to)
+        self.calls.append((date_from, date_to))
+        if self.available_to is not None:
+            date_to = min(date_to, self.available_to)
+        times = self.rates['time']
+        return self.rates[(times >= date_from) & (times <= date_to)]
+
+
+def test_served_from_disk(tmp_path):
+    source = FakeSource()
+    first = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now).copy_rates_range('EURUSD', 15, start, end)
+    assert len(source.calls) == 1
+
+    # a new store reads the same bars back from the files without asking the source
+    second = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now).copy_rates_range('EURUSD', 15, start, end)
+    assert len(source.calls) == 1
+    assert np.array_equal(first, second)
+    assert np.array_equal(first, source(None, 15, start, end))
+
+
+def test_only_missing_ranges_fetched(tmp_path):
+    source = FakeSource()
+    store = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now)
+    store.copy_rates_range('EURUSD', 15, datetime(2023, 1, 10), datetime(2023, 1, 20))
+    bars = store.copy_rates_range('EURUSD', 15, start, end)
+    assert source.calls[1:] == [
+        (bar_cache.to_epoch(start), bar_cache.to_epoch(datetime(2023, 1, 10)) - 1),
+        (bar_cache.to_epoch(datetime(2023, 1, 20)) + 1, bar_cache.to_epoch(end)),
+    ]
+    assert np.array_equal(bars, source(None, 15, start, end))
+    assert store.coverage[('EURUSD', 15)] == [[bar_cache.to_epoch(start), bar_cache.to_epoch(end)]]
+
+
+def test_partial_answer_fetched_again(tmp_path):
+    # a source that has not caught up yet only covers the range up to its last bar
+    available_to = bar_cache.to_epoch(datetime(2023, 1, 13, 12, 0))
+    source = FakeSource(available_to)
+    store = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now)
+    store.copy_rates_range('EURUSD', 15, start, end)
+    assert store.coverage[('EURUSD', 15)] == [[bar_cache.to_epoch(start), available_to + 15 * 60 - 1]]
+
+    source.available_to = None
+    bars = store.copy_rates_range('EURUSD', 15, start, end)
+    assert source.calls[-1] == (available_to + 15 * 60, bar_cache.to_epoch(end))
+    assert np.array_equal(bars, source(None, 15, start, end))
+
+
+def test_forming_bar_not_cached(tmp_path):
+    source = FakeSource()
+    clock = bar_cache.to_epoch(datetime(2023, 1, 31, 12, 5))
+    store = bar_cache.BarStore(str(tmp_path), source, clock=lambda: clock)
+    bars = store.copy_rates_range('EURUSD', 15, start, datetime.fromtimestamp(clock, timezone.utc))
+    assert bars['time'][-1] == bar_cache.to_epoch(datetime(2023, 1, 31, 12, 0))
+    assert store.bars[('EURUSD', 15)]['time'][-1] == bar_cache.to_epoch(datetime(2023, 1, 31, 11, 45))
+
+
+def test_prefetch_writes_windows_around_cached_bars(tmp_path):
+    source = FakeSource()
+    store = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now)
+    store.copy_rates_range('EURUSD', 15, datetime(2023, 1, 10), datetime(2023, 1, 20))
+    del source.calls[:]
+
+    store.prefetch('EURUSD', 15, start, end, 100)
+    # never more than a window per download, and only the missing ranges
+    assert all(date_to - date_from < 100 * 15 * 60 for date_from, date_to in source.calls)
+    assert source.calls[0][0] == bar_cache.to_epoch(start) and source.calls[-1][1] == bar_cache.to_epoch(end)
+    assert ('EURUSD', 15) not in store.bars
+
+    # the file is in time order with a row group or more per window, and read back without the source
+    windows = [(date_from, date_to) for date_from, date_to in source.calls]
+    with_bars = sum(len(source(None, 15, date_from, date_to)) > 0 for date_from, date_to in windows)
+    assert pq.ParquetFile(store.file_path('EURUSD', 15, 'parquet')).num_row_groups >= with_bars
+    second = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now)
+    calls = len(source.calls)
+    bars = second.copy_rates_range('EURUSD', 15, start, end)
+    assert len(source.calls) == calls
+    assert np.array_equal(bars, source(None, 15, start, end))
+    assert second.coverage[('EURUSD', 15)] == [[bar_cache.to_epoch(start), bar_cache.to_epoch(end)]]
+
+
+def test_prefetch_covers_only_what_was_received(tmp_path):
+    available_to = bar_cache.to_epoch(datetime(2023, 1, 13, 12, 0))
+    source = FakeSource(available_to)
+    store = bar_cache.BarStore(str(tmp_path), source, clock=lambda: now)
+    store.prefetch('EURUSD', 15, start, end, 100)
+    store.load('EURUSD', 15)
+    assert store.coverage[('EURUSD', 15)] == [[bar_cache.to_epoch(start), available_to + 15 * 60 - 1]]
@@ -0,0 +1,29 @@
+import benchmark
+
+# the regression gate of the benchmarks - slower, bigger, failing or missing cases all fail it
+
+baseline = {
+    'backtest': {'bars_per_second': 1000.0, 'peak_mb': 10.0},
+    'trader': {'bars_per_second': 1000.0, 'peak_mb': 10.0},
+    'broken': {'error': 'ValueError: no data'},
+}
+
+
+def test_same_results_pass():
+    assert benchmark.compare(dict(baseline), baseline, 0.2) == []
+
+
+def test_slower_and_bigger_fail():
+    results = dict(baseline, backtest={'bars_per_second': 700.0, 'peak_mb': 10.0}, trader={'bars_per_second': 1000.0, 'peak_mb': 20.0})
+    assert len(benchmark.compare(results, baseline, 0.2)) == 2
+
+
+def test_new_error_fails():
+    results = dict(baseline, trader={'error': 'KeyError: high'})
+    assert benchmark.compare(results, baseline, 0.2) == ['trader: failed - KeyError: high']
+
+
+def test_missing_case_fails_unless_filtered():
+    results = {'backtest': baseline['backtest']}
+    assert benchmark.compare(results, baseline, 0.2) == ['trader: in the baseline but not run']
+    assert benchmark.compare(results, baseline, 0.2, only=['back']) == []
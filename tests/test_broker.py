@@ -0,0 +1,74 @@
+import pytest
+
+import broker
+import fake_broker
+
+# the broker session against the in-process fake broker
+
+
+class FlakyBroker(fake_broker.FakeBroker):
+    # fails to initialize the first failures times
+    def __init__(self, failures=0, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def initialize(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            self.count('initialize')
+            return False
+        return super().initialize(**kwargs)
+
+
+def make_session(client, **kwargs):
+    sleeps = []
+    session = broker.BrokerSession(1, 'password', 'server', client, sleep=sleeps.append, **kwargs)
+    return session, sleeps
+
+
+def test_connects_once():
+    client = fake_broker.FakeBroker(balance=5000.0)
+    session, _ = make_session(client)
+    session.connect()
+    session.connect()
+    for _ in range(3):
+        assert session.account_info().balance == 5000.0
+    assert client.calls['initialize'] == 1
+    assert client.calls['login'] == 1
+
+
+def test_reconnects_with_backoff():
+    client = FlakyBroker(failures=4)
+    session, sleeps = make_session(client, initial_backoff=1, max_backoff=4)
+    session.connect()
+    assert session.connected
+    assert sleeps == [1, 2, 4, 4]
+
+
+def test_gives_up_after_max_attempts():
+    session, sleeps = make_session(FlakyBroker(failures=5), max_attempts=3)
+    with pytest.raises(ConnectionError):
+        session.connect()
+    assert len(sleeps) == 2
+
+
+def test_heartbeat_reconnects_a_dropped_session():
+    client = fake_broker.FakeBroker()
+    session, _ = make_session(client)
+    session.connect()
+    session.heartbeat()
+    assert session.reconnects == 0
+
+    client.drop_connection()
+    session.heartbeat()
+    assert session.reconnects == 1
+    assert client.connected
+
+
+def test_failed_call_retried_after_reconnect():
+    client = fake_broker.FakeBroker(balance=5000.0)
+    session, _ = make_session(client)
+    session.connect()
+    client.drop_connection()
+    assert session.account_info().balance == 5000.0
+    assert session.reconnects == 1
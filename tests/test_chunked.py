@@ -0,0 +1,74 @@
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_cache
+import chunked
+import results
+import synthetic
+from backtester import Backtester
+
+# the chunked backtest against the in-memory vectorized engine - the same equity, trade ledger and final
+# equity whatever the chunk size, with positions carried open from one chunk into the next. Sums run in
+# another order than the vectorized engine's, so they agree to rounding and a lot size can round the other way
+
+
+@pytest.fixture(scope='module')
+def data():
+    return synthetic.generate_frame('GBPUSD', 15, datetime(2023, 1, 2), datetime(2023, 2, 10))
+
+
+@pytest.fixture
+def bar_store(data, tmp_path):
+    store = bar_cache.BarStore(str(tmp_path / 'bars'), None)
+    store.bars[('GBPUSD', 15)] = bar_cache.to_rates(data)
+    store.coverage[('GBPUSD', 15)] = []
+    store.save('GBPUSD', 15)
+    return store
+
+
+@pytest.mark.parametrize('fill_mode', ['close', 'ohlc'])
+@pytest.mark.parametrize('take_profit, stop_loss', [(0.002, 0.001), (800.0, 250.0)])
+def test_chunks_match_in_memory_run(data, bar_store, make_strategy, rate_provider, tmp_path, monkeypatch, fill_mode, take_profit, stop_loss):
+    monkeypatch.setattr(results, 'results_dir', str(tmp_path / 'results'))
+    current_strategy = make_strategy(takeProfit=take_profit, stopLoss=stop_loss, fillMode=fill_mode)
+    with contextlib.redirect_stdout(io.StringIO()):
+        times, equity, close, ledger = Backtester.simulate_trades_vectorized('GBPUSD', data, current_strategy, rate_provider, return_trades=True)
+    assert len(ledger) > 0
+
+    file_times = bar_cache.to_rates(data)['time'].astype('datetime64[s]').astype('datetime64[ns]')
+    first = None
+    split_positions = 0
+    for chunk_size in (10 ** 6, 1000, 137, 7):
+        entry_chunk = np.searchsorted(file_times, ledger['entry_time'].to_numpy()) // chunk_size
+        exit_chunk = np.searchsorted(file_times, ledger['exit_time'].to_numpy()) // chunk_size
+        split_positions += int((entry_chunk != exit_chunk).sum())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_dir, final_equity = chunked.run(current_strategy, 15, None, None, ['GBPUSD'], bar_store, rate_provider, chunk_size=chunk_size)
+        equity_frame = pd.read_parquet(f'{run_dir}/GBPUSD.equity.parquet')
+        trades = pd.read_parquet(f'{run_dir}/GBPUSD.trades.parquet')
+
+        assert np.array_equal(equity_frame['time'].to_numpy(), results.time_values(times))
+        np.testing.assert_allclose(equity_frame['equity'], equity.astype(np.float32), rtol=1e-6)
+        assert final_equity['GBPUSD'] == pytest.approx(equity[-1], rel=1e-9)
+        assert list(trades.columns) == list(ledger.columns)
+        assert trades.dtypes.equals(ledger.dtypes)
+        for column in ('entry_time', 'exit_time', 'side', 'closed'):
+            assert (trades[column].to_numpy() == ledger[column].to_numpy()).all()
+        np.testing.assert_allclose(trades['entry_price'], ledger['entry_price'], rtol=1e-12)
+        np.testing.assert_allclose(trades['exit_price'], ledger['exit_price'], rtol=1e-12)
+        np.testing.assert_allclose(trades['size'], ledger['size'], rtol=1e-9, atol=0.01)
+        np.testing.assert_allclose(trades['profit'], ledger['profit'], rtol=1e-9, atol=1e-3)
+
+        # the running sums are added in the same order whatever the chunk size
+        if first is None:
+            first = (equity_frame, trades)
+        assert equity_frame.equals(first[0]) and trades.equals(first[1])
+
+    # positions were carried open from one chunk into the next
+    assert split_positions > 0
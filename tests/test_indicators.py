@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+
+talib = pytest.importorskip('talib')
+
+# the streaming averages against the talib batch functions they replace
+
+batch_functions = {
+    'SMA': talib.SMA,
+    'EMA': talib.EMA,
+    'WMA': talib.WMA,
+    'linearReg': talib.LINEARREG,
+    'TRIMA': talib.TRIMA,
+    'DEMA': talib.DEMA,
+    'TSF': talib.TSF,
+}
+
+
+def closes(count, seed=7):
+    rng = np.random.default_rng(seed)
+    return 1.1 + np.cumsum(rng.normal(0, 0.0005, count))
+
+
+@pytest.mark.parametrize('period', [2, 5, 14, 15, 50])
+@pytest.mark.parametrize('name', sorted(indicators.streamingFunctions))
+def test_streaming_matches_talib(name, period):
+    close = closes(2000)
+    indicator = indicators.streamingFunctions[name](period)
+    streamed = np.array([indicator.update(x) for x in close])
+    np.testing.assert_allclose(streamed, batch_functions[name](close, period), rtol=1e-9, equal_nan=True)
+
+
+def test_engine_updates_match_talib():
+    close = closes(3000)
+    data = pd.DataFrame({'time': np.arange(len(close)) * 900, 'close': close})
+    moving_averages = {
+        'SMA': {'val': 20},
+        'fast': {'function': 'EMA', 'val': 9},
+        'WMA': {'val': 30},
+        'linearReg': {'val': 14},
+        'TRIMA': {'val': 21},
+        'DEMA': {'val': 10},
+        'TSF': {'val': 25},
+        'HT_TRENDLINE': {'val': 0},
+    }
+    engine = indicators.IndicatorEngine(moving_averages)
+    # each cycle sees a rolling window of the latest bars, a few more of them closed every time
+    window = 500
+    for end in range(window, len(close) + 1, 37):
+        values = engine.update('EURUSD', data[end - window:end])
+        for m, ma in moving_averages.items():
+            name = indicators.ma_function(m, ma)
+            if name in batch_functions:
+                expected = batch_functions[name](close[:end], ma['val'])[-1]
+            else:
+                # without a streaming version the average is calculated over the window alone
+                expected = talib.HT_TRENDLINE(close[end - window:end])[-1]
+            np.testing.assert_allclose(values[m], expected, rtol=1e-9)
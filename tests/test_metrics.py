@@ -0,0 +1,41 @@
+import json
+import os
+import time
+
+import metrics
+
+# cycle latencies with the sampled stacks of the slowest cycles
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_slowest_cycles_keep_their_stacks(tmp_path):
+    path = str(tmp_path / 'metrics.json')
+    metrics.enable(path, profile_slowest=2, sample_interval=0.001)
+    try:
+        for seconds in (0.01, 0.05, 0.02, 0.06, 0.01):
+            with metrics.cycle('strategy1'):
+                with metrics.span('risk', 'strategy1'):
+                    busy(seconds)
+    finally:
+        metrics.disable()
+
+    with open(path) as json_file:
+        exported = json.load(json_file)
+    slowest = exported['slowest_cycles']
+    assert [cycle['cycle'] for cycle in slowest] == [4, 2]
+    assert 'risk' in [span['name'] for span in slowest[0]['spans']]
+    for cycle in slowest:
+        with open(cycle['profile']) as profile_file:
+            assert any('busy (test_metrics.py' in line for line in profile_file)
+    assert sorted(os.listdir(tmp_path)) == ['cycle_2.folded', 'cycle_4.folded', 'metrics.json']
+
+
+def test_disabled_spans_do_nothing():
+    metrics.disable()
+    assert metrics.span('risk', 'strategy1') is metrics.null_span
+    assert metrics.cycle('strategy1') is metrics.null_span
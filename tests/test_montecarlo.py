@@ -0,0 +1,35 @@
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+
+import montecarlo
+import synthetic
+
+# the noise free path books profit when a position exits and sizes every position from that balance, so
+# with every cost switched off all paths are the baseline
+
+
+def test_sizes_follow_realized_balance(make_strategy):
+    current_strategy = make_strategy(risk=1.0, stopLoss=100.0, initialBalance=10000.0)
+    entry_idx = np.array([0, 2, 3])
+    exit_idx = np.array([2, 5, 5])
+    closed = np.array([True, True, False])
+    entry_price = np.array([1.0, 1.0, 1.0])
+    exit_price = np.array([1.5, 1.0, 1.0])
+    sizes = montecarlo.realized_sizes(entry_idx, exit_idx, closed, entry_price, exit_price, np.ones(6), current_strategy)
+    # the first position exits on bar 2, so only the entry on bar 3 is sized from its profit
+    assert sizes[0] == sizes[1] == 1.0
+    assert sizes[2] == round((10000.0 + 0.5) / 10000.0, 2)
+
+
+def test_paths_without_costs_are_the_baseline(make_strategy, rate_provider):
+    data = synthetic.generate_frame('GBPUSD', 15, datetime(2023, 1, 2), datetime(2023, 2, 10))
+    data['spread'] = 0
+    current_strategy = make_strategy(slippage_probability=0.0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = montecarlo.simulate_paths('GBPUSD', data, current_strategy, paths=3, rate_provider=rate_provider, latency_ms=0)
+    assert result['positions'] > 0
+    np.testing.assert_allclose(result['final_equity'], result['baseline'][-1], rtol=1e-12)
+    np.testing.assert_allclose(result['bands'], result['baseline'][result['band_idx']][None, :].repeat(len(result['percentiles']), axis=0), rtol=1e-12)
@@ -0,0 +1,45 @@
+import contextlib
+import csv
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import optimizer
+import synthetic
+from backtester import Backtester
+
+# every combination of a sweep scores what the backtest of that strategy returns, rules on any price field
+# and fills inside the bars included
+
+
+def test_sweep_matches_backtest(make_strategy, rate_provider, tmp_path, monkeypatch):
+    monkeypatch.setattr(optimizer, 'results_dir', str(tmp_path))
+    base_strategy = make_strategy(
+        fillMode='ohlc', takeProfit=0.0007, stopLoss=0.0004,
+        entry=[{'left': 'close', 'op': '>', 'right': 'EMA'}, {'left': 'low', 'op': '<', 'right': 'SMA'}],
+        exit={'any': [{'left': 'close', 'op': '<', 'right': 'EMA'}, {'left': 'high', 'op': '>=', 'right': 2.0}]},
+    )
+    data = synthetic.generate_frame('GBPUSD', 15, datetime(2023, 1, 2), datetime(2023, 2, 10))
+    ranges = {'takeProfit': [0.0007, 0.0012], 'fillMode': ['close', 'ohlc']}
+    with contextlib.redirect_stdout(io.StringIO()):
+        ranked_path = optimizer.sweep(base_strategy, ranges, {'GBPUSD': data}, rate_provider, processes=2)
+
+    with open(ranked_path, newline='') as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert len(rows) == 4
+    for row in rows:
+        current_strategy = optimizer.apply_params(base_strategy, {'takeProfit': float(row['takeProfit']), 'fillMode': row['fillMode']})
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, equity_curve, _, trades = Backtester.simulate_trades_vectorized('GBPUSD', data, current_strategy, rate_provider, return_trades=True)
+        initial_balance = current_strategy['initialBalance']
+        assert float(row['return_pct']) == pytest.approx(100 * (equity_curve[-1] - initial_balance) / initial_balance, rel=1e-9, abs=1e-9)
+        assert float(row['max_drawdown_pct']) == pytest.approx(100 * Backtester.max_drawdown(equity_curve), rel=1e-9, abs=1e-9)
+        assert int(row['trades']) == int(trades['closed'].sum())
+
+
+def test_tick_fills_are_not_swept(make_strategy, tmp_path, monkeypatch):
+    monkeypatch.setattr(optimizer, 'results_dir', str(tmp_path))
+    with pytest.raises(ValueError):
+        optimizer.sweep(make_strategy(), {'fillMode': ['ohlc', 'tick']}, dict())
@@ -0,0 +1,51 @@
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+
+import synthetic
+from backtester import Backtester
+
+# the portfolio pass books profit and margin in the account currency with the same lot unit, so a stop out
+# costs the risk share of the balance and the margin only turns away positions the balance can not carry
+
+
+def one_position(exit_price):
+    times = np.array(['2023-01-02T10:00', '2023-01-02T10:15', '2023-01-02T10:30'], dtype='datetime64[ns]')
+    return {'EURUSD': {
+        'times': times,
+        'close': np.array([1.1, 1.1, exit_price]),
+        'entry_idx': np.array([0]),
+        'exit_idx': np.array([2]),
+        'closed': np.array([True]),
+        'exit_price': np.array([exit_price]),
+    }}
+
+
+def test_stop_out_costs_risk_share(make_strategy, rate_provider):
+    current_strategy = make_strategy(account_currency='USD', risk=1.0, takeProfit=0.002, stopLoss=0.001, initialBalance=110000.0)
+    _, equity_curve, _, trades = Backtester.simulate_portfolio(['EURUSD'], one_position(1.1 - 0.001), current_strategy, rate_provider)
+    assert trades == {'EURUSD': 1}
+    np.testing.assert_allclose(equity_curve[-1], 110000.0 * 0.99)
+
+
+def test_margin_turns_away_what_the_balance_can_not_carry(make_strategy, rate_provider):
+    current_strategy = make_strategy(account_currency='USD', risk=1.0, takeProfit=0.002, stopLoss=0.001, initialBalance=110000.0, leverage=5)
+    _, equity_curve, _, trades = Backtester.simulate_portfolio(['EURUSD'], one_position(1.1 - 0.001), current_strategy, rate_provider)
+    assert trades == {'EURUSD': 0}
+    assert (equity_curve == 110000.0).all()
+
+
+def test_margin_lets_trades_through(make_strategy, rate_provider):
+    current_strategy = make_strategy(takeProfit=0.002, stopLoss=0.001)
+    pairs = list(current_strategy['pairs'])
+    signals = dict()
+    for pair in pairs:
+        data = synthetic.generate_frame(pair, 15, datetime(2023, 1, 2), datetime(2023, 2, 10))
+        data.attrs['pair'] = pair
+        signals[pair] = Backtester.pair_signals(data, current_strategy)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, equity_curve, _, trades = Backtester.simulate_portfolio(pairs, signals, current_strategy, rate_provider)
+    assert all(trades[pair] > 0 for pair in pairs)
+    assert abs(equity_curve[-1] - current_strategy['initialBalance']) > 1.0
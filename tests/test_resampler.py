@@ -0,0 +1,38 @@
+import numpy as np
+
+import resampler
+import synthetic
+
+# derived bars kept up to date from base bars, and built again when a reload asks for more history
+
+start = 1672653600 # Monday 2023-01-02 10:00
+h1 = 0x4001
+
+
+def base_bars(minutes):
+    return synthetic.generate_rates('EURUSD', 1, start, start + 60 * minutes)
+
+
+def test_incremental_matches_batch():
+    rates = base_bars(3000)
+    bar_resampler = resampler.Resampler(1, {15: 50, h1: 20})
+    for first in range(0, len(rates), 137):
+        bar_resampler.update('EURUSD', rates[first:first + 137])
+    for time_frame, capacity in ((15, 50), (h1, 20)):
+        expected = resampler.resample(rates, time_frame, 1)[-capacity:]
+        assert np.array_equal(bar_resampler.bars('EURUSD', time_frame), expected)
+
+
+def test_added_time_frame_starts_again_from_lookback():
+    rates = base_bars(3000)
+    bar_resampler = resampler.Resampler(1, {15: 20})
+    bar_resampler.update('EURUSD', rates[:2000])
+    bar_resampler.add_time_frame(h1, 20)
+    assert bar_resampler.last_time('EURUSD') is None
+
+    # the trader downloads lookback_seconds() of base bars for a symbol with no last time
+    now = int(rates['time'][2000])
+    bar_resampler.update('EURUSD', rates[(rates['time'] >= now - bar_resampler.lookback_seconds()) & (rates['time'] <= now)])
+    for time_frame in (15, h1):
+        expected = resampler.resample(rates[:2001], time_frame, 1)[-20:]
+        assert np.array_equal(bar_resampler.bars('EURUSD', time_frame), expected)
@@ -0,0 +1,56 @@
+import fake_broker
+import risk
+import snapshot
+
+# risk state of one strategy from the broker's deals - only its own magic number, and fills only once the
+# broker has the deal
+
+magic = 234001
+start = 1673000000 # Friday 2023-01-06 10:13
+
+
+def make_client(now):
+    client = fake_broker.FakeBroker(balance=100000.0, clock=lambda: now[0])
+    client.connected = True
+    client.set_tick('EURUSD', 1.1)
+    return client
+
+
+def send(client, request):
+    result = client.order_send(dict(request, action=client.TRADE_ACTION_DEAL, symbol='EURUSD', volume=1.0))
+    assert result.retcode == client.TRADE_RETCODE_DONE
+    return result
+
+
+def test_fills_count_once_the_broker_has_the_deal():
+    now = [start]
+    client = make_client(now)
+    engine = risk.RiskEngine(None, lambda: now[0], magic)
+    opened = send(client, {'type': client.ORDER_TYPE_BUY, 'price': 1.1001, 'magic': magic})
+    now[0] += 600
+    client.set_tick('EURUSD', 1.099)
+
+    cycle = snapshot.AccountSnapshot(client, ['EURUSD'], risks=[engine])
+    position = cycle.position(opened.order)
+    close_request = {'type': client.ORDER_TYPE_SELL, 'price': 1.099, 'position': position['ticket'], 'magic': magic}
+    cycle.apply_fill(close_request, send(client, close_request))
+    assert cycle.positions_for(magic=magic) == []
+    assert engine.lost_trades == 0 and engine.realized == 0.0
+
+    now[0] += 60
+    snapshot.AccountSnapshot(client, ['EURUSD'], risks=[engine])
+    deal = [deal for deal in client.deals if deal.entry == client.DEAL_ENTRY_OUT][0]
+    assert engine.lost_trades == 1
+    assert engine.realized == deal.profit < 0
+
+
+def test_other_magic_numbers_are_not_counted():
+    now = [start]
+    client = make_client(now)
+    engine = risk.RiskEngine(None, lambda: now[0], magic)
+    opened = send(client, {'type': client.ORDER_TYPE_BUY, 'price': 1.1001, 'magic': magic + 1})
+    client.set_tick('EURUSD', 1.099)
+    send(client, {'type': client.ORDER_TYPE_SELL, 'price': 1.099, 'position': opened.order, 'magic': magic + 1})
+    now[0] += 60
+    engine.refresh(client)
+    assert engine.lost_trades == 0 and engine.realized == 0.0
@@ -0,0 +1,30 @@
+import pytest
+
+import strategy
+import trader
+
+# magic numbers - a strategy trading alone keeps the one every order carried before several could run
+
+
+def test_lone_strategy_keeps_base_magic(make_strategy):
+    current_strategy = make_strategy()
+    trader.Runtime([current_strategy], risk_state_dir=None)
+    assert trader.magic_number(current_strategy) == strategy.base_magic
+    assert trader.risk_engine(current_strategy).magic == strategy.base_magic
+
+
+def test_side_by_side_strategies_get_their_own(make_strategy):
+    first = make_strategy()
+    second = make_strategy(strategy_name='strategy2', magic=234567)
+    runtime = trader.Runtime([first, second], risk_state_dir=None)
+    assert trader.magic_number(first) == strategy.magic_number(first) != strategy.base_magic
+    assert trader.magic_number(second) == 234567
+
+    # the one left when the other halts keeps trading with the number it has
+    runtime.setup([first])
+    assert trader.magic_number(first) == strategy.magic_number(first)
+
+
+def test_shared_magic_is_rejected(make_strategy):
+    with pytest.raises(strategy.StrategyError):
+        strategy.check_magic_numbers([make_strategy(magic=234567), make_strategy(strategy_name='strategy2', magic=234567)])
@@ -0,0 +1,80 @@
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import synthetic
+from backtester import Backtester
+
+# the vectorized engine against the per bar loop it replaces, on synthetic bars - same equity, timestamps,
+# prices and trade ledger. Lot sizes are rounded to 0.01, so a balance that differs in its last bits can
+# round a size the other way
+
+
+@pytest.fixture(scope='module')
+def data():
+    return synthetic.generate_frame('GBPUSD', 15, datetime(2023, 1, 2), datetime(2023, 2, 10))
+
+
+def run_both(data, current_strategy, rate_provider):
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop = Backtester.simulate_trades('GBPUSD', data, current_strategy, rate_provider, return_trades=True)
+        vectorized = Backtester.simulate_trades_vectorized('GBPUSD', data, current_strategy, rate_provider, return_trades=True)
+    return loop, vectorized
+
+
+@pytest.mark.parametrize('fill_mode', ['close', 'ohlc'])
+@pytest.mark.parametrize('take_profit, stop_loss', [(0.002, 0.001), (0.0007, 0.0004), (800.0, 250.0)])
+def test_vectorized_matches_loop(data, make_strategy, rate_provider, fill_mode, take_profit, stop_loss):
+    current_strategy = make_strategy(takeProfit=take_profit, stopLoss=stop_loss, fillMode=fill_mode)
+    (loop_times, loop_equity, loop_price, loop_ledger), (times, equity, price, ledger) = run_both(data, current_strategy, rate_provider)
+
+    assert np.array_equal(np.asarray(loop_times, dtype='datetime64[ns]'), times)
+    assert np.array_equal(loop_price, price)
+    np.testing.assert_allclose(loop_equity, equity, rtol=1e-9, atol=1e-3)
+
+    assert list(loop_ledger.columns) == list(ledger.columns)
+    assert loop_ledger.dtypes.equals(ledger.dtypes)
+    assert len(loop_ledger) == len(ledger) > 0
+    for column in ('entry_time', 'exit_time', 'side', 'closed'):
+        assert (loop_ledger[column] == ledger[column]).all()
+    np.testing.assert_allclose(loop_ledger['size'], ledger['size'], rtol=1e-9, atol=0.01)
+    np.testing.assert_allclose(loop_ledger['entry_price'], ledger['entry_price'], rtol=1e-12)
+    np.testing.assert_allclose(loop_ledger['exit_price'], ledger['exit_price'], rtol=1e-12)
+    np.testing.assert_allclose(loop_ledger['profit'], ledger['profit'], rtol=1e-9, atol=1e-3)
+
+
+def test_ohlc_fills_at_levels(data, make_strategy, rate_provider):
+    # a long position leaves at its stop or target level, or at the open of a bar that gapped past it
+    current_strategy = make_strategy(takeProfit=0.0007, stopLoss=0.0004, fillMode='ohlc')
+    _, (_, _, _, ledger) = run_both(data, current_strategy, rate_provider)
+    opens = data.set_index('time')['open']
+    closed = ledger[ledger['closed']]
+    stop = closed['entry_price'] - 0.0004
+    target = closed['entry_price'] + 0.0007
+    at_close = np.isclose(closed['exit_price'].to_numpy(), data.set_index('time')['close'][closed['exit_time']].to_numpy())
+    at_level = np.isclose(closed['exit_price'], stop) | np.isclose(closed['exit_price'], target)
+    at_open = np.isclose(closed['exit_price'].to_numpy(), opens[closed['exit_time']].to_numpy())
+    assert (at_close | at_level | at_open).all()
+    assert at_level.any()
+
+
+@pytest.mark.parametrize('priority', ['stop', 'target'])
+def test_intrabar_priority(data, make_strategy, rate_provider, priority):
+    # a bar whose range holds both levels fills the configured side, as which came first is unknown
+    current_strategy = make_strategy(takeProfit=0.0007, stopLoss=0.0004, fillMode='ohlc', intrabarPriority=priority)
+    _, (_, _, _, ledger) = run_both(data, current_strategy, rate_provider)
+    bars = data.set_index('time')
+    closed = ledger[ledger['closed']]
+    stop = (closed['entry_price'] - 0.0004).to_numpy()
+    target = (closed['entry_price'] + 0.0007).to_numpy()
+    exit_bars = bars.loc[closed['exit_time']]
+    both = (exit_bars['low'].to_numpy() <= stop) & (exit_bars['high'].to_numpy() >= target)
+    assert both.any()
+    if priority == 'stop':
+        expected = np.minimum(stop, exit_bars['open'].to_numpy())
+    else:
+        expected = np.maximum(target, exit_bars['open'].to_numpy())
+    np.testing.assert_allclose(closed['exit_price'].to_numpy()[both], expected[both])
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+# ticks are kept as one .npy file per symbol and field so they can be memory mapped - only the pages
+# covering the bars that are looked at are ever read from disk
+
+
+class TickStore:
+    def __init__(self, root):
+        self.root = root
+        self.arrays = dict()
+
+    def file_path(self, symbol, field):
+        return os.path.join(self.root, f'{symbol}.{field}.npy')
+
+    def save(self, symbol, times_msc, bids, asks=None):
+        # times are epoch milliseconds, as in the time_msc field of mt5.copy_ticks_range
+        os.makedirs(self.root, exist_ok=True)
+        order = np.argsort(times_msc, kind='stable')
+        fields = {'time_msc': np.asarray(times_msc, dtype=np.int64)[order], 'bid': np.asarray(bids, dtype=float)[order]}
+        if asks is not None:
+            fields['ask'] = np.asarray(asks, dtype=float)[order]
+        for field, values in fields.items():
+            np.save(self.file_path(symbol, field), values)
+        self.arrays.pop(symbol, None)
+
+    def import_ticks(self, symbol, ticks):
+        # ticks as returned by mt5.copy_ticks_range
+        self.save(symbol, ticks['time_msc'], ticks['bid'], ticks['ask'])
+
+    def has(self, symbol):
+        return os.path.exists(self.file_path(symbol, 'time_msc'))
+
+    def load(self, symbol):
+        if symbol not in self.arrays:
+            self.arrays[symbol] = (
+                np.load(self.file_path(symbol, 'time_msc'), mmap_mode='r'),
+                np.load(self.file_path(symbol, 'bid'), mmap_mode='r'),
+            )
+        return self.arrays[symbol]
+
+    def ticks_between(self, symbol, start_msc, end_msc):
+        # bids with start <= time < end
+        times, bids = self.load(symbol)
+        lo = np.searchsorted(times, start_msc, side='left')
+        hi = np.searchsorted(times, end_msc, side='left')
+        return times[lo:hi], bids[lo:hi]
@@ -1,83 +1,132 @@
 import threading
-import MetaTrader5 as mt5
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import pandas as pd
+import os
 import pytz
-import schedule
 import time
 import strategy
+import bar_cache
+import broker as broker_session
 import constants
+import indicators
+import metrics
+import orders
+import resampler
+import risk
+import scheduler
+import signals
+import snapshot as account_snapshot
 import sys
 import keys
 
 # lock = threading.Lock()
 
-def connect():
-    # lock.acquire()
-    account = keys.demoAccountNum
-    password = keys.demoPassword
-    server = keys.demoServer
+# streaming indicator state per strategy, kept between trading cycles
+indicator_engines = dict()
 
-    # initialize and login to metatrader
-    if not mt5.initialize(login=account, password=password, server=server):
-        print("initialize() failed, error code =",mt5.last_error())
-        quit()
-        
-    authorized=mt5.login(account, password=password, server=server)
+# every read of the time goes through clock, so the loop can be replayed on a virtual one
+clock = time.time
 
-    if authorized:
-        print("connected: connecting to mt5 client")
-    else:
-        print(f'failed to connect to account {account}, error code: {mt5.last_error()}')
+
+def current_seconds():
+    return clock()
+
+
+def current_time():
+    return datetime.fromtimestamp(clock(), timezone.utc)
+
+
+# one session for the life of the bot, every broker call goes through it
+broker = None
+dispatcher = None
+
+# bars that have already closed are kept on disk, so each cycle only downloads the newest ones
+bar_store = bar_cache.BarStore(constants.bar_cache_dir, lambda *args: broker.copy_rates_range(*args), current_seconds, constants.bar_cache_save_interval)
+
+# daily losses, realized profit and drawdown of each strategy by name, kept up to date from its own deals.
+# The Runtime keeps them in state_dir between restarts, anything else trading through this module gets
+# ones kept in memory
+risk_engines = dict()
+
+# magic number of each strategy the Runtime trades, by name. Anything else trading through this module is
+# trading alone
+magic_numbers = dict()
+
+
+def magic_number(current_strategy):
+    name = current_strategy['strategy_name']
+    if name in magic_numbers:
+        return magic_numbers[name]
+    return strategy.magic_number(current_strategy, alone=True)
+
+
+def start_risk_engine(current_strategy, state_dir=None):
+    name = current_strategy['strategy_name']
+    path = os.path.join(state_dir, name + '.json') if state_dir else None
+    risk_engines[name] = risk.RiskEngine(path, current_seconds, magic_number(current_strategy))
+    return risk_engines[name]
+
+
+def risk_engine(current_strategy, state_dir=None):
+    engine = risk_engines.get(current_strategy['strategy_name'])
+    if engine is None or engine.magic != magic_number(current_strategy):
+        engine = start_risk_engine(current_strategy, state_dir)
+    return engine
+
+
+def connect(client=None):
+    # connect once and keep the session alive with a heartbeat - client can be a fake broker for testing
+    global broker, dispatcher
+    if broker is None:
+        broker = broker_session.BrokerSession(keys.demoAccountNum, keys.demoPassword, keys.demoServer, client)
+        dispatcher = orders.OrderDispatcher(broker, constants.order_workers, constants.orders_per_second, constants.order_retries)
+    with metrics.span('connect'):
+        broker.connect()
+    broker.start_heartbeat()
         
 
 def disconnect():
-    mt5.shutdown()
-    # lock.release()
-    print("Disconnecting from MT5 Client")
+    print("Order latency:", dispatcher.latency_stats())
+    bar_store.flush()
+    broker.disconnect()
  
  
-def get_sample_data(pair="EURUSD", time_frame=mt5.TIMEFRAME_H4):
+def get_sample_data(pair="EURUSD", time_frame=16388):
+    # time_frame defaults to mt5.TIMEFRAME_H4
     # define range of data to pull
     utc_from = datetime(2021, 1, 1)
     utc_to = datetime(2021, 1, 10)
     # pull data, choosing timeframe (4 hours per piece), and stock
-    rates = mt5.copy_rates_range(pair, time_frame, utc_from, utc_to)
+    rates = broker.copy_rates_range(pair, time_frame, utc_from, utc_to)
 
     # print the rates of the stock
     for rate in rates:
         print(rate)
     
         
-def open_position(pair, order_type, size, tp_distance=None, stop_distance=None):
+def open_position(pair, order_type, size, tp_distance=None, stop_distance=None, snapshot=None, magic=strategy.base_magic, strategy_name=None):
     # open a position on a pair - check that it exists first
-    symbol_info = mt5.symbol_info(pair)
+    symbol_info = dispatcher.symbol_info(pair)
     if symbol_info is None:
-        print(pair, "not found")
         return
-
-    if not symbol_info.visible:
-        print(pair, "is not visible, trying to switch on")
-        if not mt5.symbol_select(pair, True):
-            print("symbol_select({}}) failed, exit",pair)
-            return
     print(pair, "found!")
     
     # point is the smallest price increment change that can happen on the instrument
     point = symbol_info.point
+    tick = snapshot.tick(pair) if snapshot else broker.symbol_info_tick(pair)
     
     # calculate stop loss and take profit prices (essentially prices to cash out)
     if(order_type == "BUY"):
-        order = mt5.ORDER_TYPE_BUY
-        price = mt5.symbol_info_tick(pair).ask
+        order = broker.ORDER_TYPE_BUY
+        price = tick.ask
         if(stop_distance):
             sl = price - (stop_distance * point)
         if(tp_distance):
             tp = price + (tp_distance * point)
     
     if(order_type == "SELL"):
-        order = mt5.ORDER_TYPE_SELL
-        price = mt5.symbol_info_tick(pair).bid
+        order = broker.ORDER_TYPE_SELL
+        price = tick.bid
         if(stop_distance):
             sl = price + (stop_distance * point)
         if(tp_distance):
@@ -85,33 +134,35 @@ def open_position(pair, order_type, size, tp_distance=None, stop_distance=None):
             
     # build and send request to api to submit order
     request = {
-        "action": mt5.TRADE_ACTION_DEAL,
+        "action": broker.TRADE_ACTION_DEAL,
         "symbol": pair,
         "volume": float(size),
         "type": order,
         "price": price,
         "sl": sl,
         "tp": tp,
-        "magic": 234000,
+        "magic": magic,
         "comment": "My first trade",
-        "type_time": mt5.ORDER_TIME_GTC,
-        "type_filling": mt5.ORDER_FILLING_IOC,
+        "type_time": broker.ORDER_TIME_GTC,
+        "type_filling": broker.ORDER_FILLING_IOC,
     }
     
-    result = mt5.order_send(request)
+    request, result = dispatcher.send(request, strategy_name)
     
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
+    if result is None or result.retcode != broker.TRADE_RETCODE_DONE:
         print("Failed to send order :(")
     else:
         print ("Order successfully placed!")
+        if snapshot:
+            snapshot.apply_fill(request, result)
       
         
 def positions_get(symbol=None):
     # get and return currently open positions
     if(symbol is None):
-        res = mt5.positions_get()
+        res = broker.positions_get()
     else:
-        res = mt5.positions_get(symbol=symbol)
+        res = broker.positions_get(symbol=symbol)
     
     if res is not None and res != ():
         df = pd.DataFrame(list(res), columns=res[0]._asdict().keys())
@@ -121,53 +172,81 @@ def positions_get(symbol=None):
     return pd.DataFrame()
 
 
-def close_position(deal_id):
-    # get the position to close from the list of open positions
-    open_positions = positions_get()
-    open_positions = open_positions[open_positions['ticket'] == deal_id]
-    # extract following parameters after extracting row
-    order_type  = open_positions["type"][0]
-    symbol = open_positions['symbol'][0]
-    volume = open_positions['volume'][0]
+def build_close_request(position, tick):
+    # extract following parameters from the position
+    deal_id = position['ticket']
+    order_type  = position["type"]
+    symbol = position['symbol']
+    volume = position['volume']
     # sell or buy depending on whether it is a buy or sell position
-    if(order_type == mt5.ORDER_TYPE_BUY):
-        order_type = mt5.ORDER_TYPE_SELL
-        price = mt5.symbol_info_tick(symbol).bid
+    if(order_type == broker.ORDER_TYPE_BUY):
+        order_type = broker.ORDER_TYPE_SELL
+        price = tick.bid
     else:
-        order_type = mt5.ORDER_TYPE_BUY
-        price = mt5.symbol_info_tick(symbol).ask
+        order_type = broker.ORDER_TYPE_BUY
+        price = tick.ask
 
     # build and send request to mt5 api
     close_request={
-        "action": mt5.TRADE_ACTION_DEAL,
+        "action": broker.TRADE_ACTION_DEAL,
         "symbol": symbol,
         "volume": float(volume),
         "type": order_type,
         "position": deal_id,
         "price": price,
-        "magic": 234000,
+        "magic": position.get('magic', strategy.base_magic),
         "comment": "Close trade",
-        "type_time": mt5.ORDER_TIME_GTC,
-        "type_filling": mt5.ORDER_FILLING_IOC,
+        "type_time": broker.ORDER_TIME_GTC,
+        "type_filling": broker.ORDER_FILLING_IOC,
     }
-    result = mt5.order_send(close_request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print("Failed to close order :(")
+    return close_request
+
+
+def close_positions(positions, snapshot=None, strategy_name=None):
+    # send every close at once, so closing many positions takes about one round trip
+    ticks = dict()
+    requests = []
+    for position in positions:
+        symbol = position['symbol']
+        if symbol not in ticks:
+            ticks[symbol] = snapshot.tick(symbol) if snapshot else broker.symbol_info_tick(symbol)
+        requests.append(build_close_request(position, ticks[symbol]))
+
+    for close_request, result in dispatcher.send_batch(requests, strategy_name):
+        if result is None or result.retcode != broker.TRADE_RETCODE_DONE:
+            print("Failed to close order :(")
+        else:
+            print ("Order successfully closed!")
+            if snapshot:
+                snapshot.apply_fill(close_request, result)
+
+
+def close_position(deal_id, snapshot=None):
+    # get the position to close from the cycle's snapshot, or ask the broker for that ticket alone
+    if snapshot:
+        position = snapshot.position(deal_id)
     else:
-        print ("Order successfully closed!")
+        res = broker.positions_get(ticket=deal_id)
+        position = res[0]._asdict() if res else None
+    if position is None:
+        print("Position", deal_id, "not found")
+        return
+    close_positions([position], snapshot)
 
 
-def close_position_by_symbol(symbol):
-    # close positions on a certain stock
-    open_positions = positions_get(symbol)
-    if not open_positions.empty:
-        open_positions['ticket'].apply(lambda x: close_position(x))
+def close_position_by_symbol(symbol, snapshot=None, magic=None, strategy_name=None):
+    # close positions on a certain stock, only those opened with magic when it is given
+    if snapshot:
+        positions = snapshot.positions_for(symbol, magic)
+    else:
+        positions = [p._asdict() for p in broker.positions_get(symbol=symbol) or () if magic is None or p.magic == magic]
+    close_positions(positions, snapshot, strategy_name)
     
     
-def calc_position_size(symbol, strategy):
+def calc_position_size(symbol, strategy, snapshot=None):
     # calculate lot size based on percentage risk of funds
     print("Calculating position size for: ", symbol)
-    account = mt5.account_info()
+    account = snapshot.account if snapshot else broker.account_info()
     balance = float(account.balance)
     pip_value = constants.get_pip_value(symbol, strategy['account_currency'])
     lot_size = (float(balance) * (float(strategy["risk"])/100)) / (pip_value * strategy["stopLoss"])
@@ -175,138 +254,275 @@ def calc_position_size(symbol, strategy):
     return lot_size
     
     
-def get_order_history(date_from, date_to):
-    res = mt5.history_deals_get(date_from, date_to)
-    
-    if(res is not None and res != ()):
-        df = pd.DataFrame(list(res),columns=res[0]._asdict().keys())
-        df['time'] = pd.to_datetime(df['time'], unit='s')
-        return df
-    
-    return pd.DataFrame()
-
-
-def calc_daily_lost_trades():
-    now = datetime.now().astimezone(pytz.timezone('GMT'))
-    now = datetime(now.year, now.month, now.day, hour=now.hour, minute=now.minute)
-    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    res = get_order_history(midnight, now)
+def check_max_drawdown(current_strategy, snapshot=None):
+    # the strategy's deals and positions are only asked for when there is no snapshot of this cycle to read them from
+    engine = risk_engine(current_strategy)
+    magic = magic_number(current_strategy)
+    with metrics.span('risk', current_strategy['strategy_name']):
+        if snapshot:
+            positions = snapshot.positions_for(magic=magic)
+        else:
+            engine.refresh(broker)
+            positions = [p._asdict() for p in broker.positions_get() or () if p.magic == magic]
+        engine.update_equity(current_strategy['initialBalance'], positions)
+        breached = engine.drawdown_breached(current_strategy)
 
-    if(res.empty):
-        return 0
-    else:
-        lost_trade_count = 0
-        for i, row in res.iterrows():
-            profit = float(row['profit'])
-            if(profit < 0):
-                lost_trade_count += 1
-        return lost_trade_count   
-    
-    
-def check_max_drawdown(strategy):
-    print("Checking maximum drawdown...")
-    inital_balance = strategy['initialBalance']
-    max_drawdown = strategy['maximumDrawdown']
-    account_info = mt5.account_info()
-    current_balance = account_info['balance']   
-    
-    # close all positions if max drawdown has been reached
-    if(current_balance < (inital_balance * max_drawdown)):
-        print("Maximum drawdown has been reached! Trading halted.")
-        open_positions = positions_get()
-        for index, position in open_positions.iterrows():
-            deal_id = position['ticket']
-            close_position(deal_id)
-        exit()    
+    # close the strategy's positions if its max drawdown has been reached - returns whether it has to stop
+    if not breached:
+        return False
+    print("Maximum drawdown of", current_strategy['strategy_name'], "has been reached! Trading halted.")
+    close_positions(positions, snapshot, current_strategy['strategy_name'])
+    engine.save()
+    return True
     
     
 def check_trades(time_frame, pair_data, strategy):
+    strategy_risk = risk_engine(strategy)
     # allocate strategy dynamically
+    engine_key = (strategy['strategy_name'], time_frame)
+    if engine_key not in indicator_engines:
+        indicator_engines[engine_key] = indicators.IndicatorEngine(signals.compile_strategy(strategy).indicators)
+    engine = indicator_engines[engine_key]
+
+    # update the averages specified in the strategy with the bars closed since the last cycle
+    pair_values = dict()
     for pair, data in pair_data.items():
+        with metrics.span('indicators', strategy['strategy_name'], pair):
+            pair_values[pair] = engine.update(pair, data)
+
+    # positions, today's deals, ticks and the account are fetched once for the whole cycle
+    with metrics.span('snapshot', strategy['strategy_name']):
+        snapshot = account_snapshot.AccountSnapshot(broker, list(pair_data), risks=[strategy_risk])
+    if check_max_drawdown(strategy, snapshot):
+        return
+    trade_strategy(pair_data, pair_values, strategy, snapshot)
+    strategy_risk.save()
+
+
+def trade_strategy(pair_data, pair_values, current_strategy, snapshot):
+    # the decisions of one strategy, given its bars and moving averages for this cycle - only the positions
+    # and deals with its magic number are its own
+    # close any deal that has been open for longer than the strategy's max time
+    strategy_name = current_strategy['strategy_name']
+    magic = magic_number(current_strategy)
+    engine = risk_engine(current_strategy)
+    current_dt = current_time().astimezone(pytz.timezone('GMT'))
+    expired = []
+    for position in snapshot.positions_for(magic=magic):
+        trade_open_dt = datetime.fromtimestamp(position['time'], pytz.timezone('GMT'))
+        if(current_dt - trade_open_dt >= timedelta(hours = current_strategy['maxTime'])):
+            expired.append(position)
+    with metrics.span('expiry', strategy_name):
+        close_positions(expired, snapshot, strategy_name)
+
+    compiled = signals.compile_strategy(current_strategy)
+    for pair, data in pair_data.items():
+        # no closed bars yet, e.g. right after a reload added a timeframe that is still being downloaded
+        if data.empty:
+            continue
+        ma_values = pair_values[pair]
         
-        # calculate the averages specified in the strategy, and add them to the data
-        moving_averages = strategy['movingAverages']
-        for m in moving_averages: 
-            ma_func = constants.movingAveragesFunctions[m]
-            val = moving_averages[m]['val']
-            data[m] = ma_func(data['close'], val)
-        
-        # close any deal that has been open for longer than 2 hours
-        open_positions = positions_get()
-        current_dt = datetime.now().astimezone(pytz.timezone('GMT'))
-        for index, position in open_positions.iterrows():
-            trade_open_dt = position['time'].replace(tzinfo = pytz.timezone('GMT'))
-            deal_id = position['ticket']
-            if(current_dt - trade_open_dt >= timedelta(hours = strategy['maxTime'])):
-                close_position(deal_id)
-        
-        # actual execution of strategy - currently only works on ema and sma values
-        last_row = data.tail(1).iloc[0] # get the most recent data point/ tick
+        # actual execution of strategy - the compiled rules on the most recent bar, the same the backtester uses
+        with metrics.span('signals', strategy_name, pair):
+            last_row = data.tail(1).iloc[0] # get the most recent data point/ tick
+            entry_signal, exit_signal = compiled.latest(last_row, ma_values)
         
-        # exit strategy - exit if value is below EMA and above SMA - indication of bearish
-        if(last_row['close'] < last_row['EMA'] and last_row['close'] > last_row['SMA']):
-            close_position_by_symbol(pair)
+        # exit strategy - with the default rules, exit if value is below EMA and above SMA - indication of bearish
+        if exit_signal:
+            close_position_by_symbol(pair, snapshot, magic, strategy_name)
             
         # exit if daily losses exceeds strategy
-        lost_trade_count = calc_daily_lost_trades()
-        if(lost_trade_count > strategy['maxLosses']):
+        with metrics.span('risk', strategy_name, pair):
+            losses_exceeded = engine.losses_exceeded(current_strategy)
+        if losses_exceeded:
             print("Daily losses have been exceeded. Not executing any more trades today")
             continue
-        # entry strategy - enter if value is above EMA and below SMA - indication of it about to go up
-        if(last_row['close'] > last_row['EMA'] and last_row['close'] < last_row['SMA']):
-            lot_size = calc_position_size(pair, strategy)
-            open_position(pair, "BUY", lot_size, float(strategy['takeProfit']), float(strategy['stopLoss']))
+        # entry strategy - with the default rules, enter if value is above EMA and below SMA - indication of it about to go up
+        if entry_signal:
+            lot_size = calc_position_size(pair, current_strategy, snapshot)
+            open_position(pair, "BUY", lot_size, float(current_strategy['takeProfit']), float(current_strategy['stopLoss']), snapshot, magic, strategy_name)
         
 
 def get_data(time_frame, strategy, max_data_points):
     # get the data on the pairs within a certain given time
     pairs = strategy['pairs']
+    strategy_name = strategy.get('strategy_name')
     pair_data = dict()
     for pair in pairs:
         # for each pair get the data from the 1st jan 2024 till now in tick steps of time_frame length
         # we use the max_data_points as calculated from the max number of points required for the averages as defined in the strategy
-        utc_from = datetime.now() - timedelta(minutes=max_data_points * time_frame)
+        utc_from = current_time() - timedelta(seconds=max_data_points * bar_cache.timeframe_seconds(time_frame))
         utc_from = utc_from.astimezone(pytz.timezone('GMT'))
         
-        date_to = datetime.now().astimezone(pytz.timezone('GMT'))
+        date_to = current_time().astimezone(pytz.timezone('GMT'))
         date_to = datetime(date_to.year, date_to.month, date_to.day, hour=date_to.hour, minute=date_to.minute)
         
-        rates = mt5.copy_rates_range(pair, time_frame, utc_from, date_to)
-        
-        rates_frame = pd.DataFrame(rates)
-        rates_frame['time'] = pd.to_datetime(rates_frame['time'], unit='s')
-        rates_frame.drop(rates_frame.tail(1).index, inplace = True) # drop latest one as to not get like half a tick's worth of data
+        with metrics.span('fetch', strategy_name, pair):
+            rates = bar_store.copy_rates_range(pair, time_frame, utc_from, date_to)
+            
+            rates_frame = pd.DataFrame(rates)
+            rates_frame['time'] = pd.to_datetime(rates_frame['time'], unit='s')
+            rates_frame.drop(rates_frame.tail(1).index, inplace = True) # drop latest one as to not get like half a tick's worth of data
         pair_data[pair] = rates_frame
     return pair_data
 
 
-def run_trader(time_frame, strategy, max_data_points):
-    print("Running trader at", datetime.now())
-    connect()
-    pair_data = get_data(time_frame, strategy, max_data_points) # will return a dict of stockname:[all ticks from tick{now-max_data_points} till now]
-    check_trades(time_frame, pair_data, strategy)
-    disconnect()
+def get_resampled_data(time_frame, pairs, max_data_points, bar_resampler, strategy_name=None):
+    # bars of time_frame derived from each pair's base series - after the first cycle only the base bars
+    # since the last one seen are downloaded, however many timeframes are traded. strategy_name labels the spans
+    now = int(clock())
+    base_seconds = bar_cache.timeframe_seconds(bar_resampler.base_time_frame)
+    pair_data = dict()
+    for pair in pairs:
+        with metrics.span('fetch', strategy_name, pair):
+            last_time = bar_resampler.last_time(pair)
+            utc_from = now - bar_resampler.lookback_seconds() if last_time is None else last_time + base_seconds
+            rates = bar_store.copy_rates_range(pair, bar_resampler.base_time_frame, utc_from, now)
+            # only closed base bars go in, a derived bar completes once the base bar of its last moment has closed
+            bar_resampler.update(pair, rates[rates['time'] + base_seconds <= now])
+            pair_data[pair] = bar_resampler.frame(pair, time_frame, max_data_points)
+    return pair_data
+
+
+def strategy_data_points(strategy):
+    return max([ma['val'] for ma in strategy['movingAverages'].values()]) + 5
+
+
+def group_label(group):
+    return '+'.join(current_strategy['strategy_name'] for current_strategy in group)
+
+
+class Runtime:
+    # runs many strategies in one process - each timeframe wakes at its bar close, downloads every pair once
+    # and updates each distinct average once, then each strategy only runs its own decisions
+    def __init__(self, strategies, clock=current_seconds, wait=None, settle=1, risk_state_dir=constants.risk_state_dir):
+        self.scheduler = scheduler.Scheduler(clock, wait)
+        self.settle = settle
+        self.risk_state_dir = risk_state_dir
+        self.scheduled = set()
+        # names of the strategies stopped by their max drawdown, the others keep trading
+        self.halted = []
+        self.resampler = None
+        # decided once, a strategy left alone by the others halting keeps the magic number it has traded with
+        self.alone = len(strategies) == 1
+        self.setup(strategies)
+
+    def setup(self, strategies):
+        strategy.check_magic_numbers(strategies, self.alone)
+        self.strategies = strategies
+        magic_numbers.clear()
+        magic_numbers.update({
+            current_strategy['strategy_name']: strategy.magic_number(current_strategy, self.alone)
+            for current_strategy in strategies
+        })
+        self.groups = dict()
+        for current_strategy in strategies:
+            time_frame = current_strategy.get('timeFrame', constants.default_time_frame)
+            self.groups.setdefault(time_frame, []).append(current_strategy)
+
+        # one engine per timeframe holding the union of every strategy's averages
+        self.engines = dict()
+        for time_frame, group in self.groups.items():
+            shared = dict()
+            for current_strategy in group:
+                shared.update(signals.compile_strategy(current_strategy).indicators)
+            self.engines[time_frame] = indicators.IndicatorEngine(shared)
+
+        # every timeframe derived from one base series per pair, unless each is downloaded on its own. The
+        # buffers are kept across a reload, they only grow
+        capacities = {
+            time_frame: max(strategy_data_points(current_strategy) for current_strategy in group)
+            for time_frame, group in self.groups.items()
+        }
+        if constants.base_time_frame and self.resampler is None:
+            self.resampler = resampler.Resampler(constants.base_time_frame, capacities)
+        elif self.resampler:
+            for time_frame, capacity in capacities.items():
+                self.resampler.add_time_frame(time_frame, capacity)
+
+    def reload(self):
+        # strategy files edited while running are picked up at the next cycle, the engines of the new set
+        # are seeded again from the downloaded bars
+        strategies = [strategy.refresh(current_strategy) for current_strategy in self.strategies]
+        if all(new is old for new, old in zip(strategies, self.strategies)):
+            return
+        try:
+            strategy.check_magic_numbers(strategies, self.alone)
+        except strategy.StrategyError as e:
+            print("Could not reload strategies:", e)
+            return
+        print("Reloaded strategies:", ', '.join(new['strategy_name'] for new, old in zip(strategies, self.strategies) if new is not old))
+        self.setup(strategies)
+        self.schedule()
+
+    def schedule(self):
+        for time_frame in self.groups:
+            if time_frame not in self.scheduled:
+                self.scheduled.add(time_frame)
+                self.scheduler.every(bar_cache.timeframe_seconds(time_frame), self.run_cycle, time_frame, offset=self.settle)
+
+    def run_cycle(self, time_frame):
+        print("Running trader at", datetime.fromtimestamp(clock()))
+        self.reload()
+        # a reloaded strategy may have moved to another timeframe
+        group = self.groups.get(time_frame)
+        if not group:
+            return
+        with metrics.cycle(group_label(group)):
+            self.trade_group(time_frame, group)
+
+    def trade_group(self, time_frame, group):
+        # the data shared by the group is labelled with every strategy in it, as its cycle is
+        label = group_label(group)
+        engines = [risk_engine(current_strategy, self.risk_state_dir) for current_strategy in group]
+        pairs = sorted({pair for current_strategy in group for pair in current_strategy['pairs']})
+        max_data_points = max(strategy_data_points(current_strategy) for current_strategy in group)
+
+        if self.resampler:
+            pair_data = get_resampled_data(time_frame, pairs, max_data_points, self.resampler, label)
+        else:
+            pair_data = get_data(time_frame, {'pairs': pairs, 'strategy_name': label}, max_data_points)
+        shared_values = dict()
+        for pair, data in pair_data.items():
+            with metrics.span('indicators', label, pair):
+                shared_values[pair] = self.engines[time_frame].update(pair, data)
+        with metrics.span('snapshot', label):
+            snapshot = account_snapshot.AccountSnapshot(broker, pairs, risks=engines)
+
+        halted = []
+        for current_strategy in group:
+            strategy_data = {pair: pair_data[pair] for pair in current_strategy['pairs']}
+            compiled = signals.compile_strategy(current_strategy)
+            pair_values = {pair: {key: shared_values[pair][key] for key in compiled.indicators} for pair in current_strategy['pairs']}
+            if check_max_drawdown(current_strategy, snapshot):
+                halted.append(current_strategy)
+                continue
+            trade_strategy(strategy_data, pair_values, current_strategy, snapshot)
+        for engine in engines:
+            engine.save()
+
+        # a halted strategy leaves its group, the rest of the process carries on
+        if halted:
+            self.halted.extend(current_strategy['strategy_name'] for current_strategy in halted)
+            self.setup([current_strategy for current_strategy in self.strategies if current_strategy not in halted])
+            if not self.strategies:
+                print("Every strategy has been halted")
+                self.scheduler.stop()
+
+    def run(self):
+        if constants.metrics_enabled:
+            metrics.enable(constants.metrics_path, profile_slowest=constants.metrics_profile_slowest, sample_interval=constants.metrics_sample_interval)
+        connect()
+        self.schedule()
+        self.scheduler.run()
 
 
 def live_trading(strategy):
-    max_data_points = max([ma['val'] for ma in strategy['movingAverages'].values()]) + 5
-    
-    # execute algorithm every 15 mins
-    schedule.every().hour.at(":00").do(run_trader, mt5.TIMEFRAME_M15, strategy, max_data_points)
-    schedule.every().hour.at(":15").do(run_trader, mt5.TIMEFRAME_M15, strategy, max_data_points)
-    schedule.every().hour.at(":30").do(run_trader, mt5.TIMEFRAME_M15, strategy, max_data_points)
-    schedule.every().hour.at(":45").do(run_trader, mt5.TIMEFRAME_M15, strategy, max_data_points)
-    schedule.every(15).minutes.do(check_max_drawdown, strategy)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    Runtime([strategy]).run()
 
 if __name__ == '__main__':
+    strategies = []
     for arg in sys.argv[1:]:
-        current_strategy = arg
-        print("Trading bot started with strategy:", current_strategy)
-        current_strategy = strategy.load_strategy(current_strategy)
-        live_trading(current_strategy)
-        # trading = threading.Thread(target=live_trading, args=(current_strategy,))
-        # trading.start()
+        print("Trading bot started with strategy:", arg)
+        strategies.append(strategy.load_strategy(arg))
+    Runtime(strategies).run()